@@ -0,0 +1,96 @@
+"""Microbenchmark del registro de patrones de mapear_campos.
+
+Replica, por cada línea de cada página, las comprobaciones que hacen los bucles de
+`extraer_partidas_por_posicion` y `recover_description_from_pdf`, primero con la
+llamada literal `re.search(patron, texto, flags)` (como antes del registro) y luego
+con los patrones precompilados. Las palabras se toman de la caché de páginas si
+existe, así que el tiempo medido es solo el de las expresiones regulares.
+
+Uso: python scripts/bench_regex.py [carpeta] [max_pdfs]
+"""
+import glob
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from src import cache_paginas  # noqa: E402
+from src import mapear_campos as mc  # noqa: E402
+
+# (patrón, operación) aplicados a cada línea candidata en los bucles calientes
+CHECKS = [
+    (mc.IGI_INCRUSTADO_RE, 'search'),
+    (mc.IVA_INCRUSTADO_RE, 'search'),
+    (mc.META_DESCRIPCION_RE, 'search'),
+    (mc.NO_DESCRIPCION_RE, 'search'),
+    (mc.NO_DESCRIPCION_RECUPERACION_RE, 'search'),
+    (mc.LINEA_IMPUESTO_RE, 'search'),
+    (mc.PALABRA_ALFA_RE, 'findall'),
+    (mc.PALABRA_RE, 'findall'),
+    (mc.BASE64_RE, 'search'),
+    (mc.CODIGOS_INICIALES_RE, 'sub'),
+]
+
+
+def lineas_por_pagina(pdfs, cache):
+    paginas = []
+    for pdf_path in pdfs:
+        with mc.PedimentoDocument(pdf_path, cache=cache) as doc:
+            for i in range(doc.num_paginas):
+                tabla = doc.palabras_pagina(i)
+                lineas = {}
+                for texto, x0, top in zip(tabla.texto, tabla.x0.tolist(), tabla.top.tolist()):
+                    lineas.setdefault(round(top), []).append((x0, texto))
+                paginas.append([' '.join(t for _, t in sorted(ws, key=lambda x: x[0])) for ws in lineas.values()])
+    return paginas
+
+
+def literal(paginas):
+    for lineas in paginas:
+        for txt in lineas:
+            for pat, op in CHECKS:
+                if op == 'sub':
+                    re.sub(pat.pattern, '', txt, flags=pat.flags)
+                else:
+                    getattr(re, op)(pat.pattern, txt, pat.flags)
+
+
+def registro(paginas):
+    for lineas in paginas:
+        for txt in lineas:
+            for pat, op in CHECKS:
+                if op == 'sub':
+                    pat.sub('', txt)
+                else:
+                    getattr(pat, op)(txt)
+
+
+def medir(fn, paginas, repeticiones=5):
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        fn(paginas)
+        mejor = min(mejor, time.perf_counter() - t0)
+    return mejor
+
+
+def main():
+    carpeta = sys.argv[1] if len(sys.argv) > 1 else os.path.join(ROOT, 'PEDIMENTOS 2025', 'PEDIMENTOS_VALIDOS')
+    max_pdfs = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    pdfs = sorted(glob.glob(os.path.join(carpeta, '*.pdf')))[:max_pdfs]
+    cache = cache_paginas.CachePaginas(os.path.join(ROOT, 'salida', '.cache'))
+    paginas = lineas_por_pagina(pdfs, cache)
+    n = len(paginas)
+    t_lit = medir(literal, paginas)
+    t_reg = medir(registro, paginas)
+    print(f"PDFs: {len(pdfs)}  páginas: {n}  líneas: {sum(len(p) for p in paginas)}")
+    print(f"re.<op>(literal): {t_lit / n * 1e6:9.1f} us/página")
+    print(f"registro:         {t_reg / n * 1e6:9.1f} us/página")
+    print(f"speedup:          {t_lit / t_reg:9.2f}x")
+
+
+if __name__ == '__main__':
+    main()
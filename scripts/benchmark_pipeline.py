@@ -0,0 +1,237 @@
+"""Benchmark del pipeline de mapear_campos sobre un corpus fijo de PDFs.
+
+Mide por archivo cada etapa por separado, sobre el mismo documento:
+  extraccion   abrir y cerrar el PDF y todo el trabajo de pdfplumber (texto, palabras y
+               liberación de cada página). Las páginas se extraen bajo demanda dentro
+               de las etapas siguientes, solo las que necesitan; ese tiempo se descuenta
+               de la etapa que lo provocó y se suma aquí
+  clasificacion clasificador de primera página (los no-pedimentos terminan aquí)
+  cabecera     extraer_cabecera_pedimento(texto)
+  proveedor    extraer_datos_proveedor_por_posicion(doc)
+  partidas     extraer_partidas_por_posicion(doc)
+  filas        _extraer_filas_documento(doc) (las tres anteriores + respaldo por texto)
+  postproceso  recuperación de IDs truncados y de descripciones
+Así cada etapa de heurísticas mide solo sus heurísticas. La latencia por archivo es
+extraccion + clasificacion + filas + postproceso, es decir, lo que hace
+_procesar_archivo (cabecera, proveedor y partidas se repiten dentro de filas). Se
+informan archivos/s, páginas/s, p50/p95 por archivo y por etapa, y el pico de RSS,
+y se guarda todo en JSON.
+
+Con --baseline compara el tiempo total de cada etapa contra un JSON previo y
+termina con código 1 si alguna supera `baseline * (1 + presupuesto)`.
+
+Uso:
+  python scripts/benchmark_pipeline.py [--carpeta DIR] [--max-pdfs N] [--salida JSON]
+         [--baseline JSON] [--presupuesto 0.25] [--presupuesto-etapa partidas=0.5]
+         [--cache-dir DIR]
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from src import cache_paginas  # noqa: E402
+from src import clasificador  # noqa: E402
+from src import mapear_campos as mc  # noqa: E402
+
+ETAPAS = ['extraccion', 'clasificacion', 'cabecera', 'proveedor', 'partidas', 'filas', 'postproceso']
+ETAPAS_ARCHIVO = ['extraccion', 'clasificacion', 'filas', 'postproceso']
+
+
+def pico_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa KiB, macOS bytes
+    return round(maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    orden = sorted(valores)
+    k = (len(orden) - 1) * p / 100
+    i = int(k)
+    j = min(i + 1, len(orden) - 1)
+    return orden[i] + (orden[j] - orden[i]) * (k - i)
+
+
+# métodos de PedimentoDocument que ejecutan pdfplumber; se cronometran en cada documento
+METODOS_PDFPLUMBER = ('_extraer_texto', '_extraer_palabras', '_liberar_pagina')
+
+
+def medir_archivo(pdf_path, cache=None):
+    """Devuelve ({etapa: segundos}, páginas) de un PDF."""
+    tiempos = {}
+    en_pdfplumber = [0.0]
+
+    def medir(etapa, fn):
+        antes = en_pdfplumber[0]
+        t0 = time.perf_counter()
+        r = fn()
+        transcurrido = time.perf_counter() - t0
+        # la extracción perezosa que provocó la etapa se atribuye a `extraccion`
+        extraido = en_pdfplumber[0] - antes
+        if etapa != 'extraccion':
+            transcurrido -= extraido
+            tiempos['extraccion'] = tiempos.get('extraccion', 0.0) + extraido
+        tiempos[etapa] = tiempos.get(etapa, 0.0) + transcurrido
+        return r
+
+    def cronometrar(metodo):
+        def envuelto(*args):
+            t0 = time.perf_counter()
+            try:
+                return metodo(*args)
+            finally:
+                en_pdfplumber[0] += time.perf_counter() - t0
+        return envuelto
+
+    doc = medir('extraccion', lambda: mc.PedimentoDocument(pdf_path, cache=cache))
+    for nombre in METODOS_PDFPLUMBER:
+        setattr(doc, nombre, cronometrar(getattr(doc, nombre)))
+    try:
+        clase = medir('clasificacion', lambda: clasificador.clasificar(doc))
+        if clase.tipo != clasificador.PEDIMENTO:
+            medir('extraccion', lambda: doc.close(guardar=False))
+            return tiempos, doc.num_paginas
+        medir('cabecera', lambda: mc.extraer_cabecera_pedimento(doc.iterar_textos()))
+        medir('proveedor', lambda: mc.extraer_datos_proveedor_por_posicion(doc))
+        medir('partidas', lambda: mc.extraer_partidas_por_posicion(doc))
+        # los índices de palabras que construyeron proveedor/partidas se descartan para
+        # que filas pague lo mismo que en _procesar_archivo
+        doc._indices.clear()
+        filas = medir('filas', lambda: mc._extraer_filas_documento(doc))
+
+        def postproceso():
+            if filas:
+                mc._recuperar_ids_truncados(filas, doc)
+                mc._normalizar_descripciones(filas, doc)
+
+        medir('postproceso', postproceso)
+        # al cerrar se escribe la entrada de la caché, como en _procesar_archivo
+        medir('extraccion', doc.close)
+    finally:
+        doc.close(guardar=False)
+    return tiempos, doc.num_paginas
+
+
+def resumir(por_archivo, paginas):
+    latencias = [sum(t.get(e, 0.0) for e in ETAPAS_ARCHIVO) for t in por_archivo.values()]
+    total = sum(latencias)
+    etapas = {}
+    for etapa in ETAPAS:
+        valores = [t[etapa] for t in por_archivo.values() if etapa in t]
+        etapas[etapa] = {
+            'archivos': len(valores),
+            'total_s': round(sum(valores), 4),
+            'p50_ms': round(percentil(valores, 50) * 1000, 2),
+            'p95_ms': round(percentil(valores, 95) * 1000, 2),
+        }
+    return {
+        'archivos': len(por_archivo),
+        'paginas': paginas,
+        'total_s': round(total, 3),
+        'archivos_por_s': round(len(por_archivo) / total, 2) if total else 0.0,
+        'paginas_por_s': round(paginas / total, 2) if total else 0.0,
+        'p50_ms': round(percentil(latencias, 50) * 1000, 2),
+        'p95_ms': round(percentil(latencias, 95) * 1000, 2),
+        'pico_rss_mb': pico_rss_mb(),
+        'etapas': etapas,
+    }
+
+
+def comparar(actual, baseline, presupuesto, por_etapa=None):
+    """Lista de regresiones (texto) de las etapas que exceden su presupuesto relativo."""
+    por_etapa = por_etapa or {}
+    regresiones = []
+    for etapa, datos in actual['etapas'].items():
+        previo = baseline.get('etapas', {}).get(etapa)
+        if not previo or not previo.get('total_s'):
+            continue
+        limite = previo['total_s'] * (1 + por_etapa.get(etapa, presupuesto))
+        if datos['total_s'] > limite:
+            regresiones.append(f"{etapa}: {datos['total_s']:.3f}s > {limite:.3f}s (baseline {previo['total_s']:.3f}s)")
+    return regresiones
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark por etapas del pipeline de pedimentos.")
+    parser.add_argument('--carpeta', default=os.path.join(ROOT, 'PEDIMENTOS 2025', 'PEDIMENTOS_VALIDOS'))
+    parser.add_argument('--max-pdfs', type=int, default=0, help="limitar el corpus a los N primeros (0 = todos)")
+    parser.add_argument('--salida', default=os.path.join(ROOT, 'salida', 'benchmark.json'))
+    parser.add_argument('--baseline', help="JSON de una ejecución anterior contra el que comparar")
+    parser.add_argument('--presupuesto', type=float, default=0.25, help="regresión relativa tolerada por etapa")
+    parser.add_argument('--presupuesto-etapa', action='append', default=[], metavar='ETAPA=FRACCION',
+                        help="presupuesto específico de una etapa (repetible)")
+    parser.add_argument('--cache-dir', help="usar la caché de páginas (mide solo las heurísticas)")
+    args = parser.parse_args(argv)
+
+    por_etapa = {}
+    for item in args.presupuesto_etapa:
+        etapa, _, valor = item.partition('=')
+        por_etapa[etapa] = float(valor)
+
+    # corpus fijo: orden alfabético para que las ejecuciones sean comparables
+    pdfs = sorted(f for f in glob.glob(os.path.join(args.carpeta, '*')) if f.lower().endswith('.pdf'))
+    if args.max_pdfs:
+        pdfs = pdfs[:args.max_pdfs]
+    cache = cache_paginas.CachePaginas(args.cache_dir) if args.cache_dir else None
+
+    por_archivo = {}
+    paginas = 0
+    errores = {}
+    for pdf_path in pdfs:
+        nombre = os.path.basename(pdf_path)
+        try:
+            tiempos, n = medir_archivo(pdf_path, cache)
+        except Exception as e:
+            errores[nombre] = f"{type(e).__name__}: {e}"
+            continue
+        por_archivo[nombre] = tiempos
+        paginas += n
+
+    resumen = resumir(por_archivo, paginas)
+    resultado = {
+        'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'carpeta': args.carpeta,
+        'cache': bool(cache),
+        **resumen,
+        'errores': errores,
+        'por_archivo': {k: {e: round(v, 5) for e, v in t.items()} for k, t in por_archivo.items()},
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.salida)), exist_ok=True)
+    with open(args.salida, 'w', encoding='utf-8') as fh:
+        json.dump(resultado, fh, ensure_ascii=False, indent=1)
+
+    print(f"Archivos: {resumen['archivos']}  páginas: {paginas}  total: {resumen['total_s']:.2f}s")
+    print(f"{resumen['archivos_por_s']:.2f} archivos/s  {resumen['paginas_por_s']:.2f} páginas/s  "
+          f"p50 {resumen['p50_ms']:.1f} ms  p95 {resumen['p95_ms']:.1f} ms  pico RSS {resumen['pico_rss_mb']} MB")
+    for etapa, datos in resumen['etapas'].items():
+        print(f"  {etapa:<14} {datos['total_s']:9.3f}s  p50 {datos['p50_ms']:8.2f} ms  p95 {datos['p95_ms']:8.2f} ms")
+    print(f"Resultados: {args.salida}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as fh:
+            baseline = json.load(fh)
+        regresiones = comparar(resumen, baseline, args.presupuesto, por_etapa)
+        if regresiones:
+            print("REGRESIÓN respecto a la baseline:")
+            for r in regresiones:
+                print(f"  {r}")
+            return 1
+        print("Sin regresiones respecto a la baseline.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
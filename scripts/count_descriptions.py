@@ -1,4 +1,23 @@
+import os
+import sys
 import pandas as pd
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src import almacen_sqlite  # noqa: E402
+
+SQLITE = 'salida/pedimentos.sqlite'
+if os.path.exists(SQLITE):
+    # solo las filas de cada fracción, por índice
+    with almacen_sqlite.AlmacenSQLite(SQLITE) as almacen:
+        print('Total rows:', almacen.contar())
+        for fr in ['90192001','90189099']:
+            sub = almacen.filas(fraccion=fr)
+            empty = [f for f in sub if not f['DESCRIPCION'].strip()]
+            print(fr + ' total:', len(sub), 'empty DESCRIPCION:', len(empty))
+        empty = pd.DataFrame([f for f in almacen.filas(fraccion='90192001') if not f['DESCRIPCION'].strip()],
+                             columns=almacen_sqlite.COLUMNAS)
+        print('\nSample rows with empty DESCRIPCION (first 5):')
+        print(empty[['NUM_PEDIMENTO','SEC','FRACCION','DESCRIPCION','Archivo']].head(5).to_string(index=False))
+    raise SystemExit(0)
 
 df = pd.read_csv('salida/pedimentos_completo.csv', dtype=str)
 print('Total rows:', len(df))
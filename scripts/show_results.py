@@ -1,7 +1,26 @@
 import pandas as pd
 import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src import almacen_sqlite  # noqa: E402
 pd.set_option('display.max_colwidth',200)
 CSV='salida/pedimentos_completo.csv'
+SQLITE='salida/pedimentos.sqlite'
+display_cols = ['NUM_PEDIMENTO','SEC','FRACCION','DESCRIPCION','TASA_IGI','Archivo']
+if os.path.exists(SQLITE):
+    # consultas por índice en la base SQLite, sin leer el CSV completo
+    with almacen_sqlite.AlmacenSQLite(SQLITE) as almacen:
+        print('Total rows:', almacen.contar())
+        for frac in ['90191099','90192001']:
+            sel = pd.DataFrame(almacen.filas(fraccion=frac), columns=almacen_sqlite.COLUMNAS)
+            print('\nFRACCION', frac, 'matches:', len(sel))
+            if not sel.empty:
+                print(sel[display_cols].head(10).to_string(index=False))
+        sel2 = pd.DataFrame(almacen.filas(fraccion_prefijo='9019'), columns=almacen_sqlite.COLUMNAS)
+        print('\nSample 9019... count:', len(sel2))
+        if len(sel2):
+            print(sel2[display_cols].head(20).to_string(index=False))
+    raise SystemExit(0)
 if not os.path.exists(CSV):
     print('CSV not found:', CSV)
     raise SystemExit(1)
@@ -0,0 +1,224 @@
+"""Almacén opcional de resultados en SQLite (documentos, proveedores y partidas).
+
+Guarda las mismas filas que el CSV consolidado en tres tablas normalizadas e
+indexadas por NUM_PEDIMENTO, Archivo, FRACCION e ID_FISCAL, de modo que consultas
+como "todas las partidas de la fracción 90192001" son una búsqueda por índice en vez
+de leer el CSV completo con pandas.
+
+Cada documento se identifica por el SHA-256 de su archivo y el nombre de este (las
+copias idénticas con otro nombre también son filas del CSV) y cada partida por
+(documento, SEC, repetición): la repetición distingue las filas de un mismo
+documento que comparten SEC (p. ej. las de un COVE, que no lo trae). Guardar un
+documento hace upsert de sus partidas y borra las que ya no produjo; las
+escrituras se agrupan en transacciones de FILAS_POR_TRANSACCION filas.
+"""
+import math
+import os
+import sqlite3
+
+FILAS_POR_TRANSACCION = 500
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS documentos (
+    id INTEGER PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    archivo TEXT NOT NULL,
+    num_pedimento TEXT,
+    tipo_cambio TEXT,
+    aduana TEXT,
+    posicion INTEGER,
+    UNIQUE (sha256, archivo)
+);
+CREATE TABLE IF NOT EXISTS proveedores (
+    id INTEGER PRIMARY KEY,
+    id_fiscal TEXT NOT NULL,
+    nombre TEXT NOT NULL,
+    UNIQUE (id_fiscal, nombre)
+);
+CREATE TABLE IF NOT EXISTS partidas (
+    documento_id INTEGER NOT NULL REFERENCES documentos (id) ON DELETE CASCADE,
+    sec TEXT NOT NULL,
+    repeticion INTEGER NOT NULL,
+    orden INTEGER NOT NULL,
+    fraccion TEXT,
+    descripcion TEXT,
+    tasa_igi TEXT,
+    proveedor_id INTEGER REFERENCES proveedores (id),
+    PRIMARY KEY (documento_id, sec, repeticion)
+);
+CREATE INDEX IF NOT EXISTS ix_documentos_num_pedimento ON documentos (num_pedimento);
+CREATE INDEX IF NOT EXISTS ix_documentos_archivo ON documentos (archivo);
+CREATE INDEX IF NOT EXISTS ix_partidas_fraccion ON partidas (fraccion);
+CREATE INDEX IF NOT EXISTS ix_proveedores_id_fiscal ON proveedores (id_fiscal);
+"""
+
+_DESDE = """
+FROM partidas t
+JOIN documentos d ON d.id = t.documento_id
+LEFT JOIN proveedores p ON p.id = t.proveedor_id
+"""
+# mismas columnas y orden que COLUMNAS_SALIDA de mapear_campos
+_SELECT = """
+SELECT d.num_pedimento, d.tipo_cambio, d.aduana, p.id_fiscal, p.nombre,
+       t.sec, t.fraccion, t.descripcion, t.tasa_igi, d.archivo""" + _DESDE
+COLUMNAS = [
+    "NUM_PEDIMENTO", "TIPO_CAMBIO", "ADUANA", "ID_FISCAL", "NOMBRE_DENOMINACION_O_RAZON_SOCIAL",
+    "SEC", "FRACCION", "DESCRIPCION", "TASA_IGI", "Archivo",
+]
+# filtros admitidos por filas()/contar() -> (condición, parámetros); todos usan un índice
+FILTROS = {
+    "fraccion": ("t.fraccion = ?", lambda v: (v,)),
+    # prefijo como rango, para que también use el índice de fracción
+    "fraccion_prefijo": ("t.fraccion >= ? AND t.fraccion < ?", lambda v: (v, v + "\uffff")),
+    "num_pedimento": ("d.num_pedimento = ?", lambda v: (v,)),
+    "id_fiscal": ("p.id_fiscal = ?", lambda v: (v,)),
+    "archivo": ("d.archivo = ?", lambda v: (v,)),
+}
+
+
+def _texto(valor):
+    # igual que en el CSV: los nulos (None o NaN de pandas) quedan como cadena vacía
+    if valor is None or (isinstance(valor, float) and math.isnan(valor)):
+        return ""
+    return str(valor)
+
+
+def clave_documento(sha256, filas):
+    """Clave (sha256, archivo) con la que se guardan las filas de un documento; None sin filas."""
+    if not filas:
+        return None
+    return sha256, _texto(filas[0].get("Archivo"))
+
+
+class AlmacenSQLite:
+    """Base de datos de resultados en `ruta`; se crea con su esquema si no existe."""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+        self._con = sqlite3.connect(ruta)
+        self._con.execute("PRAGMA foreign_keys = ON")
+        self._con.executescript(ESQUEMA)
+        self._proveedores = {}
+        self._pendientes = 0
+        # los documentos nuevos van detrás de los ya guardados
+        self._posicion = self._con.execute("SELECT COALESCE(MAX(posicion) + 1, 0) FROM documentos").fetchone()[0]
+
+    def _proveedor(self, id_fiscal, nombre):
+        clave = (id_fiscal, nombre)
+        if clave not in self._proveedores:
+            self._con.execute("INSERT OR IGNORE INTO proveedores (id_fiscal, nombre) VALUES (?, ?)", clave)
+            fila = self._con.execute(
+                "SELECT id FROM proveedores WHERE id_fiscal = ? AND nombre = ?", clave).fetchone()
+            self._proveedores[clave] = fila[0]
+        return self._proveedores[clave]
+
+    def guardar_documento(self, sha256, filas):
+        """Upsert de las filas (dicts de COLUMNAS_SALIDA) del archivo con hash `sha256`.
+
+        El nombre del archivo y la cabecera del documento se toman de la primera
+        fila; las partidas que el documento tenía y que ya no aparecen en `filas` se
+        eliminan. Devuelve la clave (sha256, archivo) del documento, o None sin filas.
+        """
+        clave = clave_documento(sha256, filas)
+        if clave is None:
+            return None
+        primera = filas[0]
+        documento = self._con.execute(
+            """INSERT INTO documentos (sha256, archivo, num_pedimento, tipo_cambio, aduana, posicion)
+               VALUES (?, ?, ?, ?, ?, ?)
+               ON CONFLICT (sha256, archivo) DO UPDATE SET
+                   num_pedimento = excluded.num_pedimento, tipo_cambio = excluded.tipo_cambio,
+                   aduana = excluded.aduana, posicion = excluded.posicion
+               RETURNING id""",
+            (*clave, _texto(primera.get("NUM_PEDIMENTO")), _texto(primera.get("TIPO_CAMBIO")),
+             _texto(primera.get("ADUANA")), self._posicion),
+        ).fetchone()[0]
+        self._posicion += 1
+        existentes = set(self._con.execute(
+            "SELECT sec, repeticion FROM partidas WHERE documento_id = ?", (documento,)))
+        repeticiones = {}
+        registros = []
+        for orden, fila in enumerate(filas):
+            sec = _texto(fila.get("SEC"))
+            repeticion = repeticiones.get(sec, 0)
+            repeticiones[sec] = repeticion + 1
+            proveedor = self._proveedor(_texto(fila.get("ID_FISCAL")),
+                                        _texto(fila.get("NOMBRE_DENOMINACION_O_RAZON_SOCIAL")))
+            registros.append((documento, sec, repeticion, orden, _texto(fila.get("FRACCION")),
+                              _texto(fila.get("DESCRIPCION")), _texto(fila.get("TASA_IGI")), proveedor))
+        self._con.executemany(
+            """INSERT INTO partidas (documento_id, sec, repeticion, orden, fraccion, descripcion, tasa_igi, proveedor_id)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT (documento_id, sec, repeticion) DO UPDATE SET
+                   orden = excluded.orden, fraccion = excluded.fraccion, descripcion = excluded.descripcion,
+                   tasa_igi = excluded.tasa_igi, proveedor_id = excluded.proveedor_id""",
+            registros,
+        )
+        obsoletas = existentes - {(r[1], r[2]) for r in registros}
+        self._con.executemany("DELETE FROM partidas WHERE documento_id = ? AND sec = ? AND repeticion = ?",
+                              [(documento, sec, repeticion) for sec, repeticion in obsoletas])
+        self._pendientes += len(filas)
+        if self._pendientes >= FILAS_POR_TRANSACCION:
+            self.confirmar()
+        return clave
+
+    def documentos(self):
+        """Claves (sha256, archivo) de los documentos guardados."""
+        return set(self._con.execute("SELECT sha256, archivo FROM documentos"))
+
+    def conservar(self, claves):
+        """Elimina los documentos (y sus partidas) cuya clave (sha256, archivo) no está en `claves`."""
+        vigentes = set(claves)
+        obsoletos = [(id_,) for id_, *clave in self._con.execute("SELECT id, sha256, archivo FROM documentos")
+                     if tuple(clave) not in vigentes]
+        self._con.executemany("DELETE FROM documentos WHERE id = ?", obsoletos)
+        self._con.execute("DELETE FROM proveedores WHERE id NOT IN (SELECT DISTINCT proveedor_id FROM partidas)")
+        self._proveedores.clear()
+
+    def eliminar_archivo(self, archivo, conservar=None):
+        """Elimina las versiones guardadas de `archivo` salvo la de clave `conservar`."""
+        self._con.execute("DELETE FROM documentos WHERE archivo = ? AND sha256 IS NOT ?",
+                          (archivo, conservar[0] if conservar else None))
+
+    def confirmar(self):
+        self._con.commit()
+        self._pendientes = 0
+
+    def _consulta(self, seleccion, filtros):
+        where = []
+        parametros = []
+        for nombre, valor in filtros.items():
+            if nombre not in FILTROS:
+                raise ValueError(f"Filtro no admitido: {nombre} (use {', '.join(FILTROS)})")
+            condicion, valores = FILTROS[nombre]
+            where.append(condicion)
+            parametros.extend(valores(valor))
+        sql = seleccion + (" WHERE " + " AND ".join(where) if where else "")
+        return sql, parametros
+
+    def filas(self, **filtros):
+        """Filas (dicts de COLUMNAS_SALIDA) en el orden del CSV que cumplen los filtros.
+
+        Filtros: fraccion, fraccion_prefijo, num_pedimento, id_fiscal, archivo.
+        """
+        sql, parametros = self._consulta(_SELECT, filtros)
+        cursor = self._con.execute(sql + " ORDER BY d.posicion, t.orden", parametros)
+        return [dict(zip(COLUMNAS, (_texto(v) for v in fila))) for fila in cursor]
+
+    def contar(self, **filtros):
+        """Número de partidas que cumplen los filtros (los mismos que filas())."""
+        sql, parametros = self._consulta("SELECT COUNT(*)" + _DESDE, filtros)
+        return self._con.execute(sql, parametros).fetchone()[0]
+
+    def close(self):
+        if self._con is not None:
+            self.confirmar()
+            self._con.close()
+            self._con = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
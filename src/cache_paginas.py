@@ -0,0 +1,161 @@
+"""Caché persistente en disco del texto y las palabras de cada página de un PDF.
+
+Cada entrada se indexa por el SHA-256 del contenido del archivo más la versión de
+pdfplumber, así que modificar un PDF o actualizar pdfplumber invalida la entrada.
+Las entradas se guardan comprimidas (pickle + zlib, palabras como las columnas de
+su TablaPalabras, None en el texto o las palabras de las páginas que no se
+extrajeron) y el directorio se mantiene por debajo de `max_bytes` expulsando las
+entradas usadas hace más tiempo (LRU por mtime, que se actualiza en cada lectura).
+El tamaño del directorio se lleva como un total en memoria, por proceso y
+directorio: se calcula listando el directorio la primera vez y luego se ajusta en
+cada escritura y eliminación, así que solo se vuelve a listar al expulsar.
+"""
+import hashlib
+import importlib.metadata
+import os
+import pickle
+import sys
+import zlib
+
+try:
+    from src.tabla_palabras import TablaPalabras
+except ImportError:  # ejecución directa: python src/<script>.py
+    from tabla_palabras import TablaPalabras
+
+FORMATO = 4
+EXTENSION = ".pag"
+
+# directorio de caché -> bytes que ocupan sus entradas (compartido por las instancias del proceso)
+_TOTALES = {}
+
+
+def hash_archivo(path, bloque=1024 * 1024):
+    """SHA-256 hexadecimal del contenido de `path`."""
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(bloque), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def version_pdfplumber():
+    """Versión instalada de pdfplumber, sin importarlo (una entrada de caché válida no lo necesita)."""
+    try:
+        return importlib.metadata.version("pdfplumber")
+    except importlib.metadata.PackageNotFoundError:
+        import pdfplumber
+        return pdfplumber.__version__
+
+
+def _empaquetar_palabras(tabla):
+    if tabla is None:
+        return None
+    return tabla.texto, tabla.x0, tabla.top
+
+
+def _desempaquetar_palabras(texto, x0, top):
+    # los textos se vuelven a internar: los tokens repetidos comparten objeto
+    return TablaPalabras([sys.intern(t) for t in texto], x0, top)
+
+
+class CachePaginas:
+    def __init__(self, directorio, max_bytes=512 * 1024 * 1024, version=None):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.version = version or version_pdfplumber()
+        os.makedirs(directorio, exist_ok=True)
+        self._clave_total = os.path.abspath(directorio)
+
+    def _entradas(self):
+        """(mtime, tamaño, ruta) de cada entrada del directorio."""
+        entradas = []
+        for nombre in os.listdir(self.directorio):
+            if not nombre.endswith(EXTENSION):
+                continue
+            ruta = os.path.join(self.directorio, nombre)
+            try:
+                st = os.stat(ruta)
+            except FileNotFoundError:
+                continue
+            entradas.append((st.st_mtime, st.st_size, ruta))
+        return entradas
+
+    @property
+    def total_bytes(self):
+        if self._clave_total not in _TOTALES:
+            _TOTALES[self._clave_total] = sum(tam for _, tam, _ in self._entradas())
+        return _TOTALES[self._clave_total]
+
+    def _ruta(self, sha256):
+        return os.path.join(self.directorio, f"{sha256}-{self.version}{EXTENSION}")
+
+    def obtener(self, sha256):
+        """Devuelve (textos, palabras) por página, o None si no hay entrada válida."""
+        ruta = self._ruta(sha256)
+        try:
+            with open(ruta, "rb") as fh:
+                datos = pickle.loads(zlib.decompress(fh.read()))
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # entrada corrupta o de otro formato: descartarla
+            self._eliminar(ruta)
+            return None
+        if datos.get("formato") != FORMATO:
+            self._eliminar(ruta)
+            return None
+        try:
+            # marcar como usada recientemente para la expulsión LRU
+            os.utime(ruta, None)
+        except OSError:
+            pass
+        palabras = [None if p is None else _desempaquetar_palabras(*p) for p in datos["palabras"]]
+        return datos["textos"], palabras
+
+    def guardar(self, sha256, textos, palabras):
+        datos = {
+            "formato": FORMATO,
+            "textos": list(textos),
+            "palabras": [_empaquetar_palabras(w) for w in palabras],
+        }
+        blob = zlib.compress(pickle.dumps(datos, protocol=pickle.HIGHEST_PROTOCOL), 6)
+        ruta = self._ruta(sha256)
+        total = self.total_bytes
+        try:
+            # se sobrescribe una entrada existente: su tamaño deja de contar
+            total -= os.stat(ruta).st_size
+        except FileNotFoundError:
+            pass
+        tmp = f"{ruta}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as fh:
+            fh.write(blob)
+        os.replace(tmp, ruta)
+        _TOTALES[self._clave_total] = total + len(blob)
+        if _TOTALES[self._clave_total] > self.max_bytes:
+            self.expulsar()
+
+    def expulsar(self):
+        """Elimina las entradas menos usadas hasta quedar por debajo de `max_bytes`.
+
+        Lista el directorio (otros procesos también escriben en él) y corrige con
+        ello el total en memoria.
+        """
+        entradas = self._entradas()
+        total = sum(tam for _, tam, _ in entradas)
+        if total > self.max_bytes:
+            for _, tam, ruta in sorted(entradas):
+                self._eliminar(ruta, tam)
+                total -= tam
+                if total <= self.max_bytes:
+                    break
+        _TOTALES[self._clave_total] = total
+
+    def _eliminar(self, ruta, tam=None):
+        try:
+            if tam is None:
+                tam = os.stat(ruta).st_size
+            os.remove(ruta)
+        except FileNotFoundError:
+            return
+        if self._clave_total in _TOTALES:
+            _TOTALES[self._clave_total] = max(0, _TOTALES[self._clave_total] - tam)
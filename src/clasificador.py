@@ -0,0 +1,89 @@
+"""Clasificador barato de documentos: pedimento / proforma / COVE / otro.
+
+Decide a partir del texto de la primera página (no de todo el documento), buscando
+las etiquetas que siempre aparecen en la cabecera de cada tipo de formato. Así los
+pedimentos con otro nombre de archivo se procesan y las facturas, COVE impresos,
+manifestaciones de valor, etc. nunca llegan a los extractores por posición.
+
+Una proforma tiene el mismo formato que el pedimento, así que se reconoce antes
+de puntuar los demás tipos: por su nombre de archivo o por el número de pedimento
+que dice "Pro forma". Para el resto, cada tipo tiene marcadores con peso; la
+confianza es la fracción del peso total encontrada en la página. Por debajo de
+UMBRAL el documento se considera 'otro'.
+"""
+import collections
+import re
+
+PEDIMENTO = "pedimento"
+PROFORMA = "proforma"
+COVE = "cove"
+OTRO = "otro"
+
+UMBRAL = 0.3
+
+MARCADORES = {
+    PEDIMENTO: [
+        (re.compile(r"NUM\.?\s*PEDIMENTO", re.I), 3),
+        (re.compile(r"CVE\.?\s*PEDIMENTO", re.I), 2),
+        (re.compile(r"ADUANA\s*E/S", re.I), 1),
+        (re.compile(r"DATOS\s+DEL\s+IMPORTADOR", re.I), 1),
+        (re.compile(r"TIPO\s*CAMBIO", re.I), 1),
+        (re.compile(r"T\.\s*OPER", re.I), 1),
+    ],
+    COVE: [
+        (re.compile(r"ACUSE\s+DE\s+VALOR", re.I), 3),
+        (re.compile(r"INFORMACI[OÓ]N\s+DE\s+VALOR\s+Y\s+DE\s+COMERCIALIZACI[OÓ]N", re.I), 2),
+        (re.compile(r"\bCOVE[0-9A-Z]{9}\b", re.I), 1),
+    ],
+}
+
+# el texto no basta para distinguirla: "PROFORMA" y "BORRADOR SIN VALIDEZ" también
+# aparecen en la plantilla de pedimentos validados
+MARCADORES_PROFORMA = [
+    re.compile(r"NUM\.?\s*PEDIMENTO:?\s*PRO\s*-?\s*FORMA\b", re.I),
+]
+NOMBRE_PROFORMA_RE = re.compile(r"PRO[\s_\-]*FORMA", re.I)
+
+Clasificacion = collections.namedtuple("Clasificacion", ["tipo", "confianza", "marcadores"])
+
+
+def clasificar_nombre(nombre):
+    """Clasificacion de proforma si el nombre del archivo lo dice; si no, None."""
+    if nombre and NOMBRE_PROFORMA_RE.search(nombre.rsplit("/", 1)[-1]):
+        return Clasificacion(PROFORMA, 1.0, (NOMBRE_PROFORMA_RE.pattern,))
+    return None
+
+
+def clasificar_texto(texto, nombre=""):
+    """Clasifica el texto de la primera página; devuelve Clasificacion(tipo, confianza, marcadores).
+
+    `nombre` es el nombre del archivo, que basta para reconocer una proforma.
+    """
+    texto = texto or ""
+    por_nombre = clasificar_nombre(nombre)
+    if por_nombre is not None:
+        return por_nombre
+    proforma = tuple(pat.pattern for pat in MARCADORES_PROFORMA if pat.search(texto))
+    if proforma:
+        return Clasificacion(PROFORMA, 1.0, proforma)
+    mejor = Clasificacion(OTRO, 0.0, ())
+    for tipo, marcadores in MARCADORES.items():
+        total = sum(peso for _, peso in marcadores)
+        encontrados = [(pat, peso) for pat, peso in marcadores if pat.search(texto)]
+        confianza = sum(peso for _, peso in encontrados) / total
+        if confianza > mejor.confianza:
+            mejor = Clasificacion(tipo, confianza, tuple(pat.pattern for pat, _ in encontrados))
+    if mejor.confianza < UMBRAL:
+        # confianza de que no es ninguno de los tipos conocidos
+        return Clasificacion(OTRO, round(1 - mejor.confianza, 3), mejor.marcadores)
+    return mejor._replace(confianza=round(mejor.confianza, 3))
+
+
+def clasificar(doc):
+    """Clasifica un PedimentoDocument leyendo solo su primera página (o ninguna, si el nombre basta)."""
+    por_nombre = clasificar_nombre(doc.nombre)
+    if por_nombre is not None:
+        return por_nombre
+    if not doc.num_paginas:
+        return Clasificacion(OTRO, 1.0, ())
+    return clasificar_texto(doc.texto_pagina(0))
@@ -0,0 +1,89 @@
+"""Línea de comandos ligera para extraer pedimentos sueltos.
+
+Uso:
+  python src/cli.py extraer ARCHIVO.pdf [ARCHIVO.pdf ...] [--formato json|jsonl|csv]
+         [--cache-dir DIR] [--xml DIR]
+
+Escribe en la salida estándar las filas de cada PDF (las mismas columnas que el CSV
+consolidado); los avisos y errores van a la salida de errores y el código de salida
+es 1 si algún archivo falló. `extract` y `--format` se aceptan como alias.
+
+Este módulo solo importa la biblioteca estándar: mapear_campos (con NumPy y, si hay
+que analizar el PDF, pdfplumber) se importa después de leer los argumentos, así que
+`--help` o un error de argumentos responden al instante, y extraer un documento no
+importa pandas.
+"""
+import argparse
+import csv
+import json
+import math
+import sys
+
+FORMATOS = ("json", "jsonl", "csv")
+
+
+def _modulos():
+    try:
+        from src import clasificador, mapear_campos, pedimentos_xml
+    except ImportError:  # ejecución directa: python src/cli.py
+        import clasificador
+        import mapear_campos
+        import pedimentos_xml
+    return clasificador, mapear_campos, pedimentos_xml
+
+
+def _valor(valor, nulo):
+    if valor is None or (isinstance(valor, float) and math.isnan(valor)):
+        return nulo
+    return valor
+
+
+def _escribir(filas, formato, columnas, salida):
+    if formato == "csv":
+        writer = csv.writer(salida, lineterminator="\n")
+        writer.writerow(columnas)
+        for fila in filas:
+            writer.writerow([_valor(fila.get(c), "") for c in columnas])
+        return
+    filas = [{k: _valor(v, None) for k, v in fila.items()} for fila in filas]
+    if formato == "jsonl":
+        for fila in filas:
+            salida.write(json.dumps(fila, ensure_ascii=False) + "\n")
+    else:
+        json.dump(filas, salida, ensure_ascii=False, indent=2)
+        salida.write("\n")
+
+
+def extraer(args):
+    clasificador, mapear_campos, pedimentos_xml = _modulos()
+    indice_xml = pedimentos_xml.cargar_indice(args.xml)
+    filas = []
+    errores = 0
+    for ruta in args.archivos:
+        filas_pdf, error, clasificacion, _ = mapear_campos._procesar_archivo(ruta, args.cache_dir)
+        if error:
+            print(f"Error en {ruta}: {error}", file=sys.stderr)
+            errores += 1
+            continue
+        if clasificacion is not None and clasificacion.tipo != clasificador.PEDIMENTO:
+            print(f"Omitido: {ruta} ({clasificacion.tipo}, confianza {clasificacion.confianza:.2f})", file=sys.stderr)
+        filas.extend(pedimentos_xml.resolver_filas(filas_pdf, indice_xml)[0])
+    _escribir(filas, args.formato, mapear_campos.COLUMNAS_SALIDA, sys.stdout)
+    return 1 if errores else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extracción de pedimentos PDF desde la línea de comandos.")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+    p_extraer = comandos.add_parser("extraer", aliases=["extract"], help="extrae las filas de uno o más PDFs")
+    p_extraer.add_argument("archivos", nargs="+", metavar="ARCHIVO", help="PDF de pedimento")
+    p_extraer.add_argument("--formato", "--format", choices=FORMATOS, default="json", help="formato de salida")
+    p_extraer.add_argument("--cache-dir", help="caché de páginas en disco (por defecto no se usa)")
+    p_extraer.add_argument("--xml", help="carpeta con XML de COVE que completan las filas del PDF")
+    p_extraer.set_defaults(funcion=extraer)
+    args = parser.parse_args(argv)
+    return args.funcion(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
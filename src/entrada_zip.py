@@ -0,0 +1,94 @@
+"""Pedimentos dentro de archivos ZIP, procesados sin descomprimirlos a disco.
+
+Los agentes envían los lotes mensuales como ZIP. Cada PDF del archivo es un
+MiembroZip: se descomprime a memoria al abrirlo (pdfplumber lo lee de un BytesIO) y
+su SHA-256 se calcula mientras se lee, así que la caché de páginas, el manifiesto
+incremental y el almacén SQLite funcionan igual que con un PDF suelto. Cada miembro
+se descomprime una sola vez por lote, en el proceso que lo analiza: el hash vuelve
+con el resultado, y el tamaño y el CRC-32 que usa el manifiesto se toman del
+directorio central del ZIP al listarlo. Sus filas se identifican como
+`lote.zip/miembro.pdf`. Se descartan los directorios, los miembros que no son PDF y
+los restos de macOS (`__MACOSX/`, `._*`).
+
+Las funciones `*_entrada` aceptan indistintamente la ruta de un PDF o un MiembroZip.
+"""
+import hashlib
+import os
+import zipfile
+from typing import NamedTuple
+
+try:
+    from src.cache_paginas import hash_archivo
+except ImportError:  # ejecución directa: python src/<script>.py
+    from cache_paginas import hash_archivo
+
+BLOQUE = 1024 * 1024
+
+
+class MiembroZip(NamedTuple):
+    ruta_zip: str
+    miembro: str
+    # del directorio central, leídos al listar el ZIP
+    tamano: int = None
+    crc: int = None
+
+    @property
+    def nombre(self):
+        return f"{os.path.basename(self.ruta_zip)}/{self.miembro}"
+
+    def leer(self):
+        """Devuelve (contenido, SHA-256) del miembro; el hash se calcula al descomprimir."""
+        h = hashlib.sha256()
+        partes = []
+        with zipfile.ZipFile(self.ruta_zip) as zf, zf.open(self.miembro) as fh:
+            for bloque in iter(lambda: fh.read(BLOQUE), b""):
+                h.update(bloque)
+                partes.append(bloque)
+        return b"".join(partes), h.hexdigest()
+
+
+def es_miembro_pdf(nombre):
+    partes = nombre.split("/")
+    if "__MACOSX" in partes or partes[-1].startswith("._"):
+        return False
+    return nombre.lower().endswith(".pdf")
+
+
+def miembros_pdf(ruta_zip):
+    """MiembroZip de cada PDF de `ruta_zip`, en el orden del archivo."""
+    with zipfile.ZipFile(ruta_zip) as zf:
+        return [MiembroZip(ruta_zip, info.filename, info.file_size, info.CRC) for info in zf.infolist()
+                if not info.is_dir() and es_miembro_pdf(info.filename)]
+
+
+def nombre_entrada(entrada):
+    return entrada.nombre if isinstance(entrada, MiembroZip) else os.path.basename(entrada)
+
+
+def estado_entrada(entrada):
+    """(mtime, tamaño) como los de os.stat; un miembro toma el mtime de su ZIP."""
+    if isinstance(entrada, MiembroZip):
+        mtime = os.stat(entrada.ruta_zip).st_mtime
+        if entrada.tamano is not None:
+            return mtime, entrada.tamano
+        with zipfile.ZipFile(entrada.ruta_zip) as zf:
+            return mtime, zf.getinfo(entrada.miembro).file_size
+    st = os.stat(entrada)
+    return st.st_mtime, st.st_size
+
+
+def crc_entrada(entrada):
+    """CRC-32 de un miembro según el directorio central (sin descomprimirlo); None para un PDF suelto."""
+    if not isinstance(entrada, MiembroZip):
+        return None
+    if entrada.crc is not None:
+        return entrada.crc
+    with zipfile.ZipFile(entrada.ruta_zip) as zf:
+        return zf.getinfo(entrada.miembro).CRC
+
+
+def hash_entrada(entrada):
+    """SHA-256 del contenido del PDF (descomprimido, si es un miembro de un ZIP)."""
+    if isinstance(entrada, MiembroZip):
+        return entrada.leer()[1]
+    return hash_archivo(entrada)
@@ -0,0 +1,111 @@
+"""Escritura en streaming de las filas extraídas (CSV, JSON Lines y JSON).
+
+Las filas de cada PDF se escriben en cuanto ese archivo termina, así la memoria no
+crece con el tamaño del lote. Se escribe sobre archivos `<ruta>.parcial` que se
+vacían a disco tras cada lote de filas; al cerrar sin errores se renombran de forma
+atómica sobre la ruta final. Si el proceso se interrumpe, la salida anterior queda
+intacta y lo procesado hasta ese momento sigue disponible en los `.parcial`.
+"""
+import csv
+import json
+import math
+import os
+
+SUFIJO_PARCIAL = ".parcial"
+
+
+def _valor_csv(valor):
+    # igual que DataFrame.to_csv: los nulos se escriben como celda vacía
+    if valor is None or (isinstance(valor, float) and math.isnan(valor)):
+        return ""
+    return valor
+
+
+def _valor_json(valor):
+    if isinstance(valor, float) and math.isnan(valor):
+        return None
+    return valor
+
+
+class EscritorSalida:
+    """Escribe filas (dicts) a CSV con `columnas` fijas y, opcionalmente, a JSONL y JSON.
+
+    Usado como context manager confirma la salida al salir sin excepción; `descartar()`
+    la anula sin tocar los archivos existentes.
+    """
+
+    def __init__(self, ruta_csv=None, columnas=None, ruta_jsonl=None, ruta_json=None, fin_linea_csv="\n"):
+        self.columnas = list(columnas or [])
+        self.filas_escritas = 0
+        self.cerrado = False
+        self._rutas = [r for r in (ruta_csv, ruta_jsonl, ruta_json) if r]
+        self._csv = self._jsonl = self._json = None
+        if ruta_csv:
+            self._csv = self._abrir(ruta_csv)
+            self._writer = csv.writer(self._csv, lineterminator=fin_linea_csv)
+            self._writer.writerow(self.columnas)
+        if ruta_jsonl:
+            self._jsonl = self._abrir(ruta_jsonl)
+        if ruta_json:
+            self._json = self._abrir(ruta_json)
+            self._json.write("[")
+
+    @staticmethod
+    def _abrir(ruta):
+        os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+        return open(ruta + SUFIJO_PARCIAL, "w", newline="", encoding="utf-8")
+
+    def _abiertos(self):
+        return [fh for fh in (self._csv, self._jsonl, self._json) if fh is not None]
+
+    def escribir(self, filas):
+        """Añade las filas de un archivo y las vacía a disco."""
+        for fila in filas:
+            if self._csv is not None:
+                self._writer.writerow([_valor_csv(fila.get(c)) for c in self.columnas])
+            if self._jsonl is not None or self._json is not None:
+                datos = {k: _valor_json(v) for k, v in fila.items()}
+            if self._jsonl is not None:
+                self._jsonl.write(json.dumps(datos, ensure_ascii=False) + "\n")
+            if self._json is not None:
+                # mismo formato que json.dump(lista, indent=2), elemento a elemento
+                bloque = json.dumps(datos, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+                self._json.write(("," if self.filas_escritas else "") + "\n  " + bloque)
+            self.filas_escritas += 1
+        for fh in self._abiertos():
+            fh.flush()
+
+    def _cerrar_archivos(self):
+        if self._json is not None:
+            self._json.write("\n]" if self.filas_escritas else "]")
+        for fh in self._abiertos():
+            fh.close()
+        self._csv = self._jsonl = self._json = None
+        self.cerrado = True
+
+    def cerrar(self, confirmar=True):
+        """Cierra los archivos; con `confirmar` los mueve de forma atómica a su ruta final."""
+        if self.cerrado:
+            return
+        self._cerrar_archivos()
+        if confirmar:
+            for ruta in self._rutas:
+                os.replace(ruta + SUFIJO_PARCIAL, ruta)
+
+    def descartar(self):
+        """Cierra y elimina los `.parcial` sin reemplazar la salida existente."""
+        if self.cerrado:
+            return
+        self._cerrar_archivos()
+        for ruta in self._rutas:
+            try:
+                os.remove(ruta + SUFIJO_PARCIAL)
+            except FileNotFoundError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # ante un error se conservan los .parcial y la salida anterior no se toca
+        self.cerrar(confirmar=exc_type is None)
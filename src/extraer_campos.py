@@ -8,10 +8,21 @@ from typing import Any, Dict, List, Optional
 
 import pdfplumber
 
+try:
+    from src.escritor_salida import EscritorSalida
+    from src.manifiesto import Manifiesto
+except ImportError:  # ejecución directa: python src/extraer_campos.py
+    from escritor_salida import EscritorSalida
+    from manifiesto import Manifiesto
+
 ROOT = Path(__file__).resolve().parents[1]
 PDF_DIR = ROOT / "PEDIMENTOS 2025" / "PEDIMENTOS_VALIDOS"
 OUT_JSON = ROOT / "salida" / "pedimentos_extraccion_campos.json"
 OUT_CSV = ROOT / "salida" / "pedimentos_extraccion_campos.csv"
+OUT_MANIFEST = ROOT / "salida" / "pedimentos_extraccion_campos.manifest.json"
+
+# Subirla cuando cambien las reglas de extracción para forzar el reproceso incremental.
+EXTRACTOR_VERSION = "1"
 
 RFC_RE = re.compile(r"[A-ZÑ&]{3,4}[0-9]{6}[A-Z0-9]{3}", re.I)
 NUM_RE = re.compile(r"\b\d{4,15}\b")
@@ -20,6 +31,8 @@ PARTIDA_RE = re.compile(r"\b\d{2,6}\b")
 FRACCION_RE = re.compile(r"\b\d{4,10}\b")
 TASA_RE = re.compile(r"\b(?:[0-9]{1,2}(?:\.[0-9]+)?|0?\.[0-9]+)%\b")
 
+CSV_KEYS = ["file", "NUM. PEDIMENTO", "ADUANA E/S", "ID. FISCAL", "NOMBRE, DENOMINACION O RAZON SOCIAL DEL PROVEEDOR", "VAL. DOLARES", "PARTIDA (SEC)", "FRACCION", "DESCRIPCION", "TASA DE IGI"]
+
 
 def text_lines_from_pdf(path: Path) -> List[str]:
     out: List[str] = []
@@ -109,27 +122,39 @@ def extract_fields_from_file(path: Path) -> Dict[str, Any]:
     return res
 
 
-def main() -> None:
-    out: List[Dict[str, Any]] = []
-    for p in sorted(PDF_DIR.rglob("*.pdf")):
-        print("Procesando:", p.name)
-        try:
-            data = extract_fields_from_file(p)
-            out.append(data)
-        except Exception as e:
-            out.append({"file": p.name, "error": str(e)})
-
-    OUT_JSON.parent.mkdir(parents=True, exist_ok=True)
-    with OUT_JSON.open("w", encoding="utf-8") as fh:
-        json.dump(out, fh, ensure_ascii=False, indent=2)
-
-    # CSV
-    keys = ["file", "NUM. PEDIMENTO", "ADUANA E/S", "ID. FISCAL", "NOMBRE, DENOMINACION O RAZON SOCIAL DEL PROVEEDOR", "VAL. DOLARES", "PARTIDA (SEC)", "FRACCION", "DESCRIPCION", "TASA DE IGI"]
-    with OUT_CSV.open("w", newline="", encoding="utf-8") as fh:
-        writer = csv.writer(fh)
-        writer.writerow(keys)
-        for row in out:
-            writer.writerow([row.get(k, "") for k in keys])
+def load_previous_results(manifiesto: Manifiesto) -> Dict[str, Dict[str, Any]]:
+    """Resultados de la ejecución anterior por nombre de archivo (vacío si no hay JSON previo)."""
+    if not OUT_JSON.exists():
+        manifiesto.archivos = {}
+        return {}
+    try:
+        with OUT_JSON.open(encoding="utf-8") as fh:
+            return {row.get("file", ""): row for row in json.load(fh)}
+    except (OSError, ValueError):
+        manifiesto.archivos = {}
+        return {}
+
+
+def main(incremental: bool = True) -> None:
+    manifiesto = Manifiesto.cargar(str(OUT_MANIFEST), EXTRACTOR_VERSION)
+    previos = load_previous_results(manifiesto) if incremental else {}
+    pdfs = sorted(PDF_DIR.rglob("*.pdf"))
+    # cada resultado se escribe en cuanto se obtiene (JSON y CSV en streaming, rename atómico al final)
+    with EscritorSalida(str(OUT_CSV), CSV_KEYS, ruta_json=str(OUT_JSON), fin_linea_csv="\r\n") as escritor:
+        for p in pdfs:
+            if incremental and p.name in previos and manifiesto.sin_cambios(p.name, p):
+                escritor.escribir([previos.pop(p.name)])
+                continue
+            print("Procesando:", p.name)
+            try:
+                data = extract_fields_from_file(p)
+                manifiesto.registrar(p.name, p)
+            except Exception as e:
+                data = {"file": p.name, "error": str(e)}
+                manifiesto.olvidar(p.name)
+            escritor.escribir([data])
+
+    manifiesto.guardar([p.name for p in pdfs])
 
     print("Extracción completada. Archivos:")
     print(OUT_JSON)
@@ -137,4 +162,8 @@ def main() -> None:
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Extrae campos de cabecera de los pedimentos PDF.")
+    parser.add_argument("--completo", action="store_true", help="reprocesar todos los PDFs")
+    main(incremental=not parser.parse_args().completo)
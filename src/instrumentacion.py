@@ -0,0 +1,124 @@
+"""Instrumentación opcional del pipeline: tiempos por función, ramas y archivos más lentos.
+
+Desactivada por defecto. Con `activar(ruta)` (o la variable de entorno
+PEDIMENTOS_TRAZA, que heredan los procesos del pool) cada PDF procesado dentro de
+`archivo(nombre)` añade una línea JSON a la traza con su tiempo total, las
+llamadas y el tiempo de cada función decorada con `instrumentar` y cuántas veces
+se tomó cada rama marcada con `rama`. `resumen(ruta)` lee la traza y devuelve
+los N archivos más lentos.
+
+Desactivada, una función instrumentada solo paga una consulta a una variable
+global antes de llamar a la original, y `rama` no hace nada.
+"""
+import collections
+import contextlib
+import functools
+import json
+import os
+import time
+
+VARIABLE_ENTORNO = "PEDIMENTOS_TRAZA"
+
+_ruta_traza = os.environ.get(VARIABLE_ENTORNO) or None
+# registro del archivo en curso; None fuera de `archivo()` o con la instrumentación desactivada
+_actual = None
+
+
+def activar(ruta_traza):
+    """Activa la instrumentación escribiendo la traza (JSON Lines) en `ruta_traza`."""
+    global _ruta_traza
+    os.makedirs(os.path.dirname(os.path.abspath(ruta_traza)), exist_ok=True)
+    open(ruta_traza, "w", encoding="utf-8").close()
+    _ruta_traza = ruta_traza
+    # los procesos trabajadores la leen al importar este módulo
+    os.environ[VARIABLE_ENTORNO] = ruta_traza
+
+
+def desactivar():
+    global _ruta_traza
+    _ruta_traza = None
+    os.environ.pop(VARIABLE_ENTORNO, None)
+
+
+def activa():
+    return _ruta_traza is not None
+
+
+def instrumentar(nombre):
+    """Decorador: acumula llamadas y tiempo de la función en el archivo en curso."""
+    def decorador(fn):
+        @functools.wraps(fn)
+        def envoltura(*args, **kwargs):
+            registro = _actual
+            if registro is None:
+                return fn(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                datos = registro["funciones"][nombre]
+                datos[0] += 1
+                datos[1] += time.perf_counter() - t0
+        return envoltura
+    return decorador
+
+
+def rama(nombre, veces=1):
+    """Cuenta que se tomó la rama `nombre` (p. ej. un respaldo o una búsqueda agresiva)."""
+    if _actual is not None:
+        _actual["ramas"][nombre] += veces
+
+
+@contextlib.contextmanager
+def _medir_archivo(nombre):
+    global _actual
+    anterior = _actual
+    registro = {
+        "funciones": collections.defaultdict(lambda: [0, 0.0]),
+        "ramas": collections.Counter(),
+    }
+    _actual = registro
+    t0 = time.perf_counter()
+    try:
+        yield registro
+    finally:
+        total = time.perf_counter() - t0
+        _actual = anterior
+        linea = {
+            "archivo": nombre,
+            "pid": os.getpid(),
+            "total_s": round(total, 6),
+            "funciones": {k: {"llamadas": n, "total_s": round(t, 6)} for k, (n, t) in registro["funciones"].items()},
+            "ramas": dict(registro["ramas"]),
+        }
+        # una línea por archivo en modo append: los procesos del pool comparten la traza
+        with open(_ruta_traza, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(linea, ensure_ascii=False) + "\n")
+
+
+def archivo(nombre):
+    """Contexto que mide un archivo completo; no-op si la instrumentación está desactivada."""
+    if _ruta_traza is None:
+        return contextlib.nullcontext()
+    return _medir_archivo(nombre)
+
+
+def resumen(ruta_traza, n=10):
+    """Los `n` archivos más lentos de la traza (dicts de la traza, de mayor a menor tiempo)."""
+    registros = []
+    with open(ruta_traza, encoding="utf-8") as fh:
+        for linea in fh:
+            if linea.strip():
+                registros.append(json.loads(linea))
+    registros.sort(key=lambda r: r["total_s"], reverse=True)
+    return registros[:n]
+
+
+def imprimir_resumen(ruta_traza, n=10):
+    lentos = resumen(ruta_traza, n)
+    print(f"Archivos más lentos (traza completa en {ruta_traza}):")
+    for r in lentos:
+        funciones = sorted(r["funciones"].items(), key=lambda kv: kv[1]["total_s"], reverse=True)
+        detalle = ", ".join(f"{k} {v['total_s']:.3f}s/{v['llamadas']}" for k, v in funciones[:3])
+        ramas = ", ".join(f"{k}={v}" for k, v in sorted(r["ramas"].items()))
+        print(f"  {r['total_s']:8.3f}s  {r['archivo']}  [{detalle}]" + (f"  ramas: {ramas}" if ramas else ""))
@@ -0,0 +1,80 @@
+"""Manifiesto de archivos ya procesados para la re-extracción incremental.
+
+Por cada archivo guarda mtime, tamaño, SHA-256 y la versión del extractor que lo
+procesó. Un archivo se considera sin cambios si la versión coincide y además
+coinciden mtime y tamaño, o, si estos cambiaron (p. ej. al copiar la carpeta),
+coincide el hash del contenido. Los archivos pueden ser PDFs o miembros de un ZIP
+(ver entrada_zip); un miembro toma el mtime de su ZIP, y si solo cambió este se
+compara el CRC-32 del directorio central en lugar de descomprimirlo para el hash.
+"""
+import json
+import os
+
+try:
+    from src.entrada_zip import crc_entrada, estado_entrada, hash_entrada
+except ImportError:  # ejecución directa: python src/<script>.py
+    from entrada_zip import crc_entrada, estado_entrada, hash_entrada
+
+
+class Manifiesto:
+    def __init__(self, ruta, version, archivos=None):
+        self.ruta = ruta
+        self.version = version
+        self.archivos = archivos or {}
+
+    @classmethod
+    def cargar(cls, ruta, version):
+        """Lee el manifiesto de `ruta`; si no existe o está dañado devuelve uno vacío."""
+        try:
+            with open(ruta, encoding="utf-8") as fh:
+                datos = json.load(fh)
+            archivos = datos.get("archivos", {})
+        except (OSError, ValueError):
+            archivos = {}
+        return cls(ruta, version, archivos)
+
+    def sin_cambios(self, clave, path):
+        """True si `path` ya fue procesado con esta versión y no cambió desde entonces."""
+        entrada = self.archivos.get(clave)
+        if not entrada or entrada.get("version") != self.version:
+            return False
+        mtime, size = estado_entrada(path)
+        if entrada.get("mtime") == mtime and entrada.get("size") == size:
+            return True
+        if entrada.get("size") != size:
+            return False
+        crc = crc_entrada(path)
+        if crc is not None and "crc32" in entrada:
+            if crc != entrada["crc32"]:
+                return False
+        elif hash_entrada(path) != entrada.get("sha256"):
+            return False
+        # mismo contenido con otra fecha: actualizar para no volver a calcular el hash
+        entrada["mtime"] = mtime
+        return True
+
+    def registrar(self, clave, path, sha256=None):
+        mtime, size = estado_entrada(path)
+        self.archivos[clave] = {
+            "mtime": mtime,
+            "size": size,
+            "sha256": sha256 or hash_entrada(path),
+            "version": self.version,
+        }
+        crc = crc_entrada(path)
+        if crc is not None:
+            self.archivos[clave]["crc32"] = crc
+
+    def olvidar(self, clave):
+        self.archivos.pop(clave, None)
+
+    def guardar(self, claves_vigentes=None):
+        """Escribe el manifiesto; con `claves_vigentes` descarta los archivos eliminados."""
+        if claves_vigentes is not None:
+            vigentes = set(claves_vigentes)
+            self.archivos = {k: v for k, v in self.archivos.items() if k in vigentes}
+        os.makedirs(os.path.dirname(os.path.abspath(self.ruta)), exist_ok=True)
+        tmp = f"{self.ruta}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump({"version": self.version, "archivos": self.archivos}, fh, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp, self.ruta)
@@ -9,9 +9,9 @@ def clean_id(raw_id: str) -> str:
         return ""
     s = raw_id.strip()
     # quitar prefijos comunes
-    s = re.sub(r"^(FISCAL[:\s]*|RFC[:\s]*|R\.F\.C[:\s]*|ID[:\s]*|ID\.?\s*FISCAL[:\s]*)", "", s, flags=re.IGNORECASE)
+    s = PREFIJO_ID_RE.sub("", s)
     # tomar el primer token que parezca un RFC/ID (alfanumérico, guiones, ampersand)
-    m = re.search(r"([A-Z0-9&\-]{6,20})", s.upper())
+    m = TOKEN_ID_RE.search(s.upper())
     if m:
         return m.group(1).strip()
     # fallback: devolver la cadena limpia corta
@@ -22,18 +22,12 @@ def clean_nombre(raw_nombre: str) -> str:
         return ""
     s = raw_nombre.strip()
     # eliminar encabezados repetidos que a veces aparecen dentro del valor
-    s = re.sub(r"NOMBRE[,\s]*DENOMINACION O RAZON SOCIAL[:\s]*", "", s, flags=re.IGNORECASE)
-    s = re.sub(r"NOMBRE O RAZ\.? SOC\.?[:\s]*", "", s, flags=re.IGNORECASE)
+    s = ETIQUETA_NOMBRE_RE.sub("", s)
+    s = ETIQUETA_RAZ_SOC_RE.sub("", s)
     # cortar en la aparición de secciones/etiquetas que no forman parte del nombre
-    cut_patterns = [
-        r"RFC[:\s]", r"NUMERO DE SERIE", r"NUMERO DE SERIE DEL CERTIFICADO", r"E\.FIRMA", r"e\.firma",
-        r"EL PAGO DE LAS CONTRIBUCIONES", r"SERVICIO DE PAGO", r"APODERADO", r"AGENTE ADUANAL",
-        r"ADUANAL", r"CURP[:\s]", r"NUMERO[:\s]", r"NOMBRE O RAZ\. SOC\.", r"AGENCIA NOMBRE",
-        r"RFC\s*:", r"RFC\b"
-    ]
     earliest = None
-    for pat in cut_patterns:
-        m = re.search(pat, s, flags=re.IGNORECASE)
+    for pat in CORTES_NOMBRE_RE:
+        m = pat.search(s)
         if m:
             pos = m.start()
             if earliest is None or pos < earliest:
@@ -42,9 +36,9 @@ def clean_nombre(raw_nombre: str) -> str:
         s = s[:earliest].strip(' ,;:\n')
     # quitar tokens que son claramente códigos al final o principio
     # eliminar secuencias largas de base64 u otros bloques extraños
-    s = re.sub(r"[A-Za-z0-9+/=]{40,}", "", s)
+    s = BASE64_RE.sub("", s)
     # limpiar espacios redundantes y símbolos finales
-    s = re.sub(r"\s{2,}", " ", s).strip(' ,;:\n')
+    s = ESPACIOS_RE.sub(" ", s).strip(' ,;:\n')
     return s
 
 def extract_id_from_nombre(raw_nombre: str):
@@ -53,22 +47,21 @@ def extract_id_from_nombre(raw_nombre: str):
         return "", raw_nombre
     s = raw_nombre.strip()
     # buscar token inicial que combine letras (1-3) seguido de dígitos (con espacios/guiones posibles), o token alfanum largo
-    m = re.match(r"^([A-Z]{1,3}[\s\-]*[0-9][0-9\s\-]{4,20})\b", s, flags=re.IGNORECASE)
+    m = ID_INICIAL_RE.match(s)
     if not m:
-        m = re.match(r"^([A-Z0-9&\-]{6,20})\b", s, flags=re.IGNORECASE)
+        m = TOKEN_ID_INICIAL_RE.match(s)
     if m:
-        id_token = re.sub(r"[\s\-]", "", m.group(1).strip())
+        id_token = SEPARADORES_ID_RE.sub("", m.group(1).strip())
         rest = s[m.end():].strip(' ,;:')
         return id_token, rest
     return "", raw_nombre
 
 # Extracción precisa: ID_FISCAL y NOMBRE de la cabecera, VAL_DOLARES de la tabla de facturas
 def extraer_datos_proveedor_preciso(texto):
-    import re
     lines = [l.rstrip() for l in texto.splitlines() if l.strip()]
     idx_cab = -1
     for i, line in enumerate(lines):
-        if re.search(r"DATOS DEL PROVEEDOR O COMPRADOR", line, re.IGNORECASE):
+        if DATOS_PROVEEDOR_RE.search(line):
             idx_cab = i
             break
     id_fiscal = []
@@ -78,21 +71,16 @@ def extraer_datos_proveedor_preciso(texto):
         # Buscar la línea de etiquetas
         for j in range(idx_cab+1, min(idx_cab+8, len(lines))):
             l = lines[j]
-            if re.search(r"ID[.]:? ?FISCAL", l) and re.search(r"NOMBRE,? ?DENOMINACION O RAZON SOCIAL", l):
+            if ETIQUETA_ID_FISCAL_RE.search(l) and ETIQUETA_DENOMINACION_RE.search(l):
                 etiquetas_idx = j
                 break
     # Extraer ID_FISCAL y NOMBRE de todas las líneas debajo de la cabecera, segmentando por columnas
     if etiquetas_idx != -1:
         etiquetas_line = lines[etiquetas_idx]
         # Buscar posiciones de inicio y fin de cada etiqueta
-        etiquetas = [
-            ("ID_FISCAL", r"ID[.]:? ?FISCAL"),
-            ("NOMBRE", r"NOMBRE,? ?DENOMINACION O RAZON SOCIAL"),
-            ("DOMICILIO", r"DOMICILIO")
-        ]
         campos = {}
-        for idx, (key, pattern) in enumerate(etiquetas):
-            m = re.search(pattern, etiquetas_line)
+        for idx, (key, pattern) in enumerate(ETIQUETAS_PROVEEDOR):
+            m = pattern.search(etiquetas_line)
             if m:
                 campos[key] = [m.start(), None]
         keys = [k for k in campos]
@@ -101,14 +89,14 @@ def extraer_datos_proveedor_preciso(texto):
         if keys:
             campos[keys[-1]][1] = len(etiquetas_line)
         # Palabras clave típicas de domicilio para filtrar
-        patrones_domicilio = re.compile(r"CALLE|BLVD|AV\.|SUITE|BUILD|NO\.|STREET|COL\.|EDIFICIO|C\.P\.|PO BOX|NUMERO|NUM\.|APARTADO|DEPARTAMENTO|FLOOR|PISO|BARRIO|URB\.|MZ|LOTE|INT|EXT|ZONA|SECTOR|LOCAL|PLANTA|INTERIOR|EXTERIOR|CITY|CIUDAD|ESTADO|STATE|COUNTRY|PAIS|ZIP|POSTAL|CODIGO|CP|MUNICIPIO|DELEGACION|COLONIA|DIRECCION|DIR\.", re.IGNORECASE)
+        patrones_domicilio = DOMICILIO_BASICO_RE
         k = etiquetas_idx + 1
         lineas_consideradas = 0
         max_lineas = 3
         while k < len(lines) and lineas_consideradas < max_lineas:
             l = lines[k]
             # Si la línea es vacía o parece una nueva sección, detener
-            if not l.strip() or re.search(r"CLAVE|NUM\.|FACTURA|VAL\.|PARTIDAS|OBSERVACIONES|PEDIMENTO|ADUANA|TIPO CAMBIO", l, re.IGNORECASE):
+            if not l.strip() or FIN_BLOQUE_PROVEEDOR_RE.search(l):
                 break
             # Evaluar si la línea es mayoritariamente domicilio
             palabras = l.split()
@@ -136,28 +124,20 @@ def extraer_datos_proveedor_preciso(texto):
             k += 1
             lineas_consideradas += 1
     # Unir líneas y limpiar
-    import re
     # Buscar la línea de cabecera de etiquetas
-    import re
     lines = [l.rstrip() for l in texto.splitlines() if l.strip()]
     idx_cab = -1
     for i, line in enumerate(lines):
-        if re.search(r"ID[.]? ?FISCAL.*NOMBRE,? ?DENOMINACION O RAZON SOCIAL.*DOMICILIO.*VINCULACION", line, re.IGNORECASE):
+        if CABECERA_PROVEEDOR_RE.search(line):
             idx_cab = i
             break
     id_fiscal_str = nombre_str = ""
     if idx_cab != -1 and idx_cab+1 < len(lines):
         etiquetas_line = lines[idx_cab]
         # Buscar posiciones de inicio y fin de cada etiqueta
-        etiquetas = [
-            ("ID_FISCAL", r"ID[.]? ?FISCAL"),
-            ("NOMBRE", r"NOMBRE,? ?DENOMINACION O RAZON SOCIAL"),
-            ("DOMICILIO", r"DOMICILIO"),
-            ("VINCULACION", r"VINCULACION")
-        ]
         campos = {}
-        for idx, (key, pattern) in enumerate(etiquetas):
-            m = re.search(pattern, etiquetas_line)
+        for idx, (key, pattern) in enumerate(ETIQUETAS_PROVEEDOR_VINCULACION):
+            m = pattern.search(etiquetas_line)
             if m:
                 campos[key] = [m.start(), None]
         keys = [k for k in campos]
@@ -166,8 +146,8 @@ def extraer_datos_proveedor_preciso(texto):
         if keys:
             campos[keys[-1]][1] = len(etiquetas_line)
         # Palabras clave para detectar domicilio o fin de sección
-        patron_domicilio = re.compile(r"CALLE|BLVD|AV\.|SUITE|BUILD|NO\.|STREET|COL\.|EDIFICIO|C\.P\.|PO BOX|NUMERO|NUM\.|APARTADO|DEPARTAMENTO|FLOOR|PISO|BARRIO|URB\.|MZ|LOTE|INT|EXT|ZONA|SECTOR|LOCAL|PLANTA|INTERIOR|EXTERIOR|CITY|CIUDAD|ESTADO|STATE|COUNTRY|PAIS|ZIP|POSTAL|CODIGO|CP|MUNICIPIO|DELEGACION|COLONIA|DIRECCION|DIR\.|DRIVE|REINO UNIDO|GRAN BRETAÑA|CHN|SCIENCE|VAL|NB|XINGONG|ABINGDON|CYNON|RUCT|SHENZHEN|UNIDO|LIMITED|LTD\.|CO\.|S\.A\.|ER|EAST|WEST|NORTE|SUR|NORTH|SOUTH", re.IGNORECASE)
-        patron_seccion = re.compile(r"NUM\.|CLAVE|FACTURA|OBSERVACIONES|PARTIDAS|DESCARGOS|AGENTE|CURP|RFC|FECHA|MONEDA|VAL\.|TASA|TIPO|PEDIMENTO|OPER|CVE|APODERADO|ADUANAL|DESTINO|USUARIO|COPIA|CERTIFICADO|e\.firma", re.IGNORECASE)
+        patron_domicilio = DOMICILIO_RE
+        patron_seccion = SECCION_PROVEEDOR_RE
         id_fiscal_parts = []
         nombre_parts = []
         k = idx_cab + 1
@@ -213,7 +193,7 @@ def extraer_datos_proveedor_preciso(texto):
         nombre_str = " ".join(nombre_parts).replace("  ", " ").strip()
         # Post-procesamiento: intentar extraer ID fiscal robusto (dígitos y guiones)
         if id_fiscal_str:
-            m_id = re.search(r"\b[0-9\-]{6,}\b", id_fiscal_str)
+            m_id = ID_NUMERICO_RE.search(id_fiscal_str)
             if m_id:
                 id_fiscal_str = m_id.group(0)
         # Limpiar nombre: si contiene fragmentos de domicilio al final, cortar en la primera palabra clave completa
@@ -303,109 +283,497 @@ def extraer_datos_proveedor(texto):
             id_fiscal = clean_id(ext_id)
             nombre = clean_nombre(new_nombre)
     return id_fiscal, nombre, domicilio.strip(), val_dolares.strip()
-import pandas as pd
+# pandas y pdfplumber se importan donde se usan (ver extraer_datos_completos y
+# PedimentoDocument._abrir): extraer un documento no necesita pandas, y un documento
+# que sale entero de la caché de páginas tampoco necesita pdfplumber
+import numpy as np
+import math
 import re
-import pdfplumber
+import csv
 import glob
+import io
 import os
+import zipfile
+import contextlib
+import collections
+import concurrent.futures
+import itertools
 
-def extraer_texto_pdf(pdf_path):
-    texto = ""
-    with pdfplumber.open(pdf_path) as pdf:
-        for page in pdf.pages:
-            t = page.extract_text() or ""
-            texto += t + "\n"
-    return texto
-
-
-def extraer_datos_proveedor_por_posicion(pdf_path):
-    """Extrae ID_FISCAL y NOMBRE usando coordenadas (más robusto para desbordes y multilíneas)."""
-    import math
-    claves_seccion = [r"ID", r"FISCAL", r"NOMBRE", r"DOMICILIO"]
-    with pdfplumber.open(pdf_path) as pdf:
-        for page in pdf.pages:
-            words = page.extract_words()
+try:
+    from src import (almacen_sqlite, cache_paginas, clasificador, entrada_zip, escritor_salida, instrumentacion,
+                     manifiesto, pedimentos_xml, registro_layouts, tabla_palabras)
+except ImportError:  # ejecución directa: python src/mapear_campos.py
+    import almacen_sqlite
+    import cache_paginas
+    import clasificador
+    import entrada_zip
+    import escritor_salida
+    import instrumentacion
+    import manifiesto
+    import pedimentos_xml
+    import registro_layouts
+    import tabla_palabras
+
+# Registro de patrones: todas las expresiones regulares de las heurísticas se compilan una sola
+# vez al importar el módulo, para que los bucles por línea/palabra no paguen compilación ni la
+# búsqueda en la caché interna de `re`.
+# Limpieza de ID y nombre
+PREFIJO_ID_RE = re.compile(r"^(FISCAL[:\s]*|RFC[:\s]*|R\.F\.C[:\s]*|ID[:\s]*|ID\.?\s*FISCAL[:\s]*)", re.I)
+TOKEN_ID_RE = re.compile(r"([A-Z0-9&\-]{6,20})")
+ETIQUETA_NOMBRE_RE = re.compile(r"NOMBRE[,\s]*DENOMINACION O RAZON SOCIAL[:\s]*", re.I)
+ETIQUETA_RAZ_SOC_RE = re.compile(r"NOMBRE O RAZ\.? SOC\.?[:\s]*", re.I)
+CORTES_NOMBRE_RE = [re.compile(pat, re.I) for pat in (
+    r"RFC[:\s]", r"NUMERO DE SERIE", r"NUMERO DE SERIE DEL CERTIFICADO", r"E\.FIRMA", r"e\.firma",
+    r"EL PAGO DE LAS CONTRIBUCIONES", r"SERVICIO DE PAGO", r"APODERADO", r"AGENTE ADUANAL",
+    r"ADUANAL", r"CURP[:\s]", r"NUMERO[:\s]", r"NOMBRE O RAZ\. SOC\.", r"AGENCIA NOMBRE",
+    r"RFC\s*:", r"RFC\b",
+)]
+BASE64_RE = re.compile(r"[A-Za-z0-9+/=]{40,}")
+ESPACIOS_RE = re.compile(r"\s{2,}")
+ID_INICIAL_RE = re.compile(r"^([A-Z]{1,3}[\s\-]*[0-9][0-9\s\-]{4,20})\b", re.I)
+TOKEN_ID_INICIAL_RE = re.compile(r"^([A-Z0-9&\-]{6,20})\b", re.I)
+SEPARADORES_ID_RE = re.compile(r"[\s\-]")
+ID_NUMERICO_RE = re.compile(r"\b[0-9\-]{6,}\b")
+
+# Sección DATOS DEL PROVEEDOR O COMPRADOR
+DATOS_PROVEEDOR_RE = re.compile(r"DATOS DEL PROVEEDOR O COMPRADOR", re.I)
+ETIQUETA_ID_FISCAL_RE = re.compile(r"ID[.]:? ?FISCAL")
+ETIQUETA_DENOMINACION_RE = re.compile(r"NOMBRE,? ?DENOMINACION O RAZON SOCIAL")
+ETIQUETAS_PROVEEDOR = [
+    ("ID_FISCAL", ETIQUETA_ID_FISCAL_RE),
+    ("NOMBRE", ETIQUETA_DENOMINACION_RE),
+    ("DOMICILIO", re.compile(r"DOMICILIO")),
+]
+ETIQUETAS_PROVEEDOR_VINCULACION = [
+    ("ID_FISCAL", re.compile(r"ID[.]? ?FISCAL")),
+    ("NOMBRE", ETIQUETA_DENOMINACION_RE),
+    ("DOMICILIO", re.compile(r"DOMICILIO")),
+    ("VINCULACION", re.compile(r"VINCULACION")),
+]
+CABECERA_PROVEEDOR_RE = re.compile(r"ID[.]? ?FISCAL.*NOMBRE,? ?DENOMINACION O RAZON SOCIAL.*DOMICILIO.*VINCULACION", re.I)
+DOMICILIO_BASICO_RE = re.compile(r"CALLE|BLVD|AV\.|SUITE|BUILD|NO\.|STREET|COL\.|EDIFICIO|C\.P\.|PO BOX|NUMERO|NUM\.|APARTADO|DEPARTAMENTO|FLOOR|PISO|BARRIO|URB\.|MZ|LOTE|INT|EXT|ZONA|SECTOR|LOCAL|PLANTA|INTERIOR|EXTERIOR|CITY|CIUDAD|ESTADO|STATE|COUNTRY|PAIS|ZIP|POSTAL|CODIGO|CP|MUNICIPIO|DELEGACION|COLONIA|DIRECCION|DIR\.", re.I)
+DOMICILIO_RE = re.compile(r"CALLE|BLVD|AV\.|SUITE|BUILD|NO\.|STREET|COL\.|EDIFICIO|C\.P\.|PO BOX|NUMERO|NUM\.|APARTADO|DEPARTAMENTO|FLOOR|PISO|BARRIO|URB\.|MZ|LOTE|INT|EXT|ZONA|SECTOR|LOCAL|PLANTA|INTERIOR|EXTERIOR|CITY|CIUDAD|ESTADO|STATE|COUNTRY|PAIS|ZIP|POSTAL|CODIGO|CP|MUNICIPIO|DELEGACION|COLONIA|DIRECCION|DIR\.|DRIVE|REINO UNIDO|GRAN BRETAÑA|CHN|SCIENCE|VAL|NB|XINGONG|ABINGDON|CYNON|RUCT|SHENZHEN|UNIDO|LIMITED|LTD\.|CO\.|S\.A\.|ER|EAST|WEST|NORTE|SUR|NORTH|SOUTH", re.I)
+FIN_BLOQUE_PROVEEDOR_RE = re.compile(r"CLAVE|NUM\.|FACTURA|VAL\.|PARTIDAS|OBSERVACIONES|PEDIMENTO|ADUANA|TIPO CAMBIO", re.I)
+SECCION_PROVEEDOR_RE = re.compile(r"NUM\.|CLAVE|FACTURA|OBSERVACIONES|PARTIDAS|DESCARGOS|AGENTE|CURP|RFC|FECHA|MONEDA|VAL\.|TASA|TIPO|PEDIMENTO|OPER|CVE|APODERADO|ADUANAL|DESTINO|USUARIO|COPIA|CERTIFICADO|e\.firma", re.I)
+ID_FISCAL_RE = re.compile(r"ID\.?\s*FISCAL", re.I)
+# palabra que debe tener una línea para que ID_FISCAL_RE la encuentre
+FISCAL_RE = re.compile(r"FISCAL", re.I)
+NOMBRE_RE = re.compile(r"NOMBRE", re.I)
+ID_PREFIJO_RE = re.compile(r"ID\.?")
+FIN_PROVEEDOR_RE = re.compile(r"NUM\.|FACTURA|PARTIDAS|OBSERVACIONES|PEDIMENTO|ANEXO|CLAVE", re.I)
+
+# Cabecera del pedimento
+PEDIMENTO_RE = re.compile(r"PEDIMENTO", re.I)
+PARTIDAS_RE = re.compile(r"PARTIDAS", re.I)
+NUM_PEDIMENTO_RE = re.compile(r"NUM[\.]?\s*PEDIMENTO\s*:?\s*([\d\s-]+)", re.I)
+NUMERO_LARGO_RE = re.compile(r"\b(\d{7,})\b")
+TIPO_CAMBIO_RE = re.compile(r"TIPO\s*CAMBIO\s*:?\s*([\d.,]+)", re.I)
+ADUANA_RE = re.compile(r"ADUANA[\sE/S]*:?\s*(\d+)", re.I)
+
+# Partidas y descripciones
+# Texto que debe aparecer en una página para que los extractores por posición encuentren
+# su línea de cabecera (ver PedimentoDocument.tiene_anclas)
+ANCLAS_PROVEEDOR = ("FISCAL", "NOMBRE")
+ANCLAS_PARTIDAS = ("SEC", "FRACCION", "DESCRIPCION")
+OCHO_DIGITOS_RE = re.compile(r"\b\d{8}\b")
+FIN_PARTIDAS_RE = re.compile(r'FIN DE PEDIMENTO|\*{4,}|OBSERVACIONES A NIVEL PARTIDA', re.I)
+# tras la página que lo contiene solo hay anexos: no se buscan más partidas
+FIN_PEDIMENTO_RE = re.compile(r'FIN DE PEDIMENTO', re.I)
+FRACCION_8_RE = re.compile(r"^\d{8}$")
+IGI_INCRUSTADO_RE = re.compile(r"\bIGI\s*([0-9]+\.[0-9]{5})\b", re.I)
+IVA_INCRUSTADO_RE = re.compile(r"\bIVA\s*([0-9]+\.[0-9]{5})\b", re.I)
+META_DESCRIPCION_RE = re.compile(r"\b(IDENTIF|COMPLEMENTO|SERIES:|SERIE|GUIA|ORDEN\s+EMBARQUE|RFC:|E\.FIRMA|NUMERO DE SERIE|NO ES LA DESCRIPCION|ESTO NO ES LA DESCRIPCION)\b", re.I)
+META_RECUPERAR_RE = re.compile(r"\b(?:IDENTIF|COMPLEMENTO|SERIES:|GUIA|ORDEN\s+EMBARQUE|RFC:|E\.FIRMA|NUMERO DE SERIE|NO ES LA DESCRIPCION|ESTO NO ES LA DESCRIPCION)\b", re.I)
+META_TEXTO_RE = re.compile(r"\b(GUIA|ORDEN\s+EMBARQUE|RFC:|E\.FIRMA|NUMERO DE SERIE|SERIES:|NO ES LA DESCRIPCION|ESTO NO ES LA DESCRIPCION)\b", re.I)
+NO_DESCRIPCION_RE = re.compile(r"\b(MARCA|MODELO|IDENTIF|IDENTIFICADOR|COMPLEMENTO|OBSERVACIONES|SERIES|SERIE|No\.|FACTURA|PARTIDA|CLAVE|NUMERO|LOTE|CLAVE NUM|GUIA|ORDEN\s+EMBARQUE|RFC|E\.FIRMA|NUMERO DE SERIE|NO ES LA DESCRIPCION|ESTO NO ES LA DESCRIPCION)\b", re.I)
+NO_DESCRIPCION_RECUPERACION_RE = re.compile(r"\b(CLAVE|NUM\.|MARCA|MODELO|CODIGO|PRODUCTO|CLAVE NUM|OBSERVACIONES|IDENTIF|IDENTIFICADOR|COMPLEMENTO|SERIES|SERIE|GUIA|ORDEN\s+EMBARQUE|RFC|E\.FIRMA|NUMERO DE SERIE|NO ES LA DESCRIPCION|ESTO NO ES LA DESCRIPCION)\b", re.I)
+META_SIGUIENTE_RE = re.compile(r"\b(MARCA|MODELO|IDENT|COMPLEMENTO|OBSERVACIONES|No\.|FACTURA|PARTIDA)\b", re.I)
+BLOQUE_MARCA_MODELO_RE = re.compile(r"\b(MARCA|MODELO|IDENTIFICACION|COMPLEMENTO)\b[:\s0-9A-Z\-]*", re.I)
+PALABRA_ALFA_RE = re.compile(r"[A-Za-zÀ-ÖØ-öø-ÿ]+")
+LETRA_RE = re.compile(r"[A-Za-zÀ-ÖØ-öø-ÿ]")
+PALABRA_RE = re.compile(r"\w+")
+TOKEN_RE = re.compile(r"\S+")
+CODIGOS_INICIALES_RE = re.compile(r'^[\d\W_,.:;-]+')
+LINEA_IMPUESTO_RE = re.compile(r"^\s*(IVA|IGI)\b", re.I)
+SOLO_NUMEROS_RE = re.compile(r"^[0-9,\.\-]+$")
+SEPARADOR_COMA_RE = re.compile(r",\s*")
+# especificación del respaldo por texto; se evalúa con iterar_partidas_texto
+PARTIDAS_TEXTO_RE = re.compile(
+    r"(\d+)\s+(\d{8}).*?\n"                # SEC y FRACCION
+    r"(.*?)\s+\d+\s+\d+\s+[\d.]+\n"        # DESCRIPCION
+    r".*?IGI\s+([\d.]+)",                  # Tasa IGI
+    re.DOTALL
+)
+TOKEN_PARTIDA_RE = re.compile(r"(?P<esp>\s+)|(?P<dig>\d+)|(?P<pto>\.+)|(?P<otro>[^\s\d.]+)")
+
+# Recuperación de ID_FISCAL truncado
+POSIBLE_ID_RE = re.compile(r"[A-Z]{1,3}[\s\-]*[0-9][0-9\s\-]{4,20}", re.I)
+ID_Y_NOMBRE_SOCIEDAD_RE = re.compile(r"([A-Z]{1,3}[\s\-]*[0-9][0-9\s\-]{4,20})\s+([A-Z0-9&\- ]{2,80}?\b(?:LIMITED|LTD|INC|LLC|S\.A\.|SA)\b)", re.I)
+SUFIJOS_SOCIEDAD_RE = [re.compile(rf"^{suf}$", re.I) for suf in ("LIMITED", "LTD", "INC", "LLC", r"S\.A", "SA")]
+SOLO_SUFIJO_RE = re.compile(r"^(LIMITED|LTD|INC|LLC|S\.A\.|SA)$", re.I)
+DIGITO_RE = re.compile(r"\d")
+NO_DIGITOS_RE = re.compile(r"\D")
+COMA_O_SALTO_RE = re.compile(r",|\n")
+
+# Versión de las heurísticas de extracción. Subirla cuando un cambio altere las filas
+# generadas, para que la re-extracción incremental vuelva a procesar todos los PDFs.
+EXTRACTOR_VERSION = "1"
+
+# Columnas del CSV consolidado, en orden.
+COLUMNAS_SALIDA = [
+    "NUM_PEDIMENTO", "TIPO_CAMBIO", "ADUANA", "ID_FISCAL", "NOMBRE_DENOMINACION_O_RAZON_SOCIAL",
+    "SEC", "FRACCION", "DESCRIPCION", "TASA_IGI", "Archivo",
+]
+
+# Fuentes que pdfminer puede memorizar por documento antes de vaciar su caché
+# (ver PedimentoDocument._liberar_pagina)
+MAX_FUENTES_EN_CACHE = 32
+
+class PedimentoDocument:
+    """PDF de pedimento abierto una sola vez.
+
+    El texto y las palabras de cada página se extraen bajo demanda y se memorizan,
+    de modo que todas las funciones de extracción comparten el mismo análisis de
+    layout de pdfplumber. Las funciones que aceptan una ruta también aceptan una
+    instancia de esta clase.
+
+    Con `cache` (un `cache_paginas.CachePaginas`) el documento se busca primero por
+    el SHA-256 del archivo; si hay entrada, el PDF no se abre salvo que se pida el
+    texto o las palabras de una página que no se habían extraído. Al cerrar se guarda
+    la entrada con lo extraído hasta ese momento: las páginas que ningún extractor
+    necesitó (anexos, e.firma) no pasan por pdfplumber.
+
+    `pdf_path` también puede ser un entrada_zip.MiembroZip: su contenido se
+    descomprime a memoria (calculando el hash) y pdfplumber lo lee de ahí.
+
+    `layouts` es el registro de layouts de cabecera (ver registro_layouts) que usan
+    los extractores por posición; con caché se guarda junto a ella al cerrar.
+    """
+
+    def __init__(self, pdf_path, cache=None):
+        self.pdf_path = pdf_path
+        self.nombre = entrada_zip.nombre_entrada(pdf_path)
+        self._cache = cache
+        self._sha256 = None
+        self._contenido = None
+        if isinstance(pdf_path, entrada_zip.MiembroZip):
+            self._contenido, self._sha256 = pdf_path.leer()
+        self._pdf = None
+        self._textos = {}
+        self._palabras = {}
+        self._indices = {}
+        self._texto = None
+        self._num_paginas = None
+        self._pendiente_cache = False
+        self.desde_cache = False
+        self.layouts = registro_layouts.para_directorio(cache.directorio if cache is not None else None)
+        if cache is not None:
+            guardado = cache.obtener(self.sha256)
+            if guardado is not None:
+                textos, palabras = guardado
+                self._textos = {i: t for i, t in enumerate(textos) if t is not None}
+                self._palabras = {i: w for i, w in enumerate(palabras) if w is not None}
+                self._num_paginas = len(textos)
+                self.desde_cache = True
+                return
+        self._abrir()
+        self._num_paginas = len(self._pdf.pages)
+
+    def _abrir(self):
+        if self._pdf is None:
+            import pdfplumber
+            origen = self.pdf_path if self._contenido is None else io.BytesIO(self._contenido)
+            self._pdf = pdfplumber.open(origen)
+            # documento nuevo o entrada de caché incompleta: al cerrar se guarda la entrada
+            self._pendiente_cache = True
+
+    @property
+    def sha256(self):
+        if self._sha256 is None:
+            self._sha256 = cache_paginas.hash_archivo(self.pdf_path)
+        return self._sha256
+
+    @property
+    def num_paginas(self):
+        return self._num_paginas
+
+    def texto_pagina(self, i):
+        if i not in self._textos:
+            self._analizar_pagina(i)
+        return self._textos[i]
+
+    def palabras_pagina(self, i):
+        """Palabras de la página `i` como TablaPalabras (texto, x0 y top en columnas)."""
+        if i not in self._palabras:
+            if i not in self._textos:
+                self._analizar_pagina(i)
+            if i not in self._palabras:
+                # su texto no tenía anclas (o venía de la caché): hay que volver a analizarla
+                self._palabras[i] = self._extraer_palabras(i)
+                self._liberar_pagina(i)
+        return self._palabras[i]
+
+    def _analizar_pagina(self, i):
+        """Extrae el texto de la página `i` y, si algún extractor puede necesitarlas, sus palabras.
+
+        Ambas salen del mismo análisis de pdfplumber, que se libera enseguida: el
+        documento solo conserva texto y palabras, así que la memoria no crece con el
+        número de páginas (volver a analizar una página cuesta mucho más que extraer
+        unas palabras que luego no se usen).
+        """
+        texto = self._extraer_texto(i)
+        self._textos[i] = texto
+        if _puede_necesitar_palabras(texto):
+            self._palabras[i] = self._extraer_palabras(i)
+        self._liberar_pagina(i)
+
+    def _liberar_pagina(self, i):
+        # borra chars/objetos/layout que pdfplumber memoriza en la página
+        if self._pdf is not None:
+            self._pdf.pages[i].close()
+            # pdfminer memoriza cada fuente (con su programa embebido ya descomprimido) y
+            # cada objeto leído; en un pedimento consolidado con fuentes propias por
+            # página eso crece sin límite, así que se vacía al pasar de un tope. Son
+            # atributos privados (comprobados con pdfminer.six 20231228): si una versión
+            # los renombra solo se pierde esta optimización
+            fuentes = getattr(self._pdf.rsrcmgr, "_cached_fonts", None)
+            if fuentes is not None and len(fuentes) > MAX_FUENTES_EN_CACHE:
+                fuentes.clear()
+                objetos = getattr(self._pdf.doc, "_cached_objs", None)
+                if objetos is not None:
+                    objetos.clear()
+
+    def tiene_anclas(self, i, anclas):
+        """True si el texto de la página `i` contiene todas las `anclas` (en mayúsculas).
+
+        Cada palabra de una página aparece tal cual en su texto, así que una página sin
+        las anclas tampoco tiene la línea de cabecera que buscan los extractores por
+        posición, y no hace falta extraer sus palabras.
+        """
+        return _tiene_anclas(self.texto_pagina(i).upper(), anclas)
+
+    def indice_pagina(self, i):
+        """Índice espacial (_IndicePalabras) de las palabras de la página `i`, construido una vez."""
+        if i not in self._indices:
+            self._indices[i] = _IndicePalabras(self.palabras_pagina(i))
+        return self._indices[i]
+
+    @instrumentacion.instrumentar("pdfplumber.extract_text")
+    def _extraer_texto(self, i):
+        self._abrir()
+        return self._pdf.pages[i].extract_text() or ""
+
+    @instrumentacion.instrumentar("pdfplumber.extract_words")
+    def _extraer_palabras(self, i):
+        self._abrir()
+        # los dicts de pdfplumber se descartan enseguida: solo se conservan las columnas
+        return tabla_palabras.TablaPalabras.desde_pdfplumber(self._pdf.pages[i].extract_words())
+
+    def iterar_textos(self):
+        """Genera el texto de cada página seguido de "\n", extrayéndolo solo cuando se consume.
+
+        Concatenado da `texto`; los extractores que solo necesitan la cabecera dejan
+        de consumirlo (y de extraer páginas) en cuanto la encuentran.
+        """
+        for i in range(self.num_paginas):
+            yield self.texto_pagina(i) + "\n"
+
+    @property
+    def texto(self):
+        """Texto completo del documento (mismo formato que `extraer_texto_pdf`)."""
+        if self._texto is None:
+            self._texto = "".join(self.iterar_textos())
+        return self._texto
+
+    def _guardar_en_cache(self):
+        paginas = range(self.num_paginas)
+        # None = página no extraída (texto no pedido o página sin anclas)
+        textos = [self._textos.get(i) for i in paginas]
+        palabras = [self._palabras.get(i) for i in paginas]
+        self._cache.guardar(self.sha256, textos, palabras)
+
+    def close(self, guardar=True):
+        if guardar:
+            try:
+                self.layouts.guardar()
+            except OSError:
+                # como la caché, el registro es una optimización
+                pass
+        if self._pdf is None:
+            return
+        try:
+            if guardar and self._cache is not None and self._pendiente_cache:
+                try:
+                    self._guardar_en_cache()
+                except Exception:
+                    # la caché es una optimización: un fallo al escribirla no invalida la extracción
+                    pass
+        finally:
+            self._pdf.close()
+            self._pdf = None
+            self._pendiente_cache = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(guardar=exc_type is None)
+
+
+def _tiene_anclas(texto_mayusculas, anclas):
+    return all(ancla in texto_mayusculas for ancla in anclas)
+
+
+def _puede_necesitar_palabras(texto):
+    """True si algún extractor por posición puede pedir las palabras de una página con este texto.
+
+    Proveedor y partidas solo miran páginas con sus anclas, y la recuperación de
+    descripciones solo páginas que contienen la fracción (8 dígitos sueltos). Si
+    falla, no cambia el resultado: la página se vuelve a analizar al pedirlas.
+    """
+    mayusculas = texto.upper()
+    return (_tiene_anclas(mayusculas, ANCLAS_PROVEEDOR) or _tiene_anclas(mayusculas, ANCLAS_PARTIDAS)
+            or bool(OCHO_DIGITOS_RE.search(texto)))
+
+
+@contextlib.contextmanager
+def _documento(fuente):
+    """Devuelve `fuente` si ya es un PedimentoDocument; si es una ruta, lo abre y lo cierra al salir."""
+    if isinstance(fuente, PedimentoDocument):
+        yield fuente
+    else:
+        with PedimentoDocument(fuente) as doc:
+            yield doc
+
+
+@instrumentacion.instrumentar("extraer_texto_pdf")
+def extraer_texto_pdf(fuente):
+    with _documento(fuente) as doc:
+        return doc.texto
+
+
+def _limites_columnas(fila, columnas):
+    """{nombre: (inicio, fin)} en orden de x0 a partir de las palabras de `fila` que abren cada columna."""
+    ordered = sorted([(k, fila.x0s[pos]) for k, pos in columnas], key=lambda x: x[1])
+    limits = {}
+    for i, (k, x0) in enumerate(ordered):
+        start = x0
+        end = ordered[i+1][1] if i+1 < len(ordered) else float('inf')
+        limits[k] = (start, end)
+    return limits
+
+
+def _cabecera(doc, indice, seccion, detectar):
+    """(fila de cabecera, límites de columna) de `seccion` en la página, o None.
+
+    Primero prueba los layouts conocidos del registro del documento (la primera línea
+    que coincide con alguna huella); si ninguno está en la página, `detectar(indice)`
+    devuelve (fila, columnas) y el layout se aprende.
+    """
+    conocidas = []
+    for huella, columnas in doc.layouts.conocidos(seccion).items():
+        fila = indice.fila_con_huella(huella)
+        if fila is not None:
+            conocidas.append((fila.top, fila, columnas))
+    if conocidas:
+        instrumentacion.rama(f"layouts.{seccion}.conocido")
+        _, fila, columnas = min(conocidas, key=lambda c: c[0])
+        return fila, _limites_columnas(fila, columnas)
+    detectada = detectar(indice)
+    if detectada is None:
+        return None
+    instrumentacion.rama(f"layouts.{seccion}.detectado")
+    fila, columnas = detectada
+    doc.layouts.aprender(seccion, registro_layouts.huella(fila.textos, fila.x0s), columnas)
+    return fila, _limites_columnas(fila, columnas)
+
+
+def _detectar_cabecera_proveedor(indice):
+    """(fila, columnas) de la primera línea con ID y NOMBRE entre las que tienen una palabra con FISCAL."""
+    for linea in indice.lineas_con(FISCAL_RE.search):
+        fila = indice.fila(linea)
+        txt = fila.texto
+        if ID_FISCAL_RE.search(txt) and NOMBRE_RE.search(txt):
+            # Mapear inicio de columnas por palabras clave (posición de la palabra en la línea)
+            cols = {}
+            for pos, texto_palabra in enumerate(fila.textos):
+                ut = texto_palabra.upper()
+                if "ID" in ut and "FISCAL" in ut or ID_PREFIJO_RE.search(ut):
+                    cols["ID_FISCAL"] = pos
+                if "NOMBRE" in ut:
+                    cols["NOMBRE"] = pos
+                if "DOMICILIO" in ut:
+                    cols["DOMICILIO"] = pos
+                if "VINCULACION" in ut:
+                    cols["VINCULACION"] = pos
+            # Necesitamos al menos ID y NOMBRE
+            if "ID_FISCAL" in cols and "NOMBRE" in cols:
+                return fila, tuple(cols.items())
+    return None
+
+
+@instrumentacion.instrumentar("extraer_datos_proveedor_por_posicion")
+def extraer_datos_proveedor_por_posicion(fuente):
+    """Extrae ID_FISCAL y NOMBRE usando coordenadas (más robusto para desbordes y multilíneas).
+    `fuente` puede ser una ruta o un PedimentoDocument ya abierto.
+    """
+    with _documento(fuente) as doc:
+        for num_pag in range(doc.num_paginas):
+            if not doc.tiene_anclas(num_pag, ANCLAS_PROVEEDOR):
+                continue
+            words = doc.palabras_pagina(num_pag)
             if not words:
                 continue
-            # Buscar posibles líneas de cabecera que contengan ID y NOMBRE
-            # Agrupar por top (líneas)
-            lines = {}
-            for w in words:
-                top = round(w.get("top", 0))
-                lines.setdefault(top, []).append(w)
-            for top, wlist in sorted(lines.items()):
-                txt = " ".join([w["text"] for w in sorted(wlist, key=lambda x: x["x0"])])
-                if re.search(r"ID\.?\s*FISCAL", txt, re.IGNORECASE) and re.search(r"NOMBRE", txt, re.IGNORECASE):
-                    # Encontrada la línea de cabecera
-                    header_words = sorted(wlist, key=lambda x: x["x0"])  # orden por x
-                    # Mapear inicio de columnas por palabras clave
-                    cols = {}
-                    for w in header_words:
-                        ut = w["text"].upper()
-                        if "ID" in ut and "FISCAL" in ut or re.search(r"ID\.?", ut):
-                            cols["ID_FISCAL"] = w["x0"]
-                        if "NOMBRE" in ut:
-                            cols["NOMBRE"] = w["x0"]
-                        if "DOMICILIO" in ut:
-                            cols["DOMICILIO"] = w["x0"]
-                        if "VINCULACION" in ut:
-                            cols["VINCULACION"] = w["x0"]
-                    # Necesitamos al menos ID y NOMBRE
-                    if "ID_FISCAL" not in cols or "NOMBRE" not in cols:
-                        continue
-                    # Determinar límites de cada columna usando los inicios ordenados
-                    ordered = sorted([(k, v) for k, v in cols.items()], key=lambda x: x[1])
-                    limits = {}
-                    for i, (k, x0) in enumerate(ordered):
-                        start = x0
-                        end = ordered[i+1][1] if i+1 < len(ordered) else float('inf')
-                        limits[k] = (start, end)
-
-                    # Recolectar palabras debajo de la cabecera hasta nueva sección
-                    collected = {k: [] for k in limits}
-                    stop_patterns = re.compile(r"NUM\.|FACTURA|PARTIDAS|OBSERVACIONES|PEDIMENTO|ANEXO|CLAVE", re.IGNORECASE)
-                    for w in words:
-                        # solo palabras por debajo de la línea de cabecera
-                        if w.get("top", 0) <= top:
-                            continue
-                        if stop_patterns.search(w.get("text", "")):
-                            break
-                        x0 = w.get("x0", 0)
-                        for k, (s, e) in limits.items():
-                            if x0 >= s - 1 and x0 < e - 1:
-                                collected[k].append((w.get("top", 0), w.get("x0", 0), w.get("text", "")))
-                                break
+            # Cabecera ID/NOMBRE: con un layout ya visto se toma del registro; si no, se
+            # detecta entre las líneas con alguna palabra que contiene FISCAL
+            indice = doc.indice_pagina(num_pag)
+            cabecera = _cabecera(doc, indice, "proveedor", _detectar_cabecera_proveedor)
+            if cabecera is None:
+                continue
+            fila, limits = cabecera
+            top = fila.top
+
+            # Recolectar palabras debajo de la cabecera hasta nueva sección
+            collected = {k: [] for k in limits}
+            stop_patterns = FIN_PROVEEDOR_RE
+            nombres = list(limits)
+            debajo = indice.debajo_de(top, hasta=stop_patterns)
+            columnas = indice.columnas(indice.x0[debajo], limits)
+            for i, c, topi, x0i in zip(debajo.tolist(), columnas.tolist(),
+                                       indice.top[debajo].tolist(), indice.x0[debajo].tolist()):
+                if c >= 0:
+                    collected[nombres[c]].append((topi, x0i, indice.textos[i]))
+
+            # Para cada columna, ordenar por top,y x0 y concatenar respetando líneas
+            def build_col(col_items):
+                if not col_items:
+                    return ""
+                col_items_sorted = sorted(col_items, key=lambda x: (round(x[0]), x[1]))
+                # Agrupar por top para preservar saltos de línea
+                byline = {}
+                for topi, x0i, texti in col_items_sorted:
+                    keyline = round(topi)
+                    byline.setdefault(keyline, []).append((x0i, texti))
+                parts = []
+                for ln in sorted(byline.keys()):
+                    seg = " ".join([t for _, t in sorted(byline[ln], key=lambda z: z[0])])
+                    parts.append(seg)
+                return " ".join(parts).strip()
 
-                    # Para cada columna, ordenar por top,y x0 y concatenar respetando líneas
-                    def build_col(col_items):
-                        if not col_items:
-                            return ""
-                        col_items_sorted = sorted(col_items, key=lambda x: (round(x[0]), x[1]))
-                        # Agrupar por top para preservar saltos de línea
-                        byline = {}
-                        for topi, x0i, texti in col_items_sorted:
-                            keyline = round(topi)
-                            byline.setdefault(keyline, []).append((x0i, texti))
-                        parts = []
-                        for ln in sorted(byline.keys()):
-                            seg = " ".join([t for _, t in sorted(byline[ln], key=lambda z: z[0])])
-                            parts.append(seg)
-                        return " ".join(parts).strip()
-
-                    id_val = build_col(collected.get("ID_FISCAL", []))
-                    nombre_val = build_col(collected.get("NOMBRE", []))
-                    # limpieza básica
-                    id_val = id_val.replace('ID:', '').replace('ID.', '').strip()
-                    nombre_val = nombre_val.strip(' ,;')
-                    id_val = clean_id(id_val)
-                    nombre_val = clean_nombre(nombre_val)
-                    # si id corto, intentar extraer id del inicio del nombre
-                    if (not id_val or len(id_val) < 4) and nombre_val:
-                        ext_id, new_nombre = extract_id_from_nombre(nombre_val)
-                        if ext_id and len(ext_id) > len(id_val):
-                            id_val = clean_id(ext_id)
-                            nombre_val = clean_nombre(new_nombre)
-                    return id_val, nombre_val
+            id_val = build_col(collected.get("ID_FISCAL", []))
+            nombre_val = build_col(collected.get("NOMBRE", []))
+            # limpieza básica
+            id_val = id_val.replace('ID:', '').replace('ID.', '').strip()
+            nombre_val = nombre_val.strip(' ,;')
+            id_val = clean_id(id_val)
+            nombre_val = clean_nombre(nombre_val)
+            # si id corto, intentar extraer id del inicio del nombre
+            if (not id_val or len(id_val) < 4) and nombre_val:
+                ext_id, new_nombre = extract_id_from_nombre(nombre_val)
+                if ext_id and len(ext_id) > len(id_val):
+                    id_val = clean_id(ext_id)
+                    nombre_val = clean_nombre(new_nombre)
+            return id_val, nombre_val
     return "", ""
 
 
@@ -413,120 +781,332 @@ def extraer_cabecera_pedimento(texto):
     """
     Extrae NUM.PEDIMENTO, TIPO CAMBIO y ADUANA E/S de la línea principal de cabecera,
     tolerando columnas y espacios variables.
+    `texto` puede ser el texto completo o un iterable de fragmentos terminados en salto
+    de línea (p. ej. PedimentoDocument.iterar_textos()), que se deja de consumir en
+    cuanto se leen las líneas de la cabecera.
     """
-    lines = [l.strip() for l in texto.splitlines() if l.strip()]
+    if isinstance(texto, str):
+        texto = (texto,)
+    lines = (l.strip() for fragmento in texto for l in fragmento.splitlines() if l.strip())
     pedimento = tipo_cambio = aduana = ""
-    idx_pedimento = -1
     # Buscar la línea que contiene la palabra PEDIMENTO
-    for i, line in enumerate(lines):
-        if re.search(r"PEDIMENTO", line, re.IGNORECASE):
-            idx_pedimento = i
+    for line in lines:
+        if PEDIMENTO_RE.search(line):
+            cabecera = [line] + list(itertools.islice(lines, 5))
             break
+    else:
+        cabecera = []
     # Si se encontró la sección PEDIMENTO, buscar datos en las siguientes 5 líneas
-    if idx_pedimento != -1:
-        for line in lines[idx_pedimento:idx_pedimento+6]:
+    if cabecera:
+        for line in cabecera:
             if not pedimento:
-                m = re.search(r"NUM[\.]?\s*PEDIMENTO\s*:?\s*([\d\s-]+)", line, re.IGNORECASE)
+                m = NUM_PEDIMENTO_RE.search(line)
                 if m:
                     pedimento = m.group(1).strip()
                 else:
                     # Buscar formato alternativo: solo números largos
-                    m2 = re.search(r"\b(\d{7,})\b", line)
+                    m2 = NUMERO_LARGO_RE.search(line)
                     if m2:
                         pedimento = m2.group(1)
             if not tipo_cambio:
-                m = re.search(r"TIPO\s*CAMBIO\s*:?\s*([\d.,]+)", line, re.IGNORECASE)
+                m = TIPO_CAMBIO_RE.search(line)
                 if m:
                     tipo_cambio = m.group(1)
             if not aduana:
-                m = re.search(r"ADUANA[\sE/S]*:?\s*(\d+)", line, re.IGNORECASE)
+                m = ADUANA_RE.search(line)
                 if m:
                     aduana = m.group(1)
     return pedimento, tipo_cambio, aduana
 
 
-def extraer_partidas_por_posicion(pdf_path):
+def _es_linea_descripcion_valida(s):
+    """True si `s` parece una línea de descripción de mercancía (no impuesto, cabecera ni metadata)."""
+    if not s:
+        return False
+    s_clean = s.strip()
+    # reject obvious tax or header lines
+    if LINEA_IMPUESTO_RE.search(s_clean):
+        return False
+    # reject lines that are mostly numeric or column headers
+    words = PALABRA_RE.findall(s_clean)
+    if not words:
+        return False
+    num_tokens = len(words)
+    num_alpha = sum(1 for w in words if LETRA_RE.search(w))
+    # require at least 3 alphabetic tokens to be a description (avoid short metadata)
+    if num_alpha < 3:
+        return False
+    # reject short tokens that look like codes
+    if num_tokens <= 2 and SOLO_NUMEROS_RE.match(s_clean):
+        return False
+    # reject metadata blocks and common non-description markers
+    if NO_DESCRIPCION_RE.search(s_clean):
+        return False
+    return True
+
+
+def _quitar_codigos_iniciales(s):
+    """Elimina los códigos numéricos (o tokens cortos con dígitos) al inicio de `s`."""
+    if not s:
+        return s
+    parts = s.split()
+    i_part = 0
+    for p in parts:
+        # considerar código si es mayoritariamente dígitos/puntuación o token corto
+        letters = sum(1 for c in p if c.isalpha())
+        digits = sum(1 for c in p if c.isdigit())
+        if letters == 0 and digits > 0:
+            i_part += 1
+            continue
+        if len(p) <= 3 and digits > 0:
+            i_part += 1
+            continue
+        break
+    return ' '.join(parts[i_part:]).strip()
+
+
+class _FilaPalabras:
+    """Línea de una página (palabras con el mismo `top` redondeado) ordenada una sola vez.
+
+    Guarda el texto y el x0 de sus palabras ordenadas por x0 y el texto de la línea;
+    tras `asignar_columnas` también el texto por columna y el de la línea formada solo
+    por palabras dentro de alguna columna. Los candidatos a descripción se calculan bajo
+    demanda y se memorizan.
+    """
+    __slots__ = ('top', 'indices', 'textos', 'x0s', 'texto', 'columnas', 'texto_columnas', '_sin_codigos',
+                 '_candidata')
+
+    def __init__(self, top, indices, textos, x0s):
+        self.top = top
+        # índices de las palabras en la página (array), ya ordenados por x0
+        self.indices = indices
+        self.textos = textos
+        self.x0s = x0s
+        self.texto = ' '.join(textos)
+        self.columnas = {}
+        self.texto_columnas = ''
+        self._sin_codigos = None
+        self._candidata = None
+
+    def asignar_columnas(self, nombres, columna_por_palabra):
+        """Reparte las palabras en `nombres` según `columna_por_palabra` (ver _IndicePalabras.columnas)."""
+        cols_line = {k: [] for k in nombres}
+        for texto_palabra, c in zip(self.textos, columna_por_palabra[self.indices].tolist()):
+            if c >= 0:
+                cols_line[nombres[c]].append(texto_palabra)
+        self.columnas = {k: ' '.join(v).strip() for k, v in cols_line.items()}
+        self.texto_columnas = ' '.join([t for v in cols_line.values() for t in v]).strip()
+        self._sin_codigos = self._candidata = None
+
+    def col(self, nombre):
+        return self.columnas.get(nombre, '')
+
+    @property
+    def sin_codigos(self):
+        """Línea sin los códigos iniciales breves (CODIGOS_INICIALES_RE)."""
+        if self._sin_codigos is None:
+            self._sin_codigos = CODIGOS_INICIALES_RE.sub('', self.texto_columnas).strip()
+        return self._sin_codigos
+
+    @property
+    def candidata(self):
+        """Descripción candidata para la búsqueda agresiva, o '' si la línea no es válida."""
+        if self._candidata is None:
+            cand = _quitar_codigos_iniciales(self.texto_columnas)
+            self._candidata = cand if cand and _es_linea_descripcion_valida(cand) else ''
+        return self._candidata
+
+
+class _IndicePalabras:
+    """Palabras de una página (TablaPalabras) indexadas por posición.
+
+    Usa directamente los arrays `top` y `x0` de la tabla y guarda el orden por top,
+    de modo que "palabras por debajo de y" es una búsqueda binaria y la columna de
+    cada palabra un `searchsorted` sobre los límites de columna. Las líneas (palabras
+    con el mismo `top` redondeado) se agrupan bajo demanda: todas a la vez (`filas`,
+    que se memoriza), una sola (`fila`) o las que siguen a una (`filas_desde`), de
+    modo que los extractores localizan su cabecera por las palabras ancla
+    (`lineas_con`) sin agrupar la página entera.
+    """
+
+    def __init__(self, tabla):
+        self.textos = tabla.texto
+        self.top = tabla.top
+        self.x0 = tabla.x0
+        self.orden = np.argsort(self.top, kind='stable')
+        self._tops_ordenados = self.top[self.orden]
+        # np.rint redondea como round() (mitades al par)
+        self.lineas = np.rint(self.top)
+        self._x0_redondeado = None
+        self._filas = None
+
+    def _fila(self, grupo):
+        return _FilaPalabras(int(self.lineas[grupo[0]]), grupo, [self.textos[i] for i in grupo.tolist()],
+                             self.x0[grupo].tolist())
+
+    def _agrupar(self, indices):
+        # lexsort es estable, así que dentro de una línea las palabras con el mismo x0
+        # conservan el orden de la página
+        orden = indices[np.lexsort((self.x0[indices], self.lineas[indices]))]
+        cortes = np.flatnonzero(np.diff(self.lineas[orden])) + 1
+        return np.split(orden, cortes) if orden.size else []
+
+    @property
+    def filas(self):
+        """Líneas de la página (_FilaPalabras) ordenadas por `top` redondeado."""
+        if self._filas is None:
+            self._filas = [self._fila(grupo) for grupo in self._agrupar(np.arange(len(self.textos)))]
+        return self._filas
+
+    def lineas_con(self, predicado):
+        """Tops redondeados, de menor a mayor, de las líneas con alguna palabra que cumple `predicado`."""
+        return sorted({int(self.lineas[i]) for i, t in enumerate(self.textos) if predicado(t)})
+
+    def fila(self, linea):
+        """La línea de top redondeado `linea`, igual que en `filas`, sin agrupar el resto."""
+        indices = np.flatnonzero(self.lineas == linea)
+        return self._fila(indices[np.argsort(self.x0[indices], kind='stable')])
+
+    def fila_con_huella(self, huella):
+        """Primera línea cuyas palabras son exactamente `huella` (ver registro_layouts), o None.
+
+        Solo se agrupan las líneas que tienen la primera palabra de la huella en su x0.
+        """
+        texto, x = huella[0]
+        if self._x0_redondeado is None:
+            self._x0_redondeado = np.rint(self.x0)
+        candidatas = np.flatnonzero(self._x0_redondeado == x).tolist()
+        for linea in sorted({int(self.lineas[i]) for i in candidatas if self.textos[i] == texto}):
+            fila = self.fila(linea)
+            if registro_layouts.huella(fila.textos, fila.x0s) == huella:
+                return fila
+        return None
+
+    def filas_desde(self, linea):
+        """Genera las líneas con top redondeado mayor que `linea`, creándolas según se consumen."""
+        if self._filas is not None:
+            yield from (f for f in self._filas if f.top > linea)
+            return
+        for grupo in self._agrupar(np.flatnonzero(self.lineas > linea)):
+            yield self._fila(grupo)
+
+    def debajo_de(self, y, hasta=None):
+        """Índices (en el orden original de la página) de las palabras con top > y.
+
+        Con `hasta`, se corta en la primera de ellas cuyo texto coincide con el patrón.
+        """
+        k = np.searchsorted(self._tops_ordenados, y, side='right')
+        indices = np.sort(self.orden[k:])
+        if hasta is not None:
+            for n, i in enumerate(indices):
+                if hasta.search(self.textos[i]):
+                    return indices[:n]
+        return indices
+
+    @staticmethod
+    def columnas(x0, limits):
+        """Posición en `limits` de la columna de cada x0 (-1 si queda fuera de todas).
+
+        `limits` es {nombre: (inicio, fin)} en orden de inicio, con cada fin igual al
+        inicio de la siguiente; una palabra pertenece a la columna si
+        inicio - 1 <= x0 < fin - 1.
+        """
+        bordes = np.array([s - 1 for s, _ in limits.values()], dtype=float)
+        return np.searchsorted(bordes, x0, side='right') - 1
+
+
+def _contiene_descripcion(texto_palabra):
+    return 'DESCRIPCION' in texto_palabra.upper()
+
+
+def _siguientes_validas(filas):
+    """Para cada índice j, el primer índice k >= j cuya fila tiene `candidata` (o None).
+
+    Se calcula en una sola pasada hacia atrás, de modo que la búsqueda agresiva de
+    descripción es O(1) por partida en lugar de recorrer todas las filas restantes.
+    """
+    siguientes = [None] * (len(filas) + 1)
+    for j in range(len(filas) - 1, -1, -1):
+        siguientes[j] = j if filas[j].candidata else siguientes[j + 1]
+    return siguientes
+
+
+def _detectar_cabecera_partidas(indice):
+    """(fila, columnas) de la primera línea con SEC, FRACCION y DESCRIPCION entre las que tienen DESCRIPCION."""
+    for linea in indice.lineas_con(_contiene_descripcion):
+        fila = indice.fila(linea)
+        txt = fila.texto.upper()
+        if 'SEC' in txt and 'FRACCION' in txt and 'DESCRIPCION' in txt:
+            # mapear posiciones por palabra
+            header_cols = {}
+            for pos, texto_palabra in enumerate(fila.textos):
+                t = texto_palabra.upper()
+                if 'SEC' in t:
+                    header_cols['SEC'] = pos
+                if 'FRACCION' in t or 'FRACCIÓN' in t:
+                    header_cols['FRACCION'] = pos
+                if 'DESCRIPCION' in t or 'DESCRIPCIÓN' in t:
+                    header_cols['DESCRIPCION'] = pos
+                if 'TASA' in t or 'IGI' in t or 'TASA_IGI' in t:
+                    header_cols['TASA'] = pos
+            return fila, tuple(header_cols.items())
+    return None
+
+
+@instrumentacion.instrumentar("extraer_partidas_por_posicion")
+def extraer_partidas_por_posicion(fuente):
     """Extrae las partidas (SEC, FRACCION, DESCRIPCION, TASA_IGI) usando coordenadas.
+    `fuente` puede ser una ruta o un PedimentoDocument ya abierto.
     Devuelve lista de dicts: {'SEC','FRACCION','DESCRIPCION','TASA_IGI'}.
     """
     partidas = []
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            for page in pdf.pages:
-                words = page.extract_words()
+        with _documento(fuente) as doc:
+            for num_pag in range(doc.num_paginas):
+                # lo que sigue a la página con FIN DE PEDIMENTO son anexos
+                if num_pag and FIN_PEDIMENTO_RE.search(doc.texto_pagina(num_pag - 1)):
+                    break
+                # páginas sin cabecera de partidas (anexos, e.firma): ni siquiera se extraen sus palabras
+                if not doc.tiene_anclas(num_pag, ANCLAS_PARTIDAS):
+                    continue
+                words = doc.palabras_pagina(num_pag)
                 if not words:
                     continue
-                # Agrupar por top para formar líneas
-                lines = {}
-                for w in words:
-                    top = round(w.get('top', 0))
-                    lines.setdefault(top, []).append(w)
-                # Buscar línea de cabecera de partidas
-                header_top = None
-                header_cols = {}
-                for top, wlist in sorted(lines.items()):
-                    txt = ' '.join([ww['text'] for ww in sorted(wlist, key=lambda x: x['x0'])]).upper()
-                    if 'SEC' in txt and 'FRACCION' in txt and 'DESCRIPCION' in txt:
-                        header_top = top
-                        # mapear posiciones por palabra
-                        for ww in sorted(wlist, key=lambda x: x['x0']):
-                            t = ww['text'].upper()
-                            if 'SEC' in t:
-                                header_cols['SEC'] = ww['x0']
-                            if 'FRACCION' in t or 'FRACCIÓN' in t:
-                                header_cols['FRACCION'] = ww['x0']
-                            if 'DESCRIPCION' in t or 'DESCRIPCIÓN' in t:
-                                header_cols['DESCRIPCION'] = ww['x0']
-                            if 'TASA' in t or 'IGI' in t or 'TASA_IGI' in t:
-                                header_cols['TASA'] = ww['x0']
-                        break
-                if header_top is None:
+                # Cabecera de partidas: del registro si el layout ya se vio; si no, se detecta
+                # entre las líneas con alguna palabra con DESCRIPCION
+                indice = doc.indice_pagina(num_pag)
+                cabecera = _cabecera(doc, indice, "partidas", _detectar_cabecera_partidas)
+                if cabecera is None:
                     continue
-                # Determinar límites de columnas por orden de x
-                ordered = sorted(header_cols.items(), key=lambda x: x[1])
-                limits = {}
-                for i, (k, x0) in enumerate(ordered):
-                    start = x0
-                    end = ordered[i+1][1] if i+1 < len(ordered) else float('inf')
-                    limits[k] = (start, end)
-
-                # Recolectar palabras por columna para líneas debajo de header
+                fila, limits = cabecera
+                header_linea = fila.top
+
+                # Recolectar filas debajo de header, clasificando sus palabras por columna
                 collected = []
-                stop_patterns = re.compile(r'FIN DE PEDIMENTO|\*{4,}|OBSERVACIONES A NIVEL PARTIDA', re.IGNORECASE)
-                for top, wlist in sorted(lines.items()):
-                    if top <= header_top:
-                        continue
+                stop_patterns = FIN_PARTIDAS_RE
+                nombres = list(limits)
+                columna_por_palabra = indice.columnas(indice.x0, limits)
+                for fila in indice.filas_desde(header_linea):
                     # si línea indica fin, romper
-                    line_txt = ' '.join([ww['text'] for ww in sorted(wlist, key=lambda x: x['x0'])])
-                    if stop_patterns.search(line_txt):
+                    if stop_patterns.search(fila.texto):
                         break
-                    # clasificar palabras por columna
-                    cols_line = {k: [] for k in limits}
-                    for ww in sorted(wlist, key=lambda x: x['x0']):
-                        x0 = ww.get('x0', 0)
-                        for k, (s, e) in limits.items():
-                            if x0 >= s - 1 and x0 < e - 1:
-                                cols_line[k].append((x0, ww['text']))
-                                break
-                    collected.append((top, cols_line))
+                    fila.asignar_columnas(nombres, columna_por_palabra)
+                    collected.append(fila)
+                siguientes = None
 
                 # Ahora agrupar por filas completas usando detección de nueva SEC (col SEC no vacía)
                 current = None
                 i = 0
                 L = len(collected)
                 while i < L:
-                    top, cols_line = collected[i]
-                    sec_tokens = cols_line.get('SEC', [])
-                    fr_tokens = cols_line.get('FRACCION', [])
-                    desc_tokens = cols_line.get('DESCRIPCION', [])
-                    tasa_tokens = cols_line.get('TASA', [])
-                    sec = ' '.join([t for _, t in sorted(sec_tokens, key=lambda x: x[0])]).strip()
-                    fr = ' '.join([t for _, t in sorted(fr_tokens, key=lambda x: x[0])]).strip()
+                    fila = collected[i]
+                    sec = fila.col('SEC')
+                    fr = fila.col('FRACCION')
                     # Validar que FRACCION tenga el formato esperado (8 dígitos). Si no, ignorar
-                    if not re.match(r"^\d{8}$", fr):
+                    if not FRACCION_8_RE.match(fr):
                         fr = ''
-                    desc = ' '.join([t for _, t in sorted(desc_tokens, key=lambda x: x[0])]).strip()
-                    tasa = ' '.join([t for _, t in sorted(tasa_tokens, key=lambda x: x[0])]).strip()
+                    desc = fila.col('DESCRIPCION')
+                    tasa = fila.col('TASA')
 
                     # detectar inicio de nueva partida: SEC con dígitos o FRACCION presente
                     if sec or fr:
@@ -535,13 +1115,13 @@ def extraer_partidas_por_posicion(pdf_path):
                             # limpiar impuesto incrustado en descripcion antes de anexar
                             if current.get('DESCRIPCION'):
                                 d = current['DESCRIPCION']
-                                m_igi = re.search(r"\bIGI\s*([0-9]+\.[0-9]{5})\b", d, re.IGNORECASE)
-                                m_iva = re.search(r"\bIVA\s*([0-9]+\.[0-9]{5})\b", d, re.IGNORECASE)
+                                m_igi = IGI_INCRUSTADO_RE.search(d)
+                                m_iva = IVA_INCRUSTADO_RE.search(d)
                                 if m_igi:
                                     current['TASA_IGI'] = m_igi.group(1)
-                                    current['DESCRIPCION'] = re.sub(r"\bIGI\s*[0-9]+\.[0-9]{5}\b", "", d, flags=re.IGNORECASE).strip(' ,;')
+                                    current['DESCRIPCION'] = IGI_INCRUSTADO_RE.sub("", d).strip(' ,;')
                                 elif m_iva:
-                                    current['DESCRIPCION'] = re.sub(r"\bIVA\s*[0-9]+\.[0-9]{5}\b", "", d, flags=re.IGNORECASE).strip(' ,;')
+                                    current['DESCRIPCION'] = IVA_INCRUSTADO_RE.sub("", d).strip(' ,;')
                             partidas.append(current)
 
                         # iniciar nueva partida
@@ -551,17 +1131,16 @@ def extraer_partidas_por_posicion(pdf_path):
                         # buscar una linea valida posterior y reemplazarla.
                         init_desc = current.get('DESCRIPCION','')
                         if init_desc:
-                            alpha_words_init = re.findall(r"[A-Za-zÀ-ÖØ-öø-ÿ]+", init_desc)
-                            if len(alpha_words_init) < 3 or re.search(r"\b(IDENTIF|COMPLEMENTO|SERIES:|SERIE|GUIA|ORDEN\s+EMBARQUE|RFC:|E\.FIRMA|NUMERO DE SERIE|NO ES LA DESCRIPCION|ESTO NO ES LA DESCRIPCION)\b", init_desc, re.IGNORECASE):
+                            alpha_words_init = PALABRA_ALFA_RE.findall(init_desc)
+                            if len(alpha_words_init) < 3 or META_DESCRIPCION_RE.search(init_desc):
                                 for j in range(i+1, min(L, i+8)):
-                                    topj, colsj = collected[j]
-                                    full_line_j = ' '.join([t for colvals in colsj.values() for _, t in sorted(colvals, key=lambda x: x[0])]).strip()
-                                    cand = re.sub(r'^[\d\W_,.:;-]+', '', full_line_j).strip()
+                                    cand = collected[j].sin_codigos
                                     if not cand:
                                         continue
                                     # require at least 3 alpha tokens and not metadata markers
-                                    alpha_words = re.findall(r"[A-Za-zÀ-ÖØ-öø-ÿ]+", cand)
-                                    if len(alpha_words) >= 3 and not re.search(r"\b(IDENTIF|COMPLEMENTO|SERIES:|SERIE|GUIA|ORDEN\s+EMBARQUE|RFC:|E\.FIRMA|NUMERO DE SERIE|NO ES LA DESCRIPCION|ESTO NO ES LA DESCRIPCION)\b", cand, re.IGNORECASE):
+                                    alpha_words = PALABRA_ALFA_RE.findall(cand)
+                                    if len(alpha_words) >= 3 and not META_DESCRIPCION_RE.search(cand):
+                                        instrumentacion.rama("partidas.metadata")
                                         current['DESCRIPCION'] = cand
                                         i = j
                                         break
@@ -570,45 +1149,17 @@ def extraer_partidas_por_posicion(pdf_path):
                         # se asume que esa línea es la descripción válida (ej. "MEDIAS DE COMPRESION PARA MECANOTERAPIA")
                         if i + 1 < L:
                             # Lookahead: inspect next up to 3 rows to find a valid description line
-                            def is_valid_desc_line(s):
-                                if not s:
-                                    return False
-                                s_clean = s.strip()
-                                # reject obvious tax or header lines
-                                if re.search(r"^\s*(IVA|IGI)\b", s_clean, re.IGNORECASE):
-                                    return False
-                                # reject lines that are mostly numeric or column headers
-                                words = re.findall(r"\w+", s_clean)
-                                if not words:
-                                    return False
-                                num_tokens = len(words)
-                                num_alpha = sum(1 for w in words if re.search(r"[A-Za-zÀ-ÖØ-öø-ÿ]", w))
-                                # require at least 3 alphabetic tokens to be a description (avoid short metadata)
-                                if num_alpha < 3:
-                                    return False
-                                # reject short tokens that look like codes
-                                if num_tokens <= 2 and re.match(r"^[0-9,\.\-]+$", s_clean):
-                                    return False
-                                # reject metadata blocks and common non-description markers
-                                if re.search(r"\b(MARCA|MODELO|IDENTIF|IDENTIFICADOR|COMPLEMENTO|OBSERVACIONES|SERIES|SERIE|No\.|FACTURA|PARTIDA|CLAVE|NUMERO|LOTE|CLAVE NUM|GUIA|ORDEN\s+EMBARQUE|RFC|E\.FIRMA|NUMERO DE SERIE|NO ES LA DESCRIPCION|ESTO NO ES LA DESCRIPCION)\b", s_clean, re.IGNORECASE):
-                                    return False
-                                return True
-
                             used_next = False
                             for look in range(1, 4):
                                 if i + look < L:
-                                    _, look_cols = collected[i+look]
-                                    # build a full-line text from all columns (some PDFs place description outside DESCRIPCION column)
-                                    next_fr = ' '.join([t for _, t in sorted(look_cols.get('FRACCION', []), key=lambda x: x[0])]).strip()
-                                    next_sec = ' '.join([t for _, t in sorted(look_cols.get('SEC', []), key=lambda x: x[0])]).strip()
-                                    # combine all tokens in the line across columns
-                                    next_full = ' '.join([t for colvals in look_cols.values() for _, t in sorted(colvals, key=lambda x: x[0])]).strip()
-                                    # also compute what would be in the DESCRIPCION column specifically
-                                    next_desc = ' '.join([t for _, t in sorted(look_cols.get('DESCRIPCION', []), key=lambda x: x[0])]).strip()
-                                    # prefer the full-line text for validation, but keep column text for assignment when possible
-                                    candidate_text = next_full if next_full else next_desc
-                                    if (not next_fr and not next_sec) and is_valid_desc_line(candidate_text):
+                                    look_fila = collected[i+look]
+                                    # prefer the full-line text for validation (some PDFs place description
+                                    # outside DESCRIPCION column), but keep column text for assignment when possible
+                                    next_desc = look_fila.col('DESCRIPCION')
+                                    candidate_text = look_fila.texto_columnas or next_desc
+                                    if (not look_fila.col('FRACCION') and not look_fila.col('SEC')) and _es_linea_descripcion_valida(candidate_text):
                                         # assign the more focused column value if available, otherwise the whole line
+                                        instrumentacion.rama("partidas.lookahead")
                                         current['DESCRIPCION'] = (next_desc or candidate_text).strip()
                                         # advance i to consume the rows we used (consume look rows)
                                         i += look
@@ -616,83 +1167,55 @@ def extraer_partidas_por_posicion(pdf_path):
                                         break
                             # Regla específica: si la fila inmediata siguiente es IVA/IGI, saltarla
                             if (not used_next) and (i + 1 < L):
-                                _, immediate_cols = collected[i+1]
-                                immediate_full = ' '.join([t for colvals in immediate_cols.values() for _, t in sorted(colvals, key=lambda x: x[0])]).strip()
-                                if re.search(r"^\s*(IVA|IGI)\b", immediate_full, re.IGNORECASE):
+                                if LINEA_IMPUESTO_RE.search(collected[i+1].texto_columnas):
                                     # buscar la primera línea no-IVA/IGI válida después de la inmediata
                                     for j in range(i+2, min(L, i+8)):
-                                        _, colsj = collected[j]
-                                        full_line_j = ' '.join([t for colvals in colsj.values() for _, t in sorted(colvals, key=lambda x: x[0])]).strip()
                                         # quitar códigos iniciales breves (números/puntuación)
-                                        cand = re.sub(r'^[\d\W_,.:;-]+', '', full_line_j).strip()
+                                        cand = collected[j].sin_codigos
                                         if not cand:
                                             continue
-                                        if is_valid_desc_line(cand):
+                                        if _es_linea_descripcion_valida(cand):
+                                            instrumentacion.rama("partidas.iva_igi")
                                             current['DESCRIPCION'] = cand
                                             i = j
                                             used_next = True
                                             break
-                            # Opción A (más agresiva): si no se encontró descripción en las primeras 3 filas,
-                            # buscar la primera línea posterior con top > top(fracción)+small_offset
-                            # If we didn't use lookahead and the current description is empty or invalid,
-                            # perform an aggressive search over all subsequent rows to find a valid description.
+                            # Opción A (más agresiva): si no se usó lookahead y la descripción actual está
+                            # vacía o es inválida, tomar la primera fila posterior válida (índice precalculado).
                             desc_now = current.get('DESCRIPCION') or ''
                             desc_invalid = False
                             if desc_now:
-                                alpha_now = re.findall(r"[A-Za-zÀ-ÖØ-öø-ÿ]+", desc_now)
-                                if len(alpha_now) < 3 or re.search(r"\b(IDENTIF|COMPLEMENTO|SERIES:|SERIE|GUIA|ORDEN\s+EMBARQUE|RFC:|E\.FIRMA|NUMERO DE SERIE|NO ES LA DESCRIPCION|ESTO NO ES LA DESCRIPCION)\b", desc_now, re.IGNORECASE):
+                                alpha_now = PALABRA_ALFA_RE.findall(desc_now)
+                                if len(alpha_now) < 3 or META_DESCRIPCION_RE.search(desc_now):
                                     desc_invalid = True
                             if (not used_next) and (not desc_now.strip() or desc_invalid):
-                                # buscar en cualquier fila posterior; eliminar códigos numéricos al inicio
-                                def strip_leading_codes(s):
-                                    if not s:
-                                        return s
-                                    parts = s.split()
-                                    i_part = 0
-                                    for p in parts:
-                                        # considerar código si es mayoritariamente dígitos/puntuación o token corto
-                                        letters = sum(1 for c in p if c.isalpha())
-                                        digits = sum(1 for c in p if c.isdigit())
-                                        if letters == 0 and digits > 0:
-                                            i_part += 1
-                                            continue
-                                        if len(p) <= 3 and digits > 0:
-                                            i_part += 1
-                                            continue
-                                        break
-                                    return ' '.join(parts[i_part:]).strip()
-
-                                for j in range(i+1, L):
-                                    topj, colsj = collected[j]
-                                    full_line = ' '.join([t for colvals in colsj.values() for _, t in sorted(colvals, key=lambda x: x[0])]).strip()
-                                    candidate = strip_leading_codes(full_line)
-                                    if not candidate:
-                                        continue
-                                    if is_valid_desc_line(candidate):
-                                        current['DESCRIPCION'] = candidate
-                                        i = j
-                                        break
-                            _, next_cols = collected[i+1]
-                            next_fr = ' '.join([t for _, t in sorted(next_cols.get('FRACCION', []), key=lambda x: x[0])]).strip()
-                            next_sec = ' '.join([t for _, t in sorted(next_cols.get('SEC', []), key=lambda x: x[0])]).strip()
-                            next_desc = ' '.join([t for _, t in sorted(next_cols.get('DESCRIPCION', []), key=lambda x: x[0])]).strip()
+                                if siguientes is None:
+                                    siguientes = _siguientes_validas(collected)
+                                j = siguientes[i+1]
+                                instrumentacion.rama("partidas.agresiva")
+                                if j is not None:
+                                    current['DESCRIPCION'] = collected[j].candidata
+                                    i = j
+                            next_fila = collected[i+1]
+                            next_desc = next_fila.col('DESCRIPCION')
                             # If next line has no fraction/sec but has a non-trivial description, use it
-                            if (not next_fr and not next_sec) and next_desc:
+                            if (not next_fila.col('FRACCION') and not next_fila.col('SEC')) and next_desc:
                                 # filter out metadata rows that contain words like MARCA/MODELO/IDENTIFICACION/COMPLEMENTO
-                                if not re.search(r"\b(MARCA|MODELO|IDENT|COMPLEMENTO|OBSERVACIONES|No\.|FACTURA|PARTIDA)\b", next_desc, re.IGNORECASE):
+                                if not META_SIGUIENTE_RE.search(next_desc):
+                                    instrumentacion.rama("partidas.siguiente")
                                     current['DESCRIPCION'] = next_desc.strip()
                                     # consume the next row as it was used for description
                                     i += 1
                         # also extract IGI/IVA if present in same line
                         if current.get('DESCRIPCION'):
                             d0 = current['DESCRIPCION']
-                            m_igi0 = re.search(r"\bIGI\s*([0-9]+\.[0-9]{5})\b", d0, re.IGNORECASE)
-                            m_iva0 = re.search(r"\bIVA\s*([0-9]+\.[0-9]{5})\b", d0, re.IGNORECASE)
+                            m_igi0 = IGI_INCRUSTADO_RE.search(d0)
+                            m_iva0 = IVA_INCRUSTADO_RE.search(d0)
                             if m_igi0:
                                 current['TASA_IGI'] = m_igi0.group(1)
-                                current['DESCRIPCION'] = re.sub(r"\bIGI\s*[0-9]+\.[0-9]{5}\b", "", d0, flags=re.IGNORECASE).strip(' ,;')
+                                current['DESCRIPCION'] = IGI_INCRUSTADO_RE.sub("", d0).strip(' ,;')
                             elif m_iva0 and not current.get('TASA_IGI'):
-                                current['DESCRIPCION'] = re.sub(r"\bIVA\s*[0-9]+\.[0-9]{5}\b", "", d0, flags=re.IGNORECASE).strip(' ,;')
+                                current['DESCRIPCION'] = IVA_INCRUSTADO_RE.sub("", d0).strip(' ,;')
                     else:
                         # continuación de descripcion
                         if current:
@@ -700,17 +1223,17 @@ def extraer_partidas_por_posicion(pdf_path):
                                 # append and filter metadata fragments
                                 combined = (current.get('DESCRIPCION', '') + ' ' + desc).strip()
                                 # remove lines that look like MARCA/MODELO blocks
-                                combined = re.sub(r"\b(MARCA|MODELO|IDENTIFICACION|COMPLEMENTO)\b[:\s0-9A-Z\-]*", "", combined, flags=re.IGNORECASE).strip()
+                                combined = BLOQUE_MARCA_MODELO_RE.sub("", combined).strip()
                                 current['DESCRIPCION'] = combined
                                 # buscar IGI/IVA en la descripcion recién concatenada
                                 dtmp = current['DESCRIPCION']
-                                m_igi_c = re.search(r"\bIGI\s*([0-9]+\.[0-9]{5})\b", dtmp, re.IGNORECASE)
-                                m_iva_c = re.search(r"\bIVA\s*([0-9]+\.[0-9]{5})\b", dtmp, re.IGNORECASE)
+                                m_igi_c = IGI_INCRUSTADO_RE.search(dtmp)
+                                m_iva_c = IVA_INCRUSTADO_RE.search(dtmp)
                                 if m_igi_c:
                                     current['TASA_IGI'] = m_igi_c.group(1)
-                                    current['DESCRIPCION'] = re.sub(r"\bIGI\s*[0-9]+\.[0-9]{5}\b", "", dtmp, flags=re.IGNORECASE).strip(' ,;')
+                                    current['DESCRIPCION'] = IGI_INCRUSTADO_RE.sub("", dtmp).strip(' ,;')
                                 elif m_iva_c and not current.get('TASA_IGI'):
-                                    current['DESCRIPCION'] = re.sub(r"\bIVA\s*[0-9]+\.[0-9]{5}\b", "", dtmp, flags=re.IGNORECASE).strip(' ,;')
+                                    current['DESCRIPCION'] = IVA_INCRUSTADO_RE.sub("", dtmp).strip(' ,;')
                             if tasa and not current.get('TASA_IGI'):
                                 current['TASA_IGI'] = tasa
                     i += 1
@@ -721,11 +1244,122 @@ def extraer_partidas_por_posicion(pdf_path):
     return partidas
 
 
+def _tokens_partidas(texto):
+    """Genera (clase, token) de `texto` (str o iterable de fragmentos, p. ej. páginas).
+
+    Los fragmentos se cortan por líneas: un número nunca queda partido entre dos
+    fragmentos. Cada salto de línea es su propio token de clase 'nl'.
+    """
+    if isinstance(texto, str):
+        texto = (texto,)
+    pendiente = ""
+    for fragmento in texto:
+        *lineas, pendiente = (pendiente + fragmento).split("\n")
+        for linea in lineas:
+            for m in TOKEN_PARTIDA_RE.finditer(linea):
+                yield m.lastgroup, m.group()
+            yield "nl", "\n"
+    for m in TOKEN_PARTIDA_RE.finditer(pendiente):
+        yield m.lastgroup, m.group()
+
+
+# estados del analizador de partidas por texto
+_BUSCAR_PARTIDA, _FIN_LINEA, _DESCRIPCION, _BUSCAR_IGI, _TASA = range(5)
+# hilos de la línea de cantidades "\s+\d+\s+\d+\s+[\d.]+\n" que cierra la descripción
+_ESP0, _NUM1, _ESP1, _NUM2, _ESP2, _VALOR = range(6)
+_CON_ESPACIO = {_ESP0: _ESP0, _NUM1: _ESP1, _ESP1: _ESP1, _NUM2: _ESP2, _ESP2: _ESP2}
+_CON_DIGITOS = {_ESP0: _NUM1, _ESP1: _NUM2, _ESP2: _VALOR, _VALOR: _VALOR}
+_CON_PUNTO = {_ESP2: _VALOR, _VALOR: _VALOR}
+
+
+def iterar_partidas_texto(texto):
+    """Genera (SEC, FRACCION, DESCRIPCION, TASA_IGI) del texto, igual que PARTIDAS_TEXTO_RE.finditer.
+
+    Recorre los tokens una sola vez con una máquina de estados (tiempo lineal, sin
+    el retroceso de los `.*?` con DOTALL). `texto` puede ser el texto completo o un
+    iterable de fragmentos, p. ej. las páginas de un PedimentoDocument seguidas de
+    "\\n". La DESCRIPCION se devuelve sin recortar, como el grupo 3 del patrón.
+    """
+    estado = _BUSCAR_PARTIDA
+    sec = fraccion = descripcion = None
+    hay_espacio = es_igi = False
+    for clase, token in _tokens_partidas(texto):
+        espacio = clase in ("esp", "nl")
+        if estado == _TASA:
+            if clase in ("dig", "pto"):
+                tasa.append(token)
+                continue
+            yield sec, fraccion, descripcion, "".join(tasa)
+            # el token que cierra la tasa puede iniciar la siguiente partida
+            estado, sec = _BUSCAR_PARTIDA, None
+        if estado == _BUSCAR_PARTIDA:
+            # "\d+\s+\d{8}": SEC y FRACCION separadas por espacios (saltos de línea incluidos)
+            if clase == "dig":
+                if sec is not None and hay_espacio and len(token) >= 8:
+                    fraccion = token[:8]
+                    estado = _FIN_LINEA
+                else:
+                    sec, hay_espacio = token, False
+            elif espacio:
+                hay_espacio = True
+            else:
+                sec = None
+        elif estado == _FIN_LINEA:
+            # el resto de la línea de la fracción se descarta
+            if clase == "nl":
+                estado = _DESCRIPCION
+                partes, largo, hilos = [], 0, {}
+        elif estado == _DESCRIPCION:
+            # la descripción termina donde empieza la primera línea de cantidades; cada hilo
+            # guarda el inicio más temprano que llega a ese estado
+            if espacio:
+                transiciones = _CON_ESPACIO
+                if clase == "nl" and _VALOR in hilos:
+                    descripcion = "".join(partes)[:hilos[_VALOR]]
+                    estado, es_igi = _BUSCAR_IGI, False
+                    continue
+            elif clase == "dig":
+                transiciones = _CON_DIGITOS
+            elif clase == "pto":
+                transiciones = _CON_PUNTO
+            else:
+                transiciones = {}
+            nuevos = {}
+            for hilo, inicio in hilos.items():
+                destino = transiciones.get(hilo)
+                if destino is not None and inicio < nuevos.get(destino, largo + 1):
+                    nuevos[destino] = inicio
+            if espacio and _ESP0 not in nuevos:
+                nuevos[_ESP0] = largo
+            hilos = nuevos
+            partes.append(token)
+            largo += len(token)
+        elif estado == _BUSCAR_IGI:
+            # "IGI\s+([\d.]+)" en cualquier punto posterior
+            if clase == "otro":
+                es_igi, hay_espacio = token.endswith("IGI"), False
+            elif espacio:
+                hay_espacio = True
+            elif es_igi and hay_espacio:
+                estado, tasa = _TASA, [token]
+            else:
+                es_igi = False
+    if estado == _TASA:
+        yield sec, fraccion, descripcion, "".join(tasa)
+
+
 def extraer_datos_completos(texto):
+    """Filas extraídas solo del texto (respaldo sin posiciones), como DataFrame."""
+    import pandas as pd
+    return pd.DataFrame(_filas_datos_completos(texto))
+
+
+@instrumentacion.instrumentar("extraer_datos_completos")
+def _filas_datos_completos(texto):
     # --- 1. Extracción de Cabecera robusta ---
     # Validar que el texto contiene las tres secciones clave
-    if not (re.search(r"PEDIMENTO", texto, re.IGNORECASE) and re.search(r"DATOS DEL PROVEEDOR O COMPRADOR", texto, re.IGNORECASE) and re.search(r"PARTIDAS", texto, re.IGNORECASE)):
-        return pd.DataFrame([])
+    if not (PEDIMENTO_RE.search(texto) and DATOS_PROVEEDOR_RE.search(texto) and PARTIDAS_RE.search(texto)):
+        return []
 
     pedimento, tipo_cambio, aduana = extraer_cabecera_pedimento(texto)
     # Intentar extracción por posiciones en el PDF si es posible (más robusta)
@@ -736,30 +1370,24 @@ def extraer_datos_completos(texto):
         id_fiscal, nombre, _ = extraer_datos_proveedor_preciso(texto)
     except Exception:
         id_fiscal, nombre = "", ""
-    patron_partidas = re.compile(
-        r"(\d+)\s+(\d{8}).*?\n"                # SEC y FRACCION
-        r"(.*?)\s+\d+\s+\d+\s+[\d.]+\n"        # DESCRIPCION
-        r".*?IGI\s+([\d.]+)",                  # Tasa IGI
-        re.DOTALL
-    )
     resultados = []
     def is_valid_desc_text(s):
         if not s:
             return False
         s_clean = s.strip()
         # reject obvious metadata lines
-        if re.search(r"\b(GUIA|ORDEN\s+EMBARQUE|RFC:|E\.FIRMA|NUMERO DE SERIE|SERIES:|NO ES LA DESCRIPCION|ESTO NO ES LA DESCRIPCION)\b", s_clean, re.IGNORECASE):
+        if META_TEXTO_RE.search(s_clean):
             return False
-        words = re.findall(r"\w+", s_clean)
+        words = PALABRA_RE.findall(s_clean)
         if not words:
             return False
-        num_alpha = sum(1 for w in words if re.search(r"[A-Za-zÀ-ÖØ-öø-ÿ]", w))
+        num_alpha = sum(1 for w in words if LETRA_RE.search(w))
         if num_alpha < 3:
             return False
         return True
 
-    for match in patron_partidas.finditer(texto):
-        desc_candidate = match.group(3).strip()
+    for sec, fraccion, descripcion, tasa in iterar_partidas_texto(texto):
+        desc_candidate = descripcion.strip()
         if not is_valid_desc_text(desc_candidate):
             # skip noisy matches that are likely headers/metadata
             continue
@@ -769,288 +1397,567 @@ def extraer_datos_completos(texto):
             "ADUANA": aduana,
             "ID_FISCAL": id_fiscal,
             "NOMBRE_DENOMINACION_O_RAZON_SOCIAL": nombre,
-            "SEC": match.group(1),
-            "FRACCION": match.group(2),
+            "SEC": sec,
+            "FRACCION": fraccion,
             "DESCRIPCION": desc_candidate,
-            "TASA_IGI": match.group(4)
+            "TASA_IGI": tasa
         })
-    return pd.DataFrame(resultados)
+    return resultados
 
 
-def recover_description_from_pdf(pdf_path, sec, fraccion):
-    """Abrir PDF y localizar la línea de partida (SEC y FRACCION) y devolver
-    la primera línea válida posterior a IVA/IGI como descripción.
+def _descripcion_recuperable(cand_line):
+    """Devuelve la línea limpia si sirve como descripción recuperada, o None si hay que saltarla."""
+    # saltar líneas vacías o de IVA/IGI o encabezados técnicos
+    if not cand_line:
+        return None
+    if LINEA_IMPUESTO_RE.search(cand_line):
+        return None
+    # skip common non-description markers
+    if NO_DESCRIPCION_RECUPERACION_RE.search(cand_line):
+        return None
+    # strip leading numeric/code tokens
+    cand_clean = CODIGOS_INICIALES_RE.sub('', cand_line).strip()
+    # quick filters: skip long base64-like lines, or lines that are mostly punctuation/numeric
+    if BASE64_RE.search(cand_clean):
+        return None
+    tokens = TOKEN_RE.findall(cand_clean)
+    if not tokens:
+        return None
+    alpha_words = PALABRA_ALFA_RE.findall(cand_clean)
+    num_tokens = len(tokens)
+    num_alpha = len(alpha_words)
+    # ratio of alphabetic tokens
+    alpha_ratio = num_alpha / num_tokens if num_tokens > 0 else 0
+    # detect 'series' style lines: many comma-separated tokens that are mostly alnum/hyphen
+    comma_tokens = [t for t in SEPARADOR_COMA_RE.split(cand_clean) if t]
+    series_like = 0
+    for t in comma_tokens:
+        letters = sum(1 for c in t if c.isalpha())
+        digits = sum(1 for c in t if c.isdigit())
+        if digits > 0 and letters <= 3 and '-' in t or (len(t) >= 6 and (digits > 0 and letters > 0 and '-' in t)):
+            series_like += 1
+    if len(comma_tokens) >= 3 and series_like >= max(1, len(comma_tokens)//3):
+        return None
+    # require at least 3 alpha-words and a reasonable alphabetic ratio to be a description
+    if num_alpha >= 3 and alpha_ratio >= 0.35:
+        return cand_clean
+    return None
+
+
+@instrumentacion.instrumentar("recover_descriptions_from_pdf")
+def recover_descriptions_from_pdf(fuente, pares):
+    """Recupera en una sola pasada las descripciones de varias partidas de un mismo PDF.
+
+    `pares` es una lista de (SEC, FRACCION). Para cada fracción se localiza la primera
+    línea que la contiene y se toma la primera línea válida posterior (saltando IVA/IGI
+    y cabeceras) dentro de la misma página. Devuelve dict {(sec, fraccion): descripcion}
+    solo con los pares resueltos. `fuente` puede ser una ruta o un PedimentoDocument.
     """
+    # la SEC no se exige en la línea (puede haber varios matches), así que se resuelve por fracción
+    pendientes = {}
+    for sec, fraccion in pares:
+        if fraccion:
+            pendientes.setdefault(fraccion, []).append((sec, fraccion))
+    resueltas = {}
+    if not pendientes:
+        return resueltas
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            for page in pdf.pages:
-                words = page.extract_words()
+        with _documento(fuente) as doc:
+            for num_pag in range(doc.num_paginas):
+                # solo las páginas cuyo texto contiene alguna de las fracciones pendientes
+                texto_pag = doc.texto_pagina(num_pag)
+                if not any(fr in texto_pag for fr in pendientes):
+                    continue
+                words = doc.palabras_pagina(num_pag)
                 if not words:
                     continue
-                # agrupar por top
-                lines = {}
-                for w in words:
-                    top = round(w.get('top', 0))
-                    lines.setdefault(top, []).append(w)
-                tops = sorted(lines.keys())
-                for idx, top in enumerate(tops):
-                    line_txt = ' '.join([ww['text'] for ww in sorted(lines[top], key=lambda x: x['x0'])])
-                    # buscar coincidencia de fraccion (y sec si disponible)
-                    if fraccion and fraccion in line_txt:
-                        # confirmar SEC si se pasó
-                        if sec and str(sec).strip() and str(sec) not in line_txt:
-                            # puede haber varios matches; no exigir SEC
-                            pass
-                        # buscar la siguiente línea válida (saltar IVA/IGI y cabeceras)
-                        j = idx + 1
-                        while j < len(tops):
-                            cand_line = ' '.join([ww['text'] for ww in sorted(lines[tops[j]], key=lambda x: x['x0'])]).strip()
-                            # saltar líneas vacías o de IVA/IGI o encabezados técnicos
-                            if not cand_line:
-                                j += 1
-                                continue
-                            if re.search(r"^\s*(IVA|IGI)\b", cand_line, re.IGNORECASE):
-                                j += 1
-                                continue
-                            # skip common non-description markers
-                            if re.search(r"\b(CLAVE|NUM\.|MARCA|MODELO|CODIGO|PRODUCTO|CLAVE NUM|OBSERVACIONES|IDENTIF|IDENTIFICADOR|COMPLEMENTO|SERIES|SERIE|GUIA|ORDEN\s+EMBARQUE|RFC|E\.FIRMA|NUMERO DE SERIE|NO ES LA DESCRIPCION|ESTO NO ES LA DESCRIPCION)\b", cand_line, re.IGNORECASE):
-                                j += 1
-                                continue
-                            # strip leading numeric/code tokens
-                            cand_clean = re.sub(r'^[\d\W_,.:;-]+', '', cand_line).strip()
-                            # quick filters: skip long base64-like lines, or lines that are mostly punctuation/numeric
-                            if re.search(r"[A-Za-z0-9+/=]{40,}", cand_clean):
-                                j += 1
-                                continue
-                            tokens = re.findall(r"\S+", cand_clean)
-                            if not tokens:
-                                j += 1
-                                continue
-                            alpha_words = re.findall(r"[A-Za-zÀ-ÖØ-öø-ÿ]+", cand_clean)
-                            num_tokens = len(tokens)
-                            num_alpha = len(alpha_words)
-                            # ratio of alphabetic tokens
-                            alpha_ratio = num_alpha / num_tokens if num_tokens > 0 else 0
-                            # detect 'series' style lines: many comma-separated tokens that are mostly alnum/hyphen
-                            comma_tokens = [t for t in re.split(r",\s*", cand_clean) if t]
-                            series_like = 0
-                            for t in comma_tokens:
-                                letters = sum(1 for c in t if c.isalpha())
-                                digits = sum(1 for c in t if c.isdigit())
-                                if digits > 0 and letters <= 3 and '-' in t or (len(t) >= 6 and (digits > 0 and letters > 0 and '-' in t)):
-                                    series_like += 1
-                            if len(comma_tokens) >= 3 and series_like >= max(1, len(comma_tokens)//3):
-                                j += 1
-                                continue
-                            # require at least 3 alpha-words and a reasonable alphabetic ratio to be a description
-                            if num_alpha >= 3 and alpha_ratio >= 0.35:
-                                return cand_clean
-                            j += 1
+                # líneas agrupadas por top (compartidas con la extracción de partidas)
+                textos = [fila.texto for fila in doc.indice_pagina(num_pag).filas]
+                siguientes = None
+                for idx, line_txt in enumerate(textos):
+                    encontradas = [fr for fr in pendientes if fr in line_txt]
+                    if not encontradas:
+                        continue
+                    if siguientes is None:
+                        # siguiente descripción válida desde cada línea, calculada hacia atrás una sola vez
+                        siguientes = [None] * (len(textos) + 1)
+                        for j in range(len(textos) - 1, -1, -1):
+                            siguientes[j] = _descripcion_recuperable(textos[j].strip()) or siguientes[j + 1]
+                    desc = siguientes[idx + 1]
+                    if not desc:
+                        continue
+                    for fr in encontradas:
+                        for par in pendientes.pop(fr):
+                            resueltas[par] = desc
+                    if not pendientes:
+                        return resueltas
     except Exception:
-        return None
-    return None
+        return resueltas
+    return resueltas
 
-def procesar_pedimentos_y_generar_csv(carpeta, archivo_salida_csv):
-    resultados = []
-    # Solo procesar archivos que contengan 'PEDIMENTO' en el nombre
-    pdfs = [f for f in glob.glob(os.path.join(carpeta, '*.pdf')) if 'PEDIMENTO' in os.path.basename(f).upper()]
-    for pdf_path in pdfs:
-        print(f"Procesando: {os.path.basename(pdf_path)}")
-        texto = extraer_texto_pdf(pdf_path)
-        # Primero intentar extracción por posición (coord x/y)
-        id_fiscal_pos, nombre_pos = extraer_datos_proveedor_por_posicion(pdf_path)
-        if id_fiscal_pos or nombre_pos:
-            # inyectar estos valores en la extracción completa
-            # si hay partidas por posición, usarlas para armar filas con ID/NOMBRE
-            partidas = extraer_partidas_por_posicion(pdf_path)
-            if partidas:
-                pedimento, tipo_cambio, aduana = extraer_cabecera_pedimento(texto)
-                resultados_local = []
-                for p in partidas:
-                    fila = {
-                        "NUM_PEDIMENTO": pedimento,
-                        "TIPO_CAMBIO": tipo_cambio,
-                        "ADUANA": aduana,
-                        "ID_FISCAL": id_fiscal_pos,
-                        "NOMBRE_DENOMINACION_O_RAZON_SOCIAL": nombre_pos,
-                        "SEC": p.get('SEC',''),
-                        "FRACCION": p.get('FRACCION',''),
-                        "DESCRIPCION": p.get('DESCRIPCION',''),
-                        "TASA_IGI": p.get('TASA_IGI','')
-                    }
-                    resultados_local.append(fila)
-                # convertir a df para mantener compatibilidad
-                df = pd.DataFrame(resultados_local)
-            else:
-                df = extraer_datos_completos(texto)
-                if not df.empty:
-                    df["ID_FISCAL"] = df["ID_FISCAL"].fillna("")
-                    df["NOMBRE_DENOMINACION_O_RAZON_SOCIAL"] = df["NOMBRE_DENOMINACION_O_RAZON_SOCIAL"].fillna("")
-                    df.loc[:, "ID_FISCAL"] = id_fiscal_pos
-                    df.loc[:, "NOMBRE_DENOMINACION_O_RAZON_SOCIAL"] = nombre_pos
+
+def recover_description_from_pdf(fuente, sec, fraccion):
+    """Abrir PDF y localizar la línea de partida (SEC y FRACCION) y devolver
+    la primera línea válida posterior a IVA/IGI como descripción.
+    `fuente` puede ser una ruta o un PedimentoDocument ya abierto.
+    """
+    return recover_descriptions_from_pdf(fuente, [(sec, fraccion)]).get((sec, fraccion))
+
+def _extraer_filas_documento(doc):
+    """Extrae las filas (una por partida, como dicts) de un documento ya abierto.
+
+    El texto completo solo se pide para el respaldo por texto; la cabecera se lee de
+    las primeras páginas.
+    """
+    # Primero intentar extracción por posición (coord x/y)
+    id_fiscal_pos, nombre_pos = extraer_datos_proveedor_por_posicion(doc)
+    if id_fiscal_pos or nombre_pos:
+        # inyectar estos valores en la extracción completa
+        # si hay partidas por posición, usarlas para armar filas con ID/NOMBRE
+        partidas = extraer_partidas_por_posicion(doc)
+        if partidas:
+            pedimento, tipo_cambio, aduana = extraer_cabecera_pedimento(doc.iterar_textos())
+            resultados_local = []
+            for p in partidas:
+                fila = {
+                    "NUM_PEDIMENTO": pedimento,
+                    "TIPO_CAMBIO": tipo_cambio,
+                    "ADUANA": aduana,
+                    "ID_FISCAL": id_fiscal_pos,
+                    "NOMBRE_DENOMINACION_O_RAZON_SOCIAL": nombre_pos,
+                    "SEC": p.get('SEC',''),
+                    "FRACCION": p.get('FRACCION',''),
+                    "DESCRIPCION": p.get('DESCRIPCION',''),
+                    "TASA_IGI": p.get('TASA_IGI','')
+                }
+                resultados_local.append(fila)
+            filas = resultados_local
         else:
-            # intentar extraer partidas por posición aun cuando no se obtuvo ID/NOMBRE por posición
-            partidas = extraer_partidas_por_posicion(pdf_path)
-            if partidas:
-                pedimento, tipo_cambio, aduana = extraer_cabecera_pedimento(texto)
-                resultados_local = []
-                for p in partidas:
-                    fila = {
-                        "NUM_PEDIMENTO": pedimento,
-                        "TIPO_CAMBIO": tipo_cambio,
-                        "ADUANA": aduana,
-                        "ID_FISCAL": "",
-                        "NOMBRE_DENOMINACION_O_RAZON_SOCIAL": "",
-                        "SEC": p.get('SEC',''),
-                        "FRACCION": p.get('FRACCION',''),
-                        "DESCRIPCION": p.get('DESCRIPCION',''),
-                        "TASA_IGI": p.get('TASA_IGI','')
-                    }
-                    resultados_local.append(fila)
-                df = pd.DataFrame(resultados_local)
-            else:
-                df = extraer_datos_completos(texto)
-        for _, row in df.iterrows():
-            fila = row.to_dict()
-            fila["Archivo"] = os.path.basename(pdf_path)
-            resultados.append(fila)
-    if resultados:
-        df_final = pd.DataFrame(resultados)
-        # Post-procesamiento: intentar recuperar IDs truncados (ej. 'GB' en vez de 'GB310726243')
-        # permitir dígitos separados por espacios/guiones (ej. 'GB 806 645 523')
-        posible_id_pat = re.compile(r"[A-Z]{1,3}[\s\-]*[0-9][0-9\s\-]{4,20}", re.IGNORECASE)
-        for idx, row in df_final.iterrows():
-            cur_id = str(row.get("ID_FISCAL", "") or "").strip()
-            # si el ID no contiene dígitos (p. ej. 'GB' o 'PENLON'), intentar recuperar un RFC/ID numérico desde el PDF
-            if cur_id and not re.search(r"\d", cur_id):
-                archivo = row.get("Archivo") or ""
-                pdf_path = os.path.join(carpeta, archivo) if archivo else None
-                if pdf_path and os.path.exists(pdf_path):
+            filas = _filas_datos_completos(doc.texto)
+            for fila in filas:
+                fila["ID_FISCAL"] = id_fiscal_pos
+                fila["NOMBRE_DENOMINACION_O_RAZON_SOCIAL"] = nombre_pos
+    else:
+        # intentar extraer partidas por posición aun cuando no se obtuvo ID/NOMBRE por posición
+        partidas = extraer_partidas_por_posicion(doc)
+        if partidas:
+            pedimento, tipo_cambio, aduana = extraer_cabecera_pedimento(doc.iterar_textos())
+            resultados_local = []
+            for p in partidas:
+                fila = {
+                    "NUM_PEDIMENTO": pedimento,
+                    "TIPO_CAMBIO": tipo_cambio,
+                    "ADUANA": aduana,
+                    "ID_FISCAL": "",
+                    "NOMBRE_DENOMINACION_O_RAZON_SOCIAL": "",
+                    "SEC": p.get('SEC',''),
+                    "FRACCION": p.get('FRACCION',''),
+                    "DESCRIPCION": p.get('DESCRIPCION',''),
+                    "TASA_IGI": p.get('TASA_IGI','')
+                }
+                resultados_local.append(fila)
+            filas = resultados_local
+        else:
+            filas = _filas_datos_completos(doc.texto)
+    return filas
+
+
+def _resolver_proveedor_truncado(id_fiscal, nombre, texto_pdf):
+    """Recupera el ID completo (y el nombre, si quedó truncado) del proveedor de un documento.
+
+    `id_fiscal` y `nombre` son los valores extraídos para el documento; devuelve
+    (id_fiscal, nombre) corregidos, o los mismos si no hay nada que recuperar.
+    """
+    cur_id = str(id_fiscal or "").strip()
+    # permitir dígitos separados por espacios/guiones (ej. 'GB 806 645 523')
+    posible_id_pat = POSIBLE_ID_RE
+    try:
+        # buscar coincidencias más largas que comiencen con las mismas letras
+        # localizar coincidencias con posición para elegir la más cercana a la cabecera
+        it = list(posible_id_pat.finditer(texto_pdf.upper()))
+        if it:
+            header_pos = texto_pdf.upper().find('DATOS DEL PROVEEDOR')
+            candidates = []
+            for m in it:
+                raw = m.group(0)
+                norm = SEPARADORES_ID_RE.sub("", raw)
+                # calcular longitud de la parte dígito
+                digits_len = len(NO_DIGITOS_RE.sub("", norm))
+                candidates.append((norm, raw, m.start(), m.end(), digits_len))
+            # elegir candidato más cercano a la cabecera; preferir digit_len razonable (6-12)
+            def score(c):
+                norm, _, posm, _, dlen = c
+                dist = abs((header_pos if header_pos!=-1 else 0) - posm)
+                # penalizar dígitos demasiado largos o cortos
+                penalty = 0
+                if dlen < 5 or dlen > 14:
+                    penalty += 100000
+                # prefer candidates starting with cur_id letters
+                if cur_id and norm.startswith(cur_id.upper()):
+                    penalty -= 1000
+                return dist + penalty
+            best = min(candidates, key=score)
+            chosen = best[0]
+            chosen_raw = best[1]
+            chosen_start = best[2]
+            chosen_end = best[3]
+            if chosen and len(chosen) > len(cur_id):
+                id_fiscal = chosen
+                # si el nombre actual es muy corto o es un sufijo (LIMITED, LTD, S.A., etc.), reconstruir nombre
+                nombre_actual = str(nombre) if nombre is not None else ''
+                short_name = len(nombre_actual.strip()) < 6 or any(suf.search(nombre_actual.strip()) for suf in SUFIJOS_SOCIEDAD_RE)
+                if short_name:
                     try:
-                        texto_pdf = extraer_texto_pdf(pdf_path)
-                        # buscar coincidencias más largas que comiencen con las mismas letras
-                        # localizar coincidencias con posición para elegir la más cercana a la cabecera
-                        it = list(re.finditer(posible_id_pat, texto_pdf.upper()))
-                        if it:
-                            header_pos = texto_pdf.upper().find('DATOS DEL PROVEEDOR')
-                            candidates = []
-                            for m in it:
-                                raw = m.group(0)
-                                norm = re.sub(r"[\s\-]", "", raw)
-                                # calcular longitud de la parte dígito
-                                digits_len = len(re.sub(r"\D", "", norm))
-                                candidates.append((norm, raw, m.start(), m.end(), digits_len))
-                            # elegir candidato más cercano a la cabecera; preferir digit_len razonable (6-12)
-                            def score(c):
-                                norm, posm, dlen = c
-                                dist = abs((header_pos if header_pos!=-1 else 0) - posm)
-                                # penalizar dígitos demasiado largos o cortos
-                                penalty = 0
-                                if dlen < 5 or dlen > 14:
-                                    penalty += 100000
-                                # prefer candidates starting with cur_id letters
-                                if cur_id and norm.startswith(cur_id.upper()):
-                                    penalty -= 1000
-                                return dist + penalty
-                            best = min(candidates, key=score)
-                            chosen = best[0]
-                            chosen_raw = best[1]
-                            chosen_start = best[2]
-                            chosen_end = best[3]
-                            if chosen and len(chosen) > len(cur_id):
-                                df_final.at[idx, "ID_FISCAL"] = chosen
-                                # si el nombre actual es muy corto o es un sufijo (LIMITED, LTD, S.A., etc.), reconstruir nombre
-                                nombre_actual = str(df_final.at[idx, "NOMBRE_DENOMINACION_O_RAZON_SOCIAL"]) if df_final.at[idx, "NOMBRE_DENOMINACION_O_RAZON_SOCIAL"] is not None else ''
-                                sufijos = {"LIMITED", "LTD", "S\.A\.", "SA", "S\.A\. DE C\.V\.", "INC", "LLC"}
-                                short_name = len(nombre_actual.strip()) < 6 or any(re.search(rf"^{suf}$", nombre_actual.strip(), re.IGNORECASE) for suf in ["LIMITED","LTD","INC","LLC","S\.A","SA"])
-                                if short_name:
-                                    try:
-                                        # extraer fragmento inmediatamente posterior al match en el PDF
-                                        tail = texto_pdf[chosen_end:chosen_end+200]
-                                        # cortar en la primera coma o salto de línea
-                                        tail_cut = re.split(r",|\n", tail)[0].strip()
-                                        # separar en palabras y detener en palabras de parada (lugares/domicilio)
-                                        stop_words = {"ABINGDON","SCIENCE","PARK","OXON","C.P.","CP","REINO","UNIDO","CIUDAD","NO","EXT","No.","C\.P\.","OX14","OX"}
-                                        words = [w.strip(' ,.;:') for w in tail_cut.split()]
-                                        name_parts = []
-                                        for w in words:
-                                            up = w.upper()
-                                            if up in stop_words:
-                                                break
-                                            name_parts.append(w)
-                                            if len(name_parts) >= 4:
-                                                break
-                                        if name_parts:
-                                            nuevo_nombre = " ".join(name_parts).strip(' ,;:')
-                                            # si el nuevo nombre empieza con un sufijo (ej. PENLON LIMITED -> starts with PENLON), usarlo
-                                            df_final.at[idx, "NOMBRE_DENOMINACION_O_RAZON_SOCIAL"] = nuevo_nombre
-                                    except Exception:
-                                        pass
+                        # extraer fragmento inmediatamente posterior al match en el PDF
+                        tail = texto_pdf[chosen_end:chosen_end+200]
+                        # cortar en la primera coma o salto de línea
+                        tail_cut = COMA_O_SALTO_RE.split(tail)[0].strip()
+                        # separar en palabras y detener en palabras de parada (lugares/domicilio)
+                        stop_words = {"ABINGDON","SCIENCE","PARK","OXON","C.P.","CP","REINO","UNIDO","CIUDAD","NO","EXT","No.",r"C\.P\.","OX14","OX"}
+                        words = [w.strip(' ,.;:') for w in tail_cut.split()]
+                        name_parts = []
+                        for w in words:
+                            up = w.upper()
+                            if up in stop_words:
+                                break
+                            name_parts.append(w)
+                            if len(name_parts) >= 4:
+                                break
+                        if name_parts:
+                            # si el nuevo nombre empieza con un sufijo (ej. PENLON LIMITED -> starts with PENLON), usarlo
+                            nombre = " ".join(name_parts).strip(' ,;:')
                     except Exception:
                         pass
-                # Corrección puntual: si ID quedó como palabra (ej. 'PENLON') y nombre es solo sufijo ('LIMITED'),
-                # buscar en el PDF la secuencia ID_full + nombre completo y asignar correctamente.
-                try:
-                    cur_id2 = str(df_final.at[idx, "ID_FISCAL"]) if "ID_FISCAL" in df_final.columns else cur_id
-                    cur_name2 = str(df_final.at[idx, "NOMBRE_DENOMINACION_O_RAZON_SOCIAL"]) if "NOMBRE_DENOMINACION_O_RAZON_SOCIAL" in df_final.columns else ''
-                    if cur_id2 and not re.search(r"\d", cur_id2) and cur_name2 and re.match(r"^(LIMITED|LTD|INC|LLC|S\.A\.|SA)$", cur_name2.strip(), re.IGNORECASE):
-                        # buscar patrón combinado en el texto: ID completo seguido del nombre (hasta coma)
-                        pattern = re.compile(r"([A-Z]{1,3}[\s\-]*[0-9][0-9\s\-]{4,20})\s+([A-Z0-9&\- ]{2,80}?\b(?:LIMITED|LTD|INC|LLC|S\.A\.|SA)\b)", re.IGNORECASE)
-                        m = pattern.search(texto_pdf)
-                        if m:
-                            full_id = re.sub(r"[\s\-]", "", m.group(1).upper())
-                            full_name = m.group(2).strip(' ,;:\n')
-                            # asignar solo si full_id contiene dígitos y parece válido
-                            if re.search(r"\d", full_id) and len(re.sub(r"\D", "", full_id)) >= 5:
-                                df_final.at[idx, "ID_FISCAL"] = full_id
-                                df_final.at[idx, "NOMBRE_DENOMINACION_O_RAZON_SOCIAL"] = full_name
-                except Exception:
-                    pass
-        # Post-procesamiento adicional: normalizar DESCRIPCION y extraer TASA_IGI si aparece incrustada
-        for idx, row in df_final.iterrows():
+    except Exception:
+        pass
+    # Corrección puntual: si ID quedó como palabra (ej. 'PENLON') y nombre es solo sufijo ('LIMITED'),
+    # buscar en el PDF la secuencia ID_full + nombre completo y asignar correctamente.
+    try:
+        cur_id2 = str(id_fiscal)
+        cur_name2 = str(nombre)
+        if cur_id2 and not DIGITO_RE.search(cur_id2) and cur_name2 and SOLO_SUFIJO_RE.match(cur_name2.strip()):
+            # buscar patrón combinado en el texto: ID completo seguido del nombre (hasta coma)
+            m = ID_Y_NOMBRE_SOCIEDAD_RE.search(texto_pdf)
+            if m:
+                full_id = SEPARADORES_ID_RE.sub("", m.group(1).upper())
+                full_name = m.group(2).strip(' ,;:\n')
+                # asignar solo si full_id contiene dígitos y parece válido
+                if DIGITO_RE.search(full_id) and len(NO_DIGITOS_RE.sub("", full_id)) >= 5:
+                    id_fiscal = full_id
+                    nombre = full_name
+    except Exception:
+        pass
+    return id_fiscal, nombre
+
+
+@instrumentacion.instrumentar("_recuperar_ids_truncados")
+def _recuperar_ids_truncados(filas, doc):
+    """Intenta recuperar IDs truncados (ej. 'GB' en vez de 'GB310726243') usando el texto del documento.
+
+    El proveedor es un dato de cabecera: se resuelve una vez por cada par
+    (ID_FISCAL, nombre) distinto del documento (normalmente uno solo) y el
+    resultado se asigna a todas sus filas.
+    """
+    col_nombre = "NOMBRE_DENOMINACION_O_RAZON_SOCIAL"
+    grupos = {}
+    for fila in filas:
+        id_fiscal = fila.get("ID_FISCAL")
+        cur_id = str(id_fiscal or "").strip()
+        # si el ID no contiene dígitos (p. ej. 'GB' o 'PENLON'), intentar recuperar un RFC/ID numérico desde el PDF
+        if cur_id and not DIGITO_RE.search(cur_id):
+            grupos.setdefault((id_fiscal, fila.get(col_nombre, '')), []).append(fila)
+    if not grupos:
+        return
+    texto_pdf = doc.texto
+    for (id_fiscal, nombre), filas_grupo in grupos.items():
+        instrumentacion.rama("ids.recuperacion")
+        nuevo_id, nuevo_nombre = _resolver_proveedor_truncado(id_fiscal, nombre, texto_pdf)
+        for fila in filas_grupo:
+            if nuevo_id is not id_fiscal:
+                fila["ID_FISCAL"] = nuevo_id
+            if nuevo_nombre is not nombre:
+                fila[col_nombre] = nuevo_nombre
+
+
+def _es_nulo(valor):
+    return valor is None or (isinstance(valor, float) and math.isnan(valor))
+
+
+def _limpiar_token(descripciones, patron):
+    """Quita `patron` de cada descripción y colapsa los espacios sobrantes."""
+    limpias = [patron.sub("", d).strip(' ,;') for d in descripciones]
+    return [ESPACIOS_RE.sub(" ", d).strip() for d in limpias]
+
+
+@instrumentacion.instrumentar("_normalizar_descripciones")
+def _normalizar_descripciones(filas, doc):
+    """Normaliza DESCRIPCION, extrae TASA_IGI incrustada y recupera descripciones vacías desde el documento."""
+    # Post-procesamiento adicional: normalizar DESCRIPCION y extraer TASA_IGI si aparece incrustada
+    # (por columnas: cada patrón se evalúa una sola vez sobre la columna y se escribe por índices)
+    try:
+        desc = ['' if _es_nulo(f.get('DESCRIPCION')) else str(f.get('DESCRIPCION')) for f in filas]
+        igi = [IGI_INCRUSTADO_RE.search(d) for d in desc]
+        con_igi = [i for i, m in enumerate(igi) if m]
+        # si no hay IGI pero hay IVA en la descripcion, quitar IVA del texto
+        con_iva = [i for i, m in enumerate(igi) if not m and IVA_INCRUSTADO_RE.search(desc[i])]
+        for i in con_igi:
+            filas[i]['TASA_IGI'] = igi[i].group(1)
+        # eliminar el token IGI del texto
+        for i, limpia in zip(con_igi, _limpiar_token([desc[i] for i in con_igi], IGI_INCRUSTADO_RE)):
+            filas[i]['DESCRIPCION'] = limpia
+        for i, limpia in zip(con_iva, _limpiar_token([desc[i] for i in con_iva], IVA_INCRUSTADO_RE)):
+            filas[i]['DESCRIPCION'] = limpia
+    except Exception:
+        pass
+    # Intentar recuperar DESCRIPCION vacías o de metadata buscando en el PDF la FRACCION y
+    # tomando la primera línea útil posterior a IVA/IGI (todas las filas en una sola pasada)
+    try:
+        descripciones = [f.get('DESCRIPCION') for f in filas]
+        como_texto = [str(d) for d in descripciones]
+        recuperar = [_es_nulo(d) or not t.strip() or META_RECUPERAR_RE.search(t) is not None
+                     for d, t in zip(descripciones, como_texto)]
+        pendientes = [(fila, (str(fila.get('SEC', '')), str(fila.get('FRACCION', ''))))
+                      for fila, r in zip(filas, recuperar) if r]
+        if pendientes:
+            recuperadas = recover_descriptions_from_pdf(doc, list(dict.fromkeys(par for _, par in pendientes)))
+            n_recuperadas = 0
+            for fila, par in pendientes:
+                nueva = recuperadas.get(par)
+                if nueva is not None:
+                    fila['DESCRIPCION'] = nueva
+                    n_recuperadas += 1
+            instrumentacion.rama("descripciones.pendientes", len(pendientes))
+            instrumentacion.rama("descripciones.recuperadas", n_recuperadas)
+    except Exception:
+        pass
+
+
+def _procesar_archivo(pdf_path, cache_dir=None):
+    """Procesa un PDF completo (extracción + post-procesamiento) y devuelve (filas, error, clasificacion, sha256).
+
+    Se ejecuta tanto en modo serial como dentro de los procesos del pool; cualquier
+    excepción se captura y se devuelve como texto para que un PDF corrupto no
+    detenga el lote. Con `cache_dir`, el texto y las palabras se leen/guardan en la
+    caché de páginas en disco. Antes de extraer se clasifica el documento con el
+    texto de su primera página; si no es un pedimento no se extrae nada (y no se
+    guarda en la caché, para no analizar el resto de sus páginas). `pdf_path` puede
+    ser también un miembro de un ZIP (entrada_zip.MiembroZip). El SHA-256 del
+    contenido se calcula aquí, en el proceso trabajador, para que el lote no vuelva a
+    leer el archivo para el manifiesto o el almacén SQLite.
+    """
+    try:
+        cache = cache_paginas.CachePaginas(cache_dir) if cache_dir else None
+        nombre = entrada_zip.nombre_entrada(pdf_path)
+        # Cada PDF se abre y analiza una sola vez; extracción y post-procesamiento comparten el documento
+        with instrumentacion.archivo(nombre), PedimentoDocument(pdf_path, cache=cache) as doc:
+            clasificacion = clasificador.clasificar(doc)
+            if clasificacion.tipo != clasificador.PEDIMENTO:
+                doc.close(guardar=False)
+                return [], None, clasificacion, doc.sha256
+            filas = _extraer_filas_documento(doc)
+            if not filas:
+                return [], None, clasificacion, doc.sha256
+            for fila in filas:
+                fila["Archivo"] = nombre
+            _recuperar_ids_truncados(filas, doc)
+            _normalizar_descripciones(filas, doc)
+        return filas, None, clasificacion, doc.sha256
+    except Exception as e:
+        return [], f"{type(e).__name__}: {e}", None, None
+
+
+def _iterar_resultados(pdfs, workers=1, cache_dir=None):
+    """Genera (pdf_path, (filas, error, clasificacion, sha256)) en el mismo orden que `pdfs`.
+
+    Con workers > 1 reparte los archivos en un ProcessPoolExecutor manteniendo como
+    máximo 2 * workers archivos en vuelo, de modo que la memoria no crece con el lote.
+    """
+    if workers <= 1:
+        for pdf_path in pdfs:
+            yield pdf_path, _procesar_archivo(pdf_path, cache_dir)
+        return
+    pendientes = collections.deque()
+    restantes = iter(pdfs)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        for pdf_path in itertools.islice(restantes, workers * 2):
+            pendientes.append((pdf_path, pool.submit(_procesar_archivo, pdf_path, cache_dir)))
+        while pendientes:
+            pdf_path, futuro = pendientes.popleft()
             try:
-                desc = str(row.get('DESCRIPCION', '') or '')
-                tasa = str(row.get('TASA_IGI', '') or '')
-                # buscar IGI explícito en la descripcion
-                m_igi = re.search(r"\bIGI\s*([0-9]+\.[0-9]{5})\b", desc, re.IGNORECASE)
-                m_iva = re.search(r"\bIVA\s*([0-9]+\.[0-9]{5})\b", desc, re.IGNORECASE)
-                if m_igi:
-                    df_final.at[idx, 'TASA_IGI'] = m_igi.group(1)
-                    # eliminar el token IGI del texto
-                    newd = re.sub(r"\bIGI\s*[0-9]+\.[0-9]{5}\b", "", desc, flags=re.IGNORECASE).strip(' ,;')
-                    df_final.at[idx, 'DESCRIPCION'] = re.sub(r"\s{2,}", " ", newd).strip()
-                else:
-                    # si no hay IGI pero hay IVA en la descripcion, quitar IVA del texto
-                    if m_iva:
-                        newd = re.sub(r"\bIVA\s*[0-9]+\.[0-9]{5}\b", "", desc, flags=re.IGNORECASE).strip(' ,;')
-                        df_final.at[idx, 'DESCRIPCION'] = re.sub(r"\s{2,}", " ", newd).strip()
-                    # si aun no hay tasa y la columna tasa tiene valor, mantenerla
-                    if (not df_final.at[idx, 'TASA_IGI'] or str(df_final.at[idx, 'TASA_IGI']).strip() == '') and tasa:
-                        df_final.at[idx, 'TASA_IGI'] = tasa
-            except Exception:
-                pass
-            # Intentar recuperar DESCRIPCION vacías buscando en el PDF la FRACCION y tomando
-            # la primera línea útil posterior a IVA/IGI
+                resultado = futuro.result()
+            except Exception as e:
+                # p. ej. el proceso trabajador murió; registrar el error y seguir con el lote
+                resultado = [], f"{type(e).__name__}: {e}", None, None
+            siguiente = next(restantes, None)
+            if siguiente is not None:
+                pendientes.append((siguiente, pool.submit(_procesar_archivo, siguiente, cache_dir)))
+            yield pdf_path, resultado
+
+
+def _cargar_estado_incremental(archivo_salida_csv):
+    """Devuelve (manifiesto, filas previas por Archivo) para una re-extracción incremental.
+
+    Si el CSV previo no existe se ignora el manifiesto y se procesa todo de nuevo.
+    """
+    ruta_manifiesto = os.path.splitext(archivo_salida_csv)[0] + ".manifest.json"
+    if not os.path.exists(archivo_salida_csv):
+        return manifiesto.Manifiesto(ruta_manifiesto, EXTRACTOR_VERSION), {}
+    filas_previas = {}
+    with open(archivo_salida_csv, newline="", encoding="utf-8") as fh:
+        for fila in csv.DictReader(fh):
+            filas_previas.setdefault(fila.get("Archivo", ""), []).append(fila)
+    return manifiesto.Manifiesto.cargar(ruta_manifiesto, EXTRACTOR_VERSION), filas_previas
+
+
+def _listar_entradas(carpeta, errores):
+    """PDFs de `carpeta` en el orden del listado; cada ZIP se sustituye por sus PDFs (ver entrada_zip)."""
+    entradas = []
+    for path in glob.glob(os.path.join(carpeta, '*')):
+        if path.lower().endswith('.pdf'):
+            entradas.append(path)
+        elif path.lower().endswith('.zip'):
             try:
-                is_meta = df_final['DESCRIPCION'].astype(str).str.contains(r"\b(IDENTIF|COMPLEMENTO|SERIES:|GUIA|ORDEN\s+EMBARQUE|RFC:|E\.FIRMA|NUMERO DE SERIE|NO ES LA DESCRIPCION|ESTO NO ES LA DESCRIPCION)\b", case=False, na=False)
-                empty_mask = df_final['DESCRIPCION'].isnull() | (df_final['DESCRIPCION'].astype(str).str.strip() == '')
-                recover_mask = empty_mask | is_meta
-                for idx in df_final[recover_mask].index:
-                    try:
-                        archivo = df_final.at[idx, 'Archivo'] if 'Archivo' in df_final.columns else ''
-                        pdf_path = os.path.join(carpeta, archivo) if archivo else None
-                        if pdf_path and os.path.exists(pdf_path):
-                            sec = str(df_final.at[idx, 'SEC']) if 'SEC' in df_final.columns else ''
-                            fr = str(df_final.at[idx, 'FRACCION']) if 'FRACCION' in df_final.columns else ''
-                            desc_rec = recover_description_from_pdf(pdf_path, sec, fr)
-                            if desc_rec:
-                                df_final.at[idx, 'DESCRIPCION'] = desc_rec
-                    except Exception:
-                        continue
-            except Exception:
-                pass
-        df_final.to_csv(archivo_salida_csv, index=False, encoding="utf-8")
-        print(f"Extracción completada. Archivo generado: {archivo_salida_csv}")
+                entradas.extend(entrada_zip.miembros_pdf(path))
+            except (OSError, zipfile.BadZipFile) as e:
+                nombre = os.path.basename(path)
+                print(f"  Error en {nombre}: {type(e).__name__}: {e}")
+                errores.append((nombre, f"{type(e).__name__}: {e}"))
+    return entradas
+
+
+def procesar_pedimentos_y_generar_csv(carpeta, archivo_salida_csv, workers=1, cache_dir=None, incremental=False,
+                                     archivo_salida_jsonl=None, carpeta_xml=None, archivo_sqlite=None):
+    """Procesa los pedimentos de `carpeta` y escribe el CSV consolidado (y JSONL si se indica).
+
+    Las filas de cada PDF se escriben en cuanto ese archivo termina (ver
+    escritor_salida), en el orden del listado de la carpeta, y la salida se renombra
+    de forma atómica al final. Con `incremental=True` solo se procesan los PDFs nuevos
+    o modificados según el manifiesto junto al CSV; las filas de los demás se toman
+    del CSV existente y las de archivos eliminados se descartan.
+
+    Con `carpeta_xml`, los COVE de esa carpeta (ver pedimentos_xml) completan las filas
+    del PDF con el mismo número de pedimento, y los pedimentos que solo tienen XML se
+    añaden al final.
+
+    Con `archivo_sqlite`, las mismas filas se guardan además en esa base de datos
+    (ver almacen_sqlite), identificando cada archivo por su SHA-256 y su nombre; los
+    documentos que ya no están en la carpeta se eliminan de ella. En modo incremental
+    los documentos sin cambios que ya están en la base no se vuelven a escribir.
+
+    Los ZIP de la carpeta se procesan sin descomprimirlos a disco: cada PDF que
+    contienen se trata como un archivo más, llamado `lote.zip/miembro.pdf`.
+    """
+    errores = []
+    indice_xml = pedimentos_xml.cargar_indice(carpeta_xml)
+    claves_resueltas = set()
+
+    def resolver(filas):
+        filas, clave = pedimentos_xml.resolver_filas(filas, indice_xml)
+        if clave:
+            claves_resueltas.add(clave)
+        return filas, clave
+
+    # Todos los PDF de la carpeta (y de sus ZIP): el clasificador (primera página) decide cuáles son pedimentos
+    pdfs = _listar_entradas(carpeta, errores)
+    manifiesto_lote, filas_previas = (None, {})
+    if incremental:
+        manifiesto_lote, filas_previas = _cargar_estado_incremental(archivo_salida_csv)
+    sin_cambios = set()
+    a_procesar = []
+    for pdf_path in pdfs:
+        nombre = entrada_zip.nombre_entrada(pdf_path)
+        if manifiesto_lote is not None and manifiesto_lote.sin_cambios(nombre, pdf_path):
+            sin_cambios.add(nombre)
+        else:
+            a_procesar.append(pdf_path)
+    if incremental:
+        print(f"Incremental: {len(a_procesar)} archivos nuevos o modificados, {len(sin_cambios)} sin cambios")
+    resultados = _iterar_resultados(a_procesar, workers, cache_dir)
+    almacen = almacen_sqlite.AlmacenSQLite(archivo_sqlite) if archivo_sqlite else None
+    documentos_vigentes = []
+    documentos_guardados = almacen.documentos() if almacen is not None and sin_cambios else set()
+
+    def guardar(path, filas, sha256=None):
+        if almacen is not None and filas:
+            documentos_vigentes.append(almacen.guardar_documento(sha256 or entrada_zip.hash_entrada(path), filas))
+
+    with contextlib.ExitStack() as pila:
+        escritor = pila.enter_context(
+            escritor_salida.EscritorSalida(archivo_salida_csv, COLUMNAS_SALIDA, ruta_jsonl=archivo_salida_jsonl))
+        if almacen is not None:
+            pila.enter_context(almacen)
+        # recorrer el listado de la carpeta intercalando filas previas y nuevas, igual que una ejecución completa
+        for pdf_path in pdfs:
+            nombre = entrada_zip.nombre_entrada(pdf_path)
+            if nombre in sin_cambios:
+                filas, clave_xml = resolver(filas_previas.pop(nombre, []))
+                escritor.escribir(filas)
+                sha256 = manifiesto_lote.archivos[nombre].get("sha256")
+                clave = almacen_sqlite.clave_documento(sha256, filas)
+                # ya guardado en una ejecución anterior: solo se marca como vigente (salvo
+                # que lo complete un COVE, que puede haber cambiado desde entonces)
+                if clave in documentos_guardados and not clave_xml:
+                    documentos_vigentes.append(clave)
+                else:
+                    guardar(pdf_path, filas, sha256)
+                continue
+            _, (filas, error, clasificacion, sha256) = next(resultados)
+            if clasificacion is not None and clasificacion.tipo != clasificador.PEDIMENTO:
+                print(f"Omitido: {nombre} ({clasificacion.tipo}, confianza {clasificacion.confianza:.2f})")
+            else:
+                print(f"Procesando: {nombre}")
+            if error:
+                print(f"  Error en {nombre}: {error}")
+                errores.append((nombre, error))
+                if manifiesto_lote is not None:
+                    manifiesto_lote.olvidar(nombre)
+                continue
+            filas, _ = resolver(filas)
+            escritor.escribir(filas)
+            guardar(pdf_path, filas, sha256)
+            if manifiesto_lote is not None:
+                manifiesto_lote.registrar(nombre, pdf_path, sha256)
+        for clave, filas_xml in indice_xml.items():
+            if clave not in claves_resueltas:
+                escritor.escribir(filas_xml)
+                por_archivo = {}
+                for fila in filas_xml:
+                    por_archivo.setdefault(fila["Archivo"], []).append(fila)
+                for archivo, filas in por_archivo.items():
+                    guardar(os.path.join(carpeta_xml, archivo), filas)
+        if almacen is not None:
+            almacen.conservar(documentos_vigentes)
+        if escritor.filas_escritas:
+            escritor.cerrar()
+            print(f"Extracción completada. Archivo generado: {archivo_salida_csv}")
+        else:
+            escritor.descartar()
+    if manifiesto_lote is not None:
+        manifiesto_lote.guardar([entrada_zip.nombre_entrada(p) for p in pdfs])
+    if errores:
+        print(f"Archivos con error: {len(errores)}")
+    return errores
 
 if __name__ == "__main__":
-    procesar_pedimentos_y_generar_csv("PEDIMENTOS 2025/PEDIMENTOS_VALIDOS", "salida/pedimentos_completo.csv")
+    import argparse
+    parser = argparse.ArgumentParser(description="Extrae partidas de pedimentos PDF a CSV.")
+    parser.add_argument("--workers", type=int, default=1, help="procesos en paralelo (1 = serial)")
+    parser.add_argument("--cache-dir", default="salida/.cache", help="caché de páginas en disco (texto y palabras por PDF)")
+    parser.add_argument("--sin-cache", action="store_true", help="no leer ni escribir la caché de páginas")
+    parser.add_argument("--completo", action="store_true", help="reprocesar todos los PDFs en vez de solo los nuevos o modificados")
+    parser.add_argument("--xml", default="PEDIMENTOS 2025/pedimentos_xml", help="carpeta con XML de COVE que completan/prefieren sobre el PDF ('' para omitirla)")
+    parser.add_argument("--traza", help="activar la instrumentación y escribir la traza por archivo (JSON Lines) en esta ruta")
+    parser.add_argument("--top", type=int, default=10, help="cuántos archivos lentos mostrar con --traza")
+    parser.add_argument("--jsonl", default="salida/pedimentos_completo.jsonl", help="salida adicional en JSON Lines ('' para omitirla)")
+    parser.add_argument("--sqlite", default="", help="guardar también las filas en esta base SQLite indexada (p. ej. salida/pedimentos.sqlite)")
+    args = parser.parse_args()
+    if args.traza:
+        instrumentacion.activar(args.traza)
+    procesar_pedimentos_y_generar_csv(
+        "PEDIMENTOS 2025/PEDIMENTOS_VALIDOS", "salida/pedimentos_completo.csv",
+        workers=args.workers, cache_dir=None if args.sin_cache else args.cache_dir,
+        incremental=not args.completo, archivo_salida_jsonl=args.jsonl or None, carpeta_xml=args.xml or None,
+        archivo_sqlite=args.sqlite or None,
+    )
+    if args.traza:
+        instrumentacion.imprimir_resumen(args.traza, args.top)
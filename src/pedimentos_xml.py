@@ -0,0 +1,210 @@
+"""Extracción desde los XML de COVE (solicitarRecibirCoveServicio) de la Ventanilla Única.
+
+Los COVE traen en forma estructurada el proveedor (emisor), las facturas y la
+descripción y valor de cada mercancía, así que leerlos con un parser en streaming
+(iterparse) es mucho más barato que el análisis de layout de un PDF. Las filas
+usan el mismo esquema que mapear_campos (COLUMNAS_SALIDA); SEC, FRACCION y
+TASA_IGI no existen en el COVE y quedan vacías.
+
+El COVE no incluye el número de pedimento: se toma del nombre del archivo
+("... para pedimento 3542-5002734.xml", patente y número). `resolver_filas`
+combina las filas de un PDF con las del COVE del mismo pedimento, prefiriendo
+los datos del XML solo donde una clave (proveedor, descripción) los relaciona.
+"""
+import glob
+import os
+import re
+import xml.etree.ElementTree as ET
+
+PEDIMENTO_ARCHIVO_RE = re.compile(r"(\d{4})\s*-\s*(\d{7})")
+# "25 16 3542 5002734" -> patente 3542, número 5002734
+CLAVE_PEDIMENTO_RE = re.compile(r"(\d{4})\s*(\d{7})\s*$")
+SEPARADORES_ID_RE = re.compile(r"[\s\-]+")
+ESPACIOS_RE = re.compile(r"\s+")
+
+# campos del COVE que prevalecen sobre los extraídos del PDF
+CAMPOS_PROVEEDOR = ("ID_FISCAL", "NOMBRE_DENOMINACION_O_RAZON_SOCIAL")
+
+
+def _local(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def _texto_hijo(elem, nombre):
+    for hijo in elem:
+        if _local(hijo.tag) == nombre:
+            return (hijo.text or "").strip()
+    return ""
+
+
+def _hijo(elem, nombre):
+    for hijo in elem:
+        if _local(hijo.tag) == nombre:
+            return hijo
+    return None
+
+
+def clave_pedimento(num_pedimento):
+    """Normaliza un número de pedimento a 'patente-número', o '' si no se reconoce."""
+    m = CLAVE_PEDIMENTO_RE.search(str(num_pedimento or ""))
+    return f"{m.group(1)}-{m.group(2)}" if m else ""
+
+
+def clave_desde_archivo(path):
+    m = PEDIMENTO_ARCHIVO_RE.search(os.path.basename(path))
+    return f"{m.group(1)}-{m.group(2)}" if m else ""
+
+
+def iterar_comprobantes(path):
+    """Genera un dict por cada <comprobantes> del COVE sin cargar el árbol completo.
+
+    Cada dict trae la factura, el emisor (identificación y nombre) y la lista de
+    mercancías (descripción, cantidad y valores). Los elementos ya leídos se
+    liberan con clear() para que la memoria no crezca con el tamaño del XML.
+    """
+    for _, elem in ET.iterparse(path, events=("end",)):
+        if _local(elem.tag) != "comprobantes":
+            continue
+        emisor = _hijo(elem, "emisor")
+        mercancias = []
+        for hijo in elem:
+            if _local(hijo.tag) == "mercancias":
+                mercancias.append({
+                    "descripcion": _texto_hijo(hijo, "descripcionGenerica"),
+                    "cantidad": _texto_hijo(hijo, "cantidad"),
+                    "valor_total": _texto_hijo(hijo, "valorTotal"),
+                    "valor_dolares": _texto_hijo(hijo, "valorDolares"),
+                    "moneda": _texto_hijo(hijo, "tipoMoneda"),
+                })
+        yield {
+            "factura": _texto_hijo(elem, "numeroFacturaOriginal"),
+            "e_document": _texto_hijo(elem, "e-document"),
+            "id_fiscal": _texto_hijo(emisor, "identificacion") if emisor is not None else "",
+            "nombre": _texto_hijo(emisor, "nombre") if emisor is not None else "",
+            "mercancias": mercancias,
+        }
+        elem.clear()
+
+
+def filas_desde_cove(path):
+    """Filas (esquema de COLUMNAS_SALIDA) de un XML de COVE, una por mercancía."""
+    clave = clave_desde_archivo(path)
+    filas = []
+    for comp in iterar_comprobantes(path):
+        for merc in comp["mercancias"]:
+            filas.append({
+                "NUM_PEDIMENTO": clave.replace("-", " "),
+                "TIPO_CAMBIO": "",
+                "ADUANA": "",
+                "ID_FISCAL": comp["id_fiscal"],
+                "NOMBRE_DENOMINACION_O_RAZON_SOCIAL": comp["nombre"],
+                "SEC": "",
+                "FRACCION": "",
+                "DESCRIPCION": merc["descripcion"],
+                "TASA_IGI": "",
+                "Archivo": os.path.basename(path),
+            })
+    return filas
+
+
+def cargar_indice(carpeta):
+    """Lee todos los XML de `carpeta` y devuelve {clave_pedimento: filas}.
+
+    Los XML que no son COVE (acuses, digitalizaciones) o que no se pueden leer no
+    aportan filas.
+    """
+    indice = {}
+    if not carpeta or not os.path.isdir(carpeta):
+        return indice
+    for path in sorted(glob.glob(os.path.join(carpeta, "*.xml"))):
+        clave = clave_desde_archivo(path)
+        if not clave:
+            continue
+        try:
+            filas = filas_desde_cove(path)
+        except ET.ParseError:
+            continue
+        if filas:
+            indice.setdefault(clave, []).extend(filas)
+    return indice
+
+
+def _id(valor):
+    return SEPARADORES_ID_RE.sub("", str(valor or "")).upper()
+
+
+def _texto(valor):
+    return ESPACIOS_RE.sub(" ", str(valor or "")).strip().upper()
+
+
+def _proveedor_cove(fila, proveedores, unico_en_pdf):
+    """(id, nombre) del emisor del COVE que corresponde al proveedor de `fila`, o None.
+
+    Corresponden si el ID del PDF es el del emisor (o un prefijo suyo: el PDF lo
+    trunca a veces) o si coincide el nombre. Sin esa clave solo se acepta el caso
+    sin ambigüedad: un único emisor en el COVE y un único proveedor en el PDF.
+    """
+    id_pdf = _id(fila.get("ID_FISCAL"))
+    nombre_pdf = _texto(fila.get("NOMBRE_DENOMINACION_O_RAZON_SOCIAL"))
+    candidatos = [p for p in proveedores
+                  if (id_pdf and _id(p[0]).startswith(id_pdf)) or (nombre_pdf and _texto(p[1]) == nombre_pdf)]
+    if len(candidatos) == 1:
+        return candidatos[0]
+    if not candidatos and len(proveedores) == 1 and unico_en_pdf:
+        return proveedores[0]
+    return None
+
+
+def _descripcion_cove(descripcion_pdf, descripciones):
+    """Descripción del COVE que corresponde a la del PDF, o None si no hay una sola.
+
+    Una descripción del PDF corresponde a la del COVE que es igual o empieza por
+    ella (el PDF la trunca). Una descripción vacía solo se completa si todas las
+    mercancías candidatas tienen la misma.
+    """
+    texto = _texto(descripcion_pdf)
+    if texto:
+        candidatas = {d for d in descripciones if _texto(d).startswith(texto)}
+    else:
+        candidatas = set(descripciones)
+    return candidatas.pop() if len(candidatas) == 1 else None
+
+
+def resolver_filas(filas_pdf, indice):
+    """Combina las filas de un PDF con las del COVE del mismo pedimento, si existe.
+
+    El COVE no trae SEC ni fracción, y sus mercancías van por factura, no por
+    partida: el orden de unas y otras no se corresponde. Por eso cada fila del PDF
+    toma el emisor del COVE que corresponde a su proveedor (ver _proveedor_cove) y
+    la descripción que corresponde a la suya entre las de ese emisor (ver
+    _descripcion_cove); lo que no corresponde a nada se deja como en el PDF.
+    Devuelve (filas, clave usada o '').
+    """
+    if not filas_pdf or not indice:
+        return filas_pdf, ""
+    clave = clave_pedimento(filas_pdf[0].get("NUM_PEDIMENTO"))
+    filas_xml = indice.get(clave)
+    if not filas_xml:
+        return filas_pdf, ""
+    proveedores = list(dict.fromkeys((f.get("ID_FISCAL", ""), f.get("NOMBRE_DENOMINACION_O_RAZON_SOCIAL", ""))
+                                     for f in filas_xml))
+    descripciones = {}
+    for f in filas_xml:
+        if f.get("DESCRIPCION"):
+            descripciones.setdefault((f.get("ID_FISCAL", ""), f.get("NOMBRE_DENOMINACION_O_RAZON_SOCIAL", "")),
+                                     []).append(f["DESCRIPCION"])
+    unico_en_pdf = len({(_id(f.get("ID_FISCAL")), _texto(f.get("NOMBRE_DENOMINACION_O_RAZON_SOCIAL")))
+                        for f in filas_pdf}) == 1
+    resueltas = []
+    for fila in filas_pdf:
+        nueva = dict(fila)
+        proveedor = _proveedor_cove(fila, proveedores, unico_en_pdf)
+        if proveedor is not None:
+            for campo, valor in zip(CAMPOS_PROVEEDOR, proveedor):
+                if valor:
+                    nueva[campo] = valor
+            descripcion = _descripcion_cove(fila.get("DESCRIPCION"), descripciones.get(proveedor, []))
+            if descripcion is not None:
+                nueva["DESCRIPCION"] = descripcion
+        resueltas.append(nueva)
+    return resueltas, clave
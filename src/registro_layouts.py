@@ -0,0 +1,98 @@
+"""Registro de layouts de cabecera ya vistos (proveedor y partidas por posición).
+
+Los pedimentos salen de unos pocos programas de agentes aduanales, y en cada uno
+la línea de cabecera de una sección (ID. FISCAL / NOMBRE... o SEC / FRACCION /
+DESCRIPCION...) tiene siempre las mismas palabras en las mismas x. La huella de
+un layout es esa línea: sus palabras con el x0 redondeado. El registro guarda por
+cada huella qué palabra de la línea abre cada columna, así que en una página con
+un layout conocido el extractor solo comprueba si la línea está (buscando su
+primera palabra por x0) y toma las columnas de ahí, sin recorrer las palabras
+ancla de la página ni volver a mapear la cabecera. Los límites se calculan con
+los x0 exactos de la línea encontrada, de modo que el resultado es el mismo que
+con la detección completa. La posición vertical de la cabecera no se guarda:
+depende del contenido (largo del bloque del proveedor, partidas que siguen de la
+página anterior).
+
+Con la caché de páginas el registro se guarda en `layouts.json` dentro de su
+directorio: cada proceso lo lee una vez y, al cerrar un documento que enseñó
+layouts nuevos, los añade al archivo mezclándolos con los que hayan guardado
+otros procesos.
+"""
+import json
+import os
+
+ARCHIVO = "layouts.json"
+FORMATO = 1
+# huellas por sección; por encima del tope las páginas nuevas se siguen detectando sin aprenderlas
+MAX_LAYOUTS = 64
+
+# ruta del archivo (None = solo en memoria) -> registro compartido por el proceso
+_REGISTROS = {}
+
+
+def huella(textos, x0s):
+    """Huella de una línea de cabecera: ((texto, x0 redondeado), ...) en orden de x0."""
+    return tuple((t, round(x)) for t, x in zip(textos, x0s))
+
+
+def para_directorio(directorio=None):
+    """Registro del proceso para la caché en `directorio` (o solo en memoria, sin directorio)."""
+    ruta = os.path.join(directorio, ARCHIVO) if directorio else None
+    if ruta not in _REGISTROS:
+        _REGISTROS[ruta] = RegistroLayouts(ruta)
+    return _REGISTROS[ruta]
+
+
+def _leer(ruta):
+    """{sección: {huella: columnas}} de `ruta`; si no existe o está dañado, vacío."""
+    try:
+        with open(ruta, encoding="utf-8") as fh:
+            datos = json.load(fh)
+        if datos.get("formato") != FORMATO:
+            return {}
+        return {seccion: {tuple(tuple(p) for p in l["palabras"]): tuple(tuple(c) for c in l["columnas"])
+                          for l in layouts}
+                for seccion, layouts in datos.get("secciones", {}).items()}
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return {}
+
+
+class RegistroLayouts:
+    def __init__(self, ruta=None):
+        self.ruta = ruta
+        self._layouts = _leer(ruta) if ruta else {}
+        self._pendientes = False
+
+    def conocidos(self, seccion):
+        """{huella: columnas} de la sección; columnas es ((nombre, posición en la línea), ...)."""
+        return self._layouts.get(seccion, {})
+
+    def aprender(self, seccion, huella_linea, columnas):
+        layouts = self._layouts.setdefault(seccion, {})
+        if huella_linea in layouts or len(layouts) >= MAX_LAYOUTS:
+            return
+        layouts[huella_linea] = tuple(columnas)
+        self._pendientes = True
+
+    def guardar(self):
+        """Añade al archivo los layouts aprendidos desde la última vez (sin archivo, no hace nada)."""
+        if not self.ruta or not self._pendientes:
+            return
+        en_disco = _leer(self.ruta)
+        for seccion, layouts in self._layouts.items():
+            destino = en_disco.setdefault(seccion, {})
+            for h, columnas in layouts.items():
+                if h not in destino and len(destino) < MAX_LAYOUTS:
+                    destino[h] = columnas
+        self._layouts = en_disco
+        datos = {
+            "formato": FORMATO,
+            "secciones": {seccion: [{"palabras": [list(p) for p in h], "columnas": [list(c) for c in columnas]}
+                                    for h, columnas in layouts.items()]
+                          for seccion, layouts in en_disco.items()},
+        }
+        tmp = f"{self.ruta}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(datos, fh, ensure_ascii=False)
+        os.replace(tmp, self.ruta)
+        self._pendientes = False
@@ -0,0 +1,358 @@
+"""Servicio de extracción continua: vigila la carpeta de entrada y procesa cada PDF al llegar.
+
+Los agentes aduanales dejan PDFs en la carpeta a lo largo del día. En vez de volver
+a lanzar el lote completo, el servicio vigila la carpeta (inotify en Linux, vía
+ctypes; sondeo periódico si inotify no está disponible) y espera a que cada
+archivo deje de cambiar durante `espera_estable` segundos, para no procesar una
+copia a medias. Después lo encola en un pool de procesos que se mantiene vivo, así
+pandas y pdfplumber se importan una sola vez. Las filas de cada PDF se guardan en
+el almacén SQLite (ver almacen_sqlite) en cuanto ese archivo termina.
+
+Un manifiesto junto a la base (ver manifiesto) recuerda los archivos ya procesados,
+así que al arrancar solo se procesan los nuevos o modificados desde la última vez.
+
+Uso:
+  python src/servicio.py [--carpeta DIR] [--sqlite RUTA] [--workers N] [--espera 2]
+         [--intervalo 1] [--sondeo] [--cache-dir DIR | --sin-cache] [--xml DIR]
+"""
+import concurrent.futures
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+try:
+    from src import almacen_sqlite, clasificador, manifiesto, mapear_campos, pedimentos_xml
+except ImportError:  # ejecución directa: python src/servicio.py
+    import almacen_sqlite
+    import clasificador
+    import manifiesto
+    import mapear_campos
+    import pedimentos_xml
+
+# eventos de inotify (sys/inotify.h) de un archivo creado, escrito o movido a la carpeta
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+# la carpeta vigilada se movió; el kernel retira la vigilancia (IN_IGNORED) si se borra
+IN_MOVE_SELF = 0x800
+# se llenó la cola del kernel y se perdieron eventos (llega sin pedirlo, con wd = -1)
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+MASCARA_INOTIFY = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MOVE_SELF
+# struct inotify_event: wd, mask, cookie, len; le sigue el nombre (len bytes con relleno NUL)
+EVENTO_INOTIFY = struct.Struct("iIII")
+
+
+class _Inotify:
+    """Nombres de los archivos que cambian en `carpeta`, leídos de inotify con ctypes.
+
+    Si el kernel avisa de que perdió eventos (IN_Q_OVERFLOW, p. ej. al copiar un
+    lote grande) se devuelven todos los archivos de la carpeta, como en el sondeo.
+    Si la vigilancia se pierde porque la carpeta se borró o se movió, se vuelve a
+    poner sobre la ruta en cuanto exista de nuevo, también con una revisión completa.
+    """
+
+    def __init__(self, carpeta):
+        self.carpeta = carpeta
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        # fuera de Linux libc no tiene inotify_init1 (AttributeError): se usa el sondeo
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        self._wd = None
+        try:
+            self._vigilar()
+        except OSError:
+            os.close(self._fd)
+            raise
+
+    def _vigilar(self):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(self.carpeta), MASCARA_INOTIFY)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_add_watch", self.carpeta)
+        self._wd = wd
+
+    def _todos(self):
+        try:
+            return set(os.listdir(self.carpeta))
+        except FileNotFoundError:
+            return set()
+
+    def _leer(self):
+        return os.read(self._fd, 64 * 1024)
+
+    def cambios(self, timeout):
+        if self._wd is None:
+            try:
+                self._vigilar()
+            except OSError:
+                time.sleep(timeout)
+                return set()
+            return self._todos()
+        listos, _, _ = select.select([self._fd], [], [], timeout)
+        if not listos:
+            return set()
+        try:
+            datos = self._leer()
+        except BlockingIOError:
+            return set()
+        return self._procesar(datos)
+
+    def _procesar(self, datos):
+        nombres = set()
+        revisar_todo = False
+        pos = 0
+        while pos + EVENTO_INOTIFY.size <= len(datos):
+            wd, mascara, _, largo = EVENTO_INOTIFY.unpack_from(datos, pos)
+            pos += EVENTO_INOTIFY.size
+            nombre = datos[pos:pos + largo].rstrip(b"\0")
+            pos += largo
+            if mascara & IN_Q_OVERFLOW:
+                revisar_todo = True
+            elif mascara & (IN_IGNORED | IN_MOVE_SELF):
+                # los eventos de una vigilancia ya retirada no cuentan
+                if wd == self._wd:
+                    if mascara & IN_MOVE_SELF:
+                        # la ruta ya no es esta carpeta; al retirarla llega su IN_IGNORED
+                        self._libc.inotify_rm_watch(self._fd, wd)
+                    self._wd = None
+            elif nombre:
+                nombres.add(os.fsdecode(nombre))
+        if revisar_todo:
+            nombres |= self._todos()
+        return nombres
+
+    def close(self):
+        os.close(self._fd)
+
+
+class _Sondeo:
+    """Alternativa sin inotify: tras `timeout` segundos, todos los archivos de la carpeta."""
+
+    def __init__(self, carpeta):
+        self.carpeta = carpeta
+        self._error = None
+
+    def cambios(self, timeout):
+        time.sleep(timeout)
+        # como con inotify al perder la vigilancia: si la carpeta no se puede leer
+        # (desmontada, borrada, sin permisos) se vuelve a intentar en la siguiente vuelta
+        try:
+            nombres = set(os.listdir(self.carpeta))
+        except OSError as e:
+            if self._error is None:
+                print(f"No se puede leer {self.carpeta} ({e}); se reintenta")
+            self._error = e
+            return set()
+        if self._error is not None:
+            print(f"{self.carpeta} vuelve a estar disponible")
+            self._error = None
+        return nombres
+
+    def close(self):
+        pass
+
+
+class VigilanteCarpeta:
+    """Entrega los PDFs nuevos o modificados de `carpeta` una vez que dejan de cambiar.
+
+    Un archivo está listo cuando su tamaño y mtime no cambian durante `espera_estable`
+    segundos. `conocidos` ({nombre: (mtime_ns, tamaño)}) son los ya entregados, que
+    no se vuelven a entregar mientras no cambien; los que ya estaban en la carpeta y
+    no son conocidos se entregan como nuevos.
+    """
+
+    def __init__(self, carpeta, espera_estable=2.0, intervalo=1.0, sondeo=False, conocidos=None):
+        self.carpeta = carpeta
+        self.espera_estable = espera_estable
+        self.intervalo = intervalo
+        self.conocidos = dict(conocidos or {})
+        # nombre -> (firma, instante en que se vio esa firma por primera vez)
+        self._pendientes = {}
+        self._fuente = None
+        if not sondeo:
+            try:
+                self._fuente = _Inotify(carpeta)
+            except (AttributeError, OSError):
+                self._fuente = None
+        if self._fuente is None:
+            self._fuente = _Sondeo(carpeta)
+        self._observar(os.listdir(carpeta))
+
+    @property
+    def usa_inotify(self):
+        return isinstance(self._fuente, _Inotify)
+
+    def _firma(self, nombre):
+        try:
+            st = os.stat(os.path.join(self.carpeta, nombre))
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _observar(self, nombres):
+        ahora = time.monotonic()
+        for nombre in nombres:
+            if not nombre.lower().endswith(".pdf"):
+                continue
+            firma = self._firma(nombre)
+            if firma is None or firma == self.conocidos.get(nombre):
+                continue
+            previo = self._pendientes.get(nombre)
+            if previo is None or previo[0] != firma:
+                self._pendientes[nombre] = (firma, ahora)
+
+    def esperar(self, timeout=None):
+        """Espera hasta `timeout` segundos (por defecto `intervalo`) y devuelve las rutas listas."""
+        timeout = self.intervalo if timeout is None else timeout
+        if self._pendientes:
+            # despertar en cuanto el primer archivo en espera pueda quedar estable
+            ahora = time.monotonic()
+            restante = min(desde + self.espera_estable - ahora for _, desde in self._pendientes.values())
+            timeout = max(0.0, min(timeout, restante))
+        self._observar(self._fuente.cambios(timeout))
+        ahora = time.monotonic()
+        listos = []
+        for nombre, (firma, desde) in list(self._pendientes.items()):
+            actual = self._firma(nombre)
+            if actual is None:
+                del self._pendientes[nombre]
+            elif actual != firma:
+                self._pendientes[nombre] = (actual, ahora)
+            elif ahora - desde >= self.espera_estable:
+                del self._pendientes[nombre]
+                self.conocidos[nombre] = firma
+                listos.append(os.path.join(self.carpeta, nombre))
+        return sorted(listos)
+
+    def close(self):
+        self._fuente.close()
+
+
+def _calentar():
+    # no hace nada: solo obliga al pool a arrancar sus procesos (que importan este módulo)
+    return os.getpid()
+
+
+class ServicioExtraccion:
+    """Vigila `carpeta` y guarda en `archivo_sqlite` las filas de cada PDF que llega.
+
+    Con workers > 1 los PDFs se procesan en un ProcessPoolExecutor que vive lo mismo
+    que el servicio; con workers <= 1, en el propio proceso.
+    """
+
+    def __init__(self, carpeta, archivo_sqlite, workers=2, cache_dir=None, carpeta_xml=None,
+                 espera_estable=2.0, intervalo=1.0, sondeo=False):
+        self.carpeta = carpeta
+        self.archivo_sqlite = archivo_sqlite
+        self.workers = workers
+        self.cache_dir = cache_dir
+        self.procesados = 0
+        self.errores = []
+        ruta_manifiesto = os.path.splitext(archivo_sqlite)[0] + ".manifest.json"
+        self.manifiesto = manifiesto.Manifiesto.cargar(ruta_manifiesto, mapear_campos.EXTRACTOR_VERSION)
+        self.indice_xml = pedimentos_xml.cargar_indice(carpeta_xml)
+        conocidos = {}
+        for nombre in os.listdir(carpeta):
+            ruta = os.path.join(carpeta, nombre)
+            if nombre.lower().endswith(".pdf") and self.manifiesto.sin_cambios(nombre, ruta):
+                st = os.stat(ruta)
+                conocidos[nombre] = (st.st_mtime_ns, st.st_size)
+        self.vigilante = VigilanteCarpeta(carpeta, espera_estable, intervalo, sondeo, conocidos)
+        self._almacen = None
+        self._pool = None
+        self._en_vuelo = {}
+
+    def ejecutar(self, detener=None):
+        """Vigila, encola y guarda hasta que `detener()` devuelva True o se pulse Ctrl+C."""
+        # la conexión SQLite se abre en el hilo que ejecuta el servicio
+        self._almacen = almacen_sqlite.AlmacenSQLite(self.archivo_sqlite)
+        if self.workers > 1:
+            self._pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+            for _ in range(self.workers):
+                self._pool.submit(_calentar)
+        try:
+            while not (detener and detener()):
+                # con archivos en proceso se despierta a menudo para guardar sus filas
+                for ruta in self.vigilante.esperar(0.2 if self._en_vuelo else None):
+                    self._encolar(ruta)
+                self._recoger()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._recoger(esperar=True)
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+            self._almacen.close()
+            self.vigilante.close()
+
+    def _encolar(self, ruta):
+        if self._pool is None:
+            self._guardar(ruta, mapear_campos._procesar_archivo(ruta, self.cache_dir))
+        else:
+            self._en_vuelo[self._pool.submit(mapear_campos._procesar_archivo, ruta, self.cache_dir)] = ruta
+
+    def _recoger(self, esperar=False):
+        if not self._en_vuelo:
+            return
+        hechos, _ = concurrent.futures.wait(list(self._en_vuelo), timeout=None if esperar else 0)
+        for futuro in hechos:
+            ruta = self._en_vuelo.pop(futuro)
+            try:
+                resultado = futuro.result()
+            except Exception as e:
+                # p. ej. el proceso trabajador murió; registrar el error y seguir vigilando
+                resultado = [], f"{type(e).__name__}: {e}", None, None
+            self._guardar(ruta, resultado)
+
+    def _guardar(self, ruta, resultado):
+        filas, error, clasificacion, sha256 = resultado
+        nombre = os.path.basename(ruta)
+        if error:
+            print(f"  Error en {nombre}: {error}")
+            self.errores.append((nombre, error))
+            self.manifiesto.olvidar(nombre)
+            self.manifiesto.guardar()
+            return
+        if not os.path.exists(ruta):
+            # eliminado mientras se procesaba
+            return
+        filas, _ = pedimentos_xml.resolver_filas(filas, self.indice_xml)
+        clave = self._almacen.guardar_documento(sha256, filas)
+        # una versión anterior del mismo archivo deja de valer
+        self._almacen.eliminar_archivo(nombre, conservar=clave)
+        self._almacen.confirmar()
+        self.manifiesto.registrar(nombre, ruta, sha256)
+        self.manifiesto.guardar()
+        self.procesados += 1
+        if clasificacion is not None and clasificacion.tipo != clasificador.PEDIMENTO:
+            print(f"Omitido: {nombre} ({clasificacion.tipo}, confianza {clasificacion.confianza:.2f})")
+        else:
+            print(f"Procesado: {nombre} ({len(filas)} filas)")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Vigila la carpeta de pedimentos y extrae cada PDF al llegar.")
+    parser.add_argument("--carpeta", default="PEDIMENTOS 2025/PEDIMENTOS_VALIDOS", help="carpeta de entrada a vigilar")
+    parser.add_argument("--sqlite", default="salida/pedimentos.sqlite", help="base SQLite donde se guardan las filas")
+    parser.add_argument("--workers", type=int, default=2, help="procesos del pool (1 = en el propio proceso)")
+    parser.add_argument("--espera", type=float, default=2.0, help="segundos sin cambios antes de procesar un archivo")
+    parser.add_argument("--intervalo", type=float, default=1.0, help="segundos entre revisiones de la carpeta")
+    parser.add_argument("--sondeo", action="store_true", help="revisar la carpeta periódicamente en vez de usar inotify")
+    parser.add_argument("--cache-dir", default="salida/.cache", help="caché de páginas en disco (texto y palabras por PDF)")
+    parser.add_argument("--sin-cache", action="store_true", help="no leer ni escribir la caché de páginas")
+    parser.add_argument("--xml", default="PEDIMENTOS 2025/pedimentos_xml", help="carpeta con XML de COVE ('' para omitirla)")
+    args = parser.parse_args()
+    servicio = ServicioExtraccion(
+        args.carpeta, args.sqlite, workers=args.workers, cache_dir=None if args.sin_cache else args.cache_dir,
+        carpeta_xml=args.xml or None, espera_estable=args.espera, intervalo=args.intervalo, sondeo=args.sondeo,
+    )
+    modo = "inotify" if servicio.vigilante.usa_inotify else f"sondeo cada {args.intervalo:g} s"
+    print(f"Vigilando {args.carpeta} ({modo}); Ctrl+C para terminar")
+    servicio.ejecutar()
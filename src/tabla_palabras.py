@@ -0,0 +1,39 @@
+"""Tabla compacta de las palabras de una página.
+
+pdfplumber devuelve cada palabra como un dict con una docena de claves (text, x0,
+x1, top, bottom, doctop, upright, direction...), pero los extractores por posición
+solo leen el texto, `x0` y `top`. La tabla guarda esos tres campos en columnas: una
+lista de textos internados (los tokens repetidos, como "IVA" o "0.00000", son un
+único objeto) y dos arrays de NumPy paralelos, sobre los que se agrupan las líneas
+y se asignan columnas de forma vectorizada (ver mapear_campos._IndicePalabras).
+Sus columnas son también lo que se guarda en la caché de páginas.
+"""
+import sys
+
+import numpy as np
+
+
+class TablaPalabras:
+    __slots__ = ("texto", "x0", "top")
+
+    def __init__(self, texto, x0, top):
+        self.texto = texto
+        self.x0 = np.asarray(x0, dtype=float)
+        self.top = np.asarray(top, dtype=float)
+
+    @classmethod
+    def desde_pdfplumber(cls, palabras):
+        """Tabla a partir de la salida de `page.extract_words()` (lista de dicts)."""
+        return cls(
+            [sys.intern(w.get("text", "")) for w in palabras],
+            [w.get("x0", 0) for w in palabras],
+            [w.get("top", 0) for w in palabras],
+        )
+
+    def __len__(self):
+        return len(self.texto)
+
+    def __eq__(self, otra):
+        if not isinstance(otra, TablaPalabras):
+            return NotImplemented
+        return self.texto == otra.texto and np.array_equal(self.x0, otra.x0) and np.array_equal(self.top, otra.top)
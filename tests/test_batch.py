@@ -0,0 +1,277 @@
+import os
+import shutil
+import zipfile
+import pandas as pd
+import pytest
+from src import almacen_sqlite
+from src import mapear_campos as mc
+
+BASE = os.path.join(os.path.dirname(__file__), '..')
+PDF_DIR = os.path.join(BASE, 'PEDIMENTOS 2025', 'PEDIMENTOS_VALIDOS')
+SAMPLE = ['3264_470_5000033_Pedimento.pdf', '2. PEDIMENTO CA5000810.pdf']
+
+
+@pytest.fixture
+def batch_dir(tmp_path):
+    carpeta = tmp_path / 'entrada'
+    carpeta.mkdir()
+    for name in SAMPLE:
+        shutil.copy(os.path.join(PDF_DIR, name), carpeta / name)
+    # un PDF corrupto no debe detener el lote
+    (carpeta / 'PEDIMENTO roto.pdf').write_bytes(b'%PDF-1.4 esto no es un pdf valido')
+    return carpeta
+
+
+def test_parallel_batch_matches_serial(batch_dir, tmp_path):
+    serial_csv = tmp_path / 'serial.csv'
+    parallel_csv = tmp_path / 'parallel.csv'
+    errores_serial = mc.procesar_pedimentos_y_generar_csv(str(batch_dir), str(serial_csv))
+    errores_par = mc.procesar_pedimentos_y_generar_csv(str(batch_dir), str(parallel_csv), workers=2)
+    assert [a for a, _ in errores_serial] == ['PEDIMENTO roto.pdf']
+    assert [a for a, _ in errores_par] == ['PEDIMENTO roto.pdf']
+    assert serial_csv.read_text(encoding='utf-8') == parallel_csv.read_text(encoding='utf-8')
+
+
+def test_incremental_rerun_only_processes_changed_files(batch_dir, tmp_path, monkeypatch):
+    salida = tmp_path / 'inc.csv'
+    mc.procesar_pedimentos_y_generar_csv(str(batch_dir), str(salida), incremental=True)
+    primera = salida.read_text(encoding='utf-8')
+
+    procesados = []
+    original = mc._procesar_archivo
+
+    def contar(pdf_path, cache_dir=None):
+        procesados.append(os.path.basename(pdf_path))
+        return original(pdf_path, cache_dir)
+
+    monkeypatch.setattr(mc, '_procesar_archivo', contar)
+    mc.procesar_pedimentos_y_generar_csv(str(batch_dir), str(salida), incremental=True)
+    # solo se reintenta el PDF corrupto (no queda registrado en el manifiesto)
+    assert procesados == ['PEDIMENTO roto.pdf']
+    assert salida.read_text(encoding='utf-8') == primera
+
+    # eliminar un PDF descarta sus filas sin reprocesar los demás
+    procesados.clear()
+    os.remove(batch_dir / SAMPLE[1])
+    mc.procesar_pedimentos_y_generar_csv(str(batch_dir), str(salida), incremental=True)
+    assert procesados == ['PEDIMENTO roto.pdf']
+    completo = tmp_path / 'completo.csv'
+    mc.procesar_pedimentos_y_generar_csv(str(batch_dir), str(completo))
+    assert salida.read_text(encoding='utf-8') == completo.read_text(encoding='utf-8')
+
+
+def test_crash_keeps_previous_output_and_partial_rows(batch_dir, tmp_path, monkeypatch):
+    salida = tmp_path / 'stream.csv'
+    mc.procesar_pedimentos_y_generar_csv(str(batch_dir), str(salida), archivo_salida_jsonl=str(tmp_path / 'stream.jsonl'))
+    previo = salida.read_text(encoding='utf-8')
+
+    con_filas = []
+    original = mc._procesar_archivo
+
+    def fallar_tras_el_primero(pdf_path, cache_dir=None):
+        # el proceso "muere" en el archivo siguiente al primero que produjo filas
+        if con_filas:
+            raise RuntimeError('interrumpido')
+        resultado = original(pdf_path, cache_dir)
+        if resultado[0]:
+            con_filas.append(os.path.basename(pdf_path))
+        return resultado
+
+    monkeypatch.setattr(mc, '_procesar_archivo', fallar_tras_el_primero)
+    with pytest.raises(RuntimeError):
+        mc.procesar_pedimentos_y_generar_csv(str(batch_dir), str(salida), archivo_salida_jsonl=str(tmp_path / 'stream.jsonl'))
+    # la salida anterior queda intacta y las filas ya escritas sobreviven en el .parcial
+    assert salida.read_text(encoding='utf-8') == previo
+    parcial = (tmp_path / 'stream.csv.parcial').read_text(encoding='utf-8')
+    assert con_filas[0] in parcial
+    assert parcial.splitlines()[0] == ','.join(mc.COLUMNAS_SALIDA)
+    assert (tmp_path / 'stream.jsonl.parcial').read_text(encoding='utf-8').count('\n') == len(parcial.splitlines()) - 1
+
+
+def test_instrumentation_trace_and_slowest_summary(batch_dir, tmp_path):
+    from src import instrumentacion
+    traza = tmp_path / 'traza.jsonl'
+    instrumentacion.activar(str(traza))
+    try:
+        mc.procesar_pedimentos_y_generar_csv(str(batch_dir), str(tmp_path / 'out.csv'))
+    finally:
+        instrumentacion.desactivar()
+    lentos = instrumentacion.resumen(str(traza), n=2)
+    # una línea por archivo (incluido el corrupto), ordenadas de mayor a menor tiempo
+    assert len(traza.read_text(encoding='utf-8').splitlines()) == 3
+    assert len(lentos) == 2 and lentos[0]['total_s'] >= lentos[1]['total_s']
+    funciones = {}
+    for registro in instrumentacion.resumen(str(traza), n=3):
+        funciones.update(registro['funciones'])
+    assert funciones['extraer_partidas_por_posicion']['llamadas'] >= 1
+    assert 'pdfplumber.extract_words' in funciones
+    # desactivada no se escribe nada
+    traza.write_text('', encoding='utf-8')
+    mc.procesar_pedimentos_y_generar_csv(str(batch_dir), str(tmp_path / 'out.csv'))
+    assert traza.read_text(encoding='utf-8') == ''
+
+
+def test_sqlite_store_mirrors_csv_across_incremental_runs(batch_dir, tmp_path):
+    salida = tmp_path / 'inc.csv'
+    base = tmp_path / 'pedimentos.sqlite'
+
+    def filas_csv():
+        return pd.read_csv(salida, dtype=str, keep_default_na=False).to_dict('records')
+
+    mc.procesar_pedimentos_y_generar_csv(str(batch_dir), str(salida), incremental=True, archivo_sqlite=str(base))
+    with almacen_sqlite.AlmacenSQLite(str(base)) as almacen:
+        assert almacen.filas() == filas_csv()
+        assert almacen.contar(archivo=SAMPLE[1])
+        fraccion = filas_csv()[0]['FRACCION']
+        assert almacen.filas(fraccion=fraccion) == [f for f in filas_csv() if f['FRACCION'] == fraccion]
+
+    # re-ejecutar no duplica filas y eliminar un PDF elimina las suyas
+    mc.procesar_pedimentos_y_generar_csv(str(batch_dir), str(salida), incremental=True, archivo_sqlite=str(base))
+    os.remove(batch_dir / SAMPLE[1])
+    mc.procesar_pedimentos_y_generar_csv(str(batch_dir), str(salida), incremental=True, archivo_sqlite=str(base))
+    with almacen_sqlite.AlmacenSQLite(str(base)) as almacen:
+        assert almacen.filas() == filas_csv()
+        assert almacen.contar(archivo=SAMPLE[1]) == 0
+
+
+def test_incremental_sqlite_run_reuses_worker_hash_and_skips_unchanged_documents(batch_dir, tmp_path, monkeypatch):
+    from src import entrada_zip, manifiesto
+    salida = tmp_path / 'inc.csv'
+    base = tmp_path / 'pedimentos.sqlite'
+
+    def sin_rehash(path):
+        raise AssertionError(f'hash recalculado en el lote: {path}')
+
+    # el hash llega con el resultado del trabajador; el lote no vuelve a leer los archivos
+    monkeypatch.setattr(entrada_zip, 'hash_entrada', sin_rehash)
+    monkeypatch.setattr(manifiesto, 'hash_entrada', sin_rehash)
+    mc.procesar_pedimentos_y_generar_csv(str(batch_dir), str(salida), incremental=True, archivo_sqlite=str(base))
+
+    guardados = []
+    original = almacen_sqlite.AlmacenSQLite.guardar_documento
+
+    def contar(self, sha256, filas):
+        guardados.append(filas[0]['Archivo'] if filas else None)
+        return original(self, sha256, filas)
+
+    monkeypatch.setattr(almacen_sqlite.AlmacenSQLite, 'guardar_documento', contar)
+    with almacen_sqlite.AlmacenSQLite(str(base)) as almacen:
+        antes = almacen.filas()
+    mc.procesar_pedimentos_y_generar_csv(str(batch_dir), str(salida), incremental=True, archivo_sqlite=str(base))
+    assert guardados == []
+    with almacen_sqlite.AlmacenSQLite(str(base)) as almacen:
+        assert almacen.filas() == antes
+
+    # una base nueva sí recibe los documentos que el manifiesto da por procesados
+    otra = tmp_path / 'otra.sqlite'
+    mc.procesar_pedimentos_y_generar_csv(str(batch_dir), str(salida), incremental=True, archivo_sqlite=str(otra))
+    assert guardados
+    with almacen_sqlite.AlmacenSQLite(str(otra)) as almacen:
+        assert almacen.filas() == antes
+
+
+def test_zip_members_are_processed_from_memory(batch_dir, tmp_path, monkeypatch):
+    from src import cache_paginas, entrada_zip
+    carpeta = tmp_path / 'lotes'
+    carpeta.mkdir()
+    with zipfile.ZipFile(carpeta / 'enero.zip', 'w') as zf:
+        zf.write(batch_dir / SAMPLE[0], SAMPLE[0])
+        zf.write(batch_dir / SAMPLE[1], 'agente/' + SAMPLE[1])
+        # restos de macOS y miembros que no son PDF se ignoran
+        zf.writestr('__MACOSX/agente/._' + SAMPLE[1], b'\x00\x05\x16\x07')
+        zf.writestr('notas.txt', 'no es un pedimento')
+    salida = tmp_path / 'zip.csv'
+    cache_dir = tmp_path / 'cache'
+    errores = mc.procesar_pedimentos_y_generar_csv(str(carpeta), str(salida), cache_dir=str(cache_dir),
+                                                   incremental=True)
+    assert errores == []
+
+    filas = pd.read_csv(salida, dtype=str, keep_default_na=False).to_dict('records')
+    esperadas = []
+    for miembro, nombre in [(SAMPLE[0], SAMPLE[0]), ('agente/' + SAMPLE[1], SAMPLE[1])]:
+        filas_pdf, error, _, _ = mc._procesar_archivo(str(batch_dir / nombre))
+        assert error is None and filas_pdf
+        esperadas += [{**{k: str(v) for k, v in f.items()}, 'Archivo': f'enero.zip/{miembro}'} for f in filas_pdf]
+    assert filas == esperadas
+    # la caché se indexa por el hash del contenido del miembro, igual que el PDF suelto
+    sha = cache_paginas.hash_archivo(str(batch_dir / SAMPLE[0]))
+    assert any(n.startswith(sha) for n in os.listdir(cache_dir))
+
+    procesados = []
+    original = mc._procesar_archivo
+
+    def contar(pdf_path, cache_dir=None):
+        procesados.append(entrada_zip.nombre_entrada(pdf_path))
+        return original(pdf_path, cache_dir)
+
+    monkeypatch.setattr(mc, '_procesar_archivo', contar)
+    primera = salida.read_text(encoding='utf-8')
+    mc.procesar_pedimentos_y_generar_csv(str(carpeta), str(salida), cache_dir=str(cache_dir), incremental=True)
+    assert procesados == []
+    assert salida.read_text(encoding='utf-8') == primera
+
+
+def test_zip_members_are_decompressed_once_per_batch(batch_dir, tmp_path, monkeypatch):
+    from src import entrada_zip, manifiesto
+    carpeta = tmp_path / 'lotes'
+    carpeta.mkdir()
+    with zipfile.ZipFile(carpeta / 'enero.zip', 'w', zipfile.ZIP_DEFLATED) as zf:
+        for nombre in SAMPLE[:2]:
+            zf.write(batch_dir / nombre, nombre)
+    leidos = []
+    original = entrada_zip.MiembroZip.leer
+
+    def contar(miembro):
+        leidos.append(miembro.miembro)
+        return original(miembro)
+
+    def sin_rehash(path):
+        raise AssertionError(f'miembro descomprimido de nuevo para el hash: {path}')
+
+    monkeypatch.setattr(entrada_zip.MiembroZip, 'leer', contar)
+    monkeypatch.setattr(entrada_zip, 'hash_entrada', sin_rehash)
+    monkeypatch.setattr(manifiesto, 'hash_entrada', sin_rehash)
+    salida = tmp_path / 'zip.csv'
+    assert mc.procesar_pedimentos_y_generar_csv(str(carpeta), str(salida), incremental=True,
+                                                archivo_sqlite=str(tmp_path / 'zip.sqlite')) == []
+    assert sorted(leidos) == sorted(SAMPLE[:2])
+
+    # el ZIP se copió o se tocó: solo cambia su mtime y el CRC-32 basta para saber que nada cambió
+    leidos.clear()
+    os.utime(carpeta / 'enero.zip', (1, 1))
+    mc.procesar_pedimentos_y_generar_csv(str(carpeta), str(salida), incremental=True)
+    assert leidos == []
+
+    # mismo tamaño y otro CRC-32: el miembro cambió
+    estado = manifiesto.Manifiesto.cargar(str(tmp_path / 'zip.manifest.json'), mc.EXTRACTOR_VERSION)
+    miembro = entrada_zip.miembros_pdf(str(carpeta / 'enero.zip'))[0]
+    assert estado.sin_cambios(miembro.nombre, miembro)
+    estado.archivos[miembro.nombre]['mtime'] -= 1
+    assert not estado.sin_cambios(miembro.nombre, miembro._replace(crc=miembro.crc ^ 1))
+
+
+def test_sqlite_store_commits_each_batch_and_appends_after_existing_documents(tmp_path, monkeypatch):
+    import sqlite3
+    monkeypatch.setattr(almacen_sqlite, 'FILAS_POR_TRANSACCION', 3)
+    base = str(tmp_path / 'pedimentos.sqlite')
+
+    def filas(archivo, n):
+        return [{c: '' for c in mc.COLUMNAS_SALIDA} | {'SEC': str(i + 1), 'Archivo': archivo} for i in range(n)]
+
+    def confirmadas():
+        # otra conexión solo ve lo ya confirmado
+        con = sqlite3.connect(base)
+        try:
+            return con.execute('SELECT COUNT(*) FROM partidas').fetchone()[0]
+        finally:
+            con.close()
+
+    with almacen_sqlite.AlmacenSQLite(base) as almacen:
+        almacen.guardar_documento('a' * 64, filas('a.pdf', 2))
+        assert confirmadas() == 0
+        almacen.guardar_documento('b' * 64, filas('b.pdf', 2))
+        assert confirmadas() == 4
+    # una nueva instancia añade sus documentos detrás de los existentes
+    with almacen_sqlite.AlmacenSQLite(base) as almacen:
+        almacen.guardar_documento('c' * 64, filas('c.pdf', 1))
+        assert [f['Archivo'] for f in almacen.filas()] == ['a.pdf', 'a.pdf', 'b.pdf', 'b.pdf', 'c.pdf']
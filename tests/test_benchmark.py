@@ -0,0 +1,57 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+BASE = os.path.join(os.path.dirname(__file__), '..')
+PDF_DIR = os.path.join(BASE, 'PEDIMENTOS 2025', 'PEDIMENTOS_VALIDOS')
+SCRIPT = os.path.join(BASE, 'scripts', 'benchmark_pipeline.py')
+
+
+def run_bench(*args):
+    return subprocess.run([sys.executable, SCRIPT, *args], capture_output=True, text=True)
+
+
+def test_benchmark_reports_stages_and_fails_on_regression(tmp_path):
+    carpeta = tmp_path / 'corpus'
+    carpeta.mkdir()
+    shutil.copy(os.path.join(PDF_DIR, '2. PEDIMENTO CA5000810.pdf'), carpeta)
+    salida = tmp_path / 'bench.json'
+    r = run_bench('--carpeta', str(carpeta), '--salida', str(salida))
+    assert r.returncode == 0, r.stderr
+    datos = json.loads(salida.read_text(encoding='utf-8'))
+    assert datos['archivos'] == 1 and datos['paginas'] >= 1
+    for clave in ('archivos_por_s', 'paginas_por_s', 'p50_ms', 'p95_ms', 'pico_rss_mb'):
+        assert clave in datos
+    assert set(datos['etapas']) >= {'extraccion', 'cabecera', 'proveedor', 'partidas', 'postproceso'}
+
+    # una baseline imposible de cumplir debe hacer fallar la ejecución
+    for etapa in datos['etapas'].values():
+        etapa['total_s'] = 1e-9
+    baseline = tmp_path / 'baseline.json'
+    baseline.write_text(json.dumps(datos), encoding='utf-8')
+    r = run_bench('--carpeta', str(carpeta), '--salida', str(tmp_path / 'otra.json'), '--baseline', str(baseline))
+    assert r.returncode == 1
+    assert 'REGRESIÓN' in r.stdout
+
+
+def test_lazy_page_extraction_is_charged_to_the_extraction_stage(monkeypatch):
+    import importlib.util
+    import time
+
+    spec = importlib.util.spec_from_file_location('benchmark_pipeline', SCRIPT)
+    bench = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(bench)
+    # extraer palabras es lento; ese coste aparece dentro de proveedor/partidas, que las piden
+    original = bench.mc.PedimentoDocument._extraer_palabras
+
+    def lenta(self, i):
+        time.sleep(0.1)
+        return original(self, i)
+
+    monkeypatch.setattr(bench.mc.PedimentoDocument, '_extraer_palabras', lenta)
+    tiempos, _ = bench.medir_archivo(os.path.join(PDF_DIR, '2. PEDIMENTO CA5000810.pdf'))
+    assert tiempos['extraccion'] >= 0.1
+    for etapa in ('clasificacion', 'cabecera', 'proveedor', 'partidas', 'filas', 'postproceso'):
+        assert tiempos[etapa] < 0.1, etapa
@@ -0,0 +1,83 @@
+import os
+from src import cache_paginas
+from src.tabla_palabras import TablaPalabras
+from src import mapear_campos as mc
+
+BASE = os.path.join(os.path.dirname(__file__), '..')
+PDF = os.path.join(BASE, 'PEDIMENTOS 2025', 'PEDIMENTOS_VALIDOS', '2. PEDIMENTO CA5000810.pdf')
+
+
+def test_cached_document_skips_pdf_parsing(tmp_path):
+    cache = cache_paginas.CachePaginas(str(tmp_path))
+    with mc.PedimentoDocument(PDF, cache=cache) as doc:
+        assert not doc.desde_cache
+        partidas = mc.extraer_partidas_por_posicion(doc)
+        texto = doc.texto
+    with mc.PedimentoDocument(PDF, cache=cache) as doc:
+        assert doc.desde_cache
+        assert doc._pdf is None
+        assert doc.texto == texto
+        assert mc.extraer_partidas_por_posicion(doc) == partidas
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = cache_paginas.CachePaginas(str(tmp_path), max_bytes=10 ** 9)
+    palabras = [TablaPalabras.desde_pdfplumber([{'text': 'X' * 200, 'x0': 1.0, 'top': 2.0}] * 50)]
+    for sha in ('a', 'b', 'c'):
+        cache.guardar(sha, ['texto ' * 100], palabras)
+    viejo = os.path.join(str(tmp_path), f"a-{cache.version}.pag")
+    os.utime(viejo, (1, 1))
+    cache.obtener('a')  # la lectura la vuelve la más reciente
+    os.utime(os.path.join(str(tmp_path), f"b-{cache.version}.pag"), (2, 2))
+    tam = os.path.getsize(viejo)
+    cache.max_bytes = tam * 2
+    cache.expulsar()
+    assert cache.obtener('b') is None
+    assert cache.obtener('a') is not None
+    assert cache.obtener('c') is not None
+
+
+def test_cache_size_is_tracked_without_listing_on_every_write(tmp_path, monkeypatch):
+    listados = []
+    listdir = os.listdir
+
+    def contar(ruta):
+        if os.path.abspath(ruta) == str(tmp_path):
+            listados.append(ruta)
+        return listdir(ruta)
+
+    monkeypatch.setattr(cache_paginas.os, 'listdir', contar)
+    palabras = [TablaPalabras.desde_pdfplumber([{'text': 'X' * 200, 'x0': 1.0, 'top': 2.0}] * 50)]
+    # una instancia por archivo, como en _procesar_archivo: el total se comparte
+    for i in range(20):
+        cache_paginas.CachePaginas(str(tmp_path), max_bytes=10 ** 9).guardar(f'{i:02d}', ['texto'], palabras)
+    assert len(listados) == 1
+    cache = cache_paginas.CachePaginas(str(tmp_path), max_bytes=10 ** 9)
+    assert cache.total_bytes == sum(os.path.getsize(tmp_path / n) for n in listdir(tmp_path))
+    # al pasar de max_bytes se expulsa y el total vuelve a cuadrar con el directorio
+    cache.max_bytes = cache.total_bytes // 2
+    cache.guardar('nuevo', ['texto'], palabras)
+    assert len(listados) == 2
+    assert cache.total_bytes == sum(os.path.getsize(tmp_path / n) for n in listdir(tmp_path)) <= cache.max_bytes
+
+
+def test_pages_without_anchors_skip_word_extraction(tmp_path):
+    # la primera página de este PDF no tiene cabecera de proveedor ni de partidas
+    pdf = os.path.join(os.path.dirname(PDF), '2. PEDIMENTO 3542-5002734.pdf')
+    cache = cache_paginas.CachePaginas(str(tmp_path))
+    with mc.PedimentoDocument(pdf, cache=cache) as doc:
+        assert not doc.tiene_anclas(0, mc.ANCLAS_PARTIDAS)
+        proveedor = mc.extraer_datos_proveedor_por_posicion(doc)
+        partidas = mc.extraer_partidas_por_posicion(doc)
+        assert proveedor[0]
+        assert 0 not in doc._palabras
+    with mc.PedimentoDocument(pdf, cache=cache) as doc:
+        assert doc._pdf is None and 0 not in doc._palabras
+        # pedir esas palabras abre el PDF y completa la entrada al cerrar
+        palabras = doc.palabras_pagina(0)
+        assert doc._pdf is not None
+    with mc.PedimentoDocument(pdf, cache=cache) as doc:
+        assert doc.palabras_pagina(0) == palabras
+        assert doc._pdf is None
+        assert mc.extraer_datos_proveedor_por_posicion(doc) == proveedor
+        assert mc.extraer_partidas_por_posicion(doc) == partidas
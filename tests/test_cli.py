@@ -0,0 +1,62 @@
+import json
+import os
+import subprocess
+import sys
+
+from src import mapear_campos as mc
+
+BASE = os.path.join(os.path.dirname(__file__), '..')
+CLI = os.path.join(BASE, 'src', 'cli.py')
+PDF = os.path.join(BASE, 'PEDIMENTOS 2025', 'PEDIMENTOS_VALIDOS', '2. PEDIMENTO CA5000810.pdf')
+
+
+def _importados(stderr):
+    # líneas de -X importtime: "import time: self [us] | cumulative | módulo"
+    modulos = {}
+    for linea in stderr.splitlines():
+        if linea.startswith('import time:') and '|' in linea:
+            _, acumulado, nombre = linea[len('import time:'):].split('|')
+            if acumulado.strip().isdigit():
+                modulos[nombre.strip()] = int(acumulado) / 1e6
+    return modulos
+
+
+def _ejecutar(*args):
+    r = subprocess.run([sys.executable, '-X', 'importtime', CLI, *args], capture_output=True, text=True,
+                       encoding='utf-8', timeout=120)
+    return r, _importados(r.stderr)
+
+
+def _modulos_tras(codigo):
+    # sys.modules de un intérprete limpio tras ejecutar `codigo` con src/ en la ruta
+    script = (f"import json, sys; sys.path.insert(0, {os.path.dirname(CLI)!r})\n{codigo}\n"
+              "sys.stdout = sys.__stdout__; print(json.dumps(sorted(sys.modules)))")
+    r = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, encoding='utf-8',
+                       timeout=120)
+    assert r.returncode == 0, r.stderr[-2000:]
+    # cli importa los módulos del pipeline como src.<módulo> o <módulo> según la ruta
+    return {m.removeprefix('src.') for m in json.loads(r.stdout.splitlines()[-1])}
+
+
+def test_extract_command_outputs_rows_without_pandas():
+    r, modulos = _ejecutar('extract', PDF, '--format', 'json')
+    assert r.returncode == 0, r.stderr[-2000:]
+    assert 'pandas' not in modulos
+    filas, error, _, _ = mc._procesar_archivo(PDF)
+    assert error is None and filas
+    assert json.loads(r.stdout) == filas
+
+
+def test_cli_startup_defers_heavy_imports():
+    # importar cli o pedir --help no carga nada del pipeline; extraer importa mapear_campos
+    # (con NumPy y pdfplumber) pero no pandas
+    pesados = {'numpy', 'pandas', 'pdfplumber', 'mapear_campos'}
+    assert not pesados & _modulos_tras("import cli")
+    ayuda = ("import cli\ntry:\n    cli.main(['--help'])\nexcept SystemExit as e:\n"
+             "    assert e.code == 0, e.code")
+    assert not pesados & _modulos_tras(ayuda)
+
+    r, modulos = _ejecutar('extraer', PDF, '--formato', 'csv')
+    assert r.returncode == 0, r.stderr[-2000:]
+    assert r.stdout.splitlines()[0].split(',') == mc.COLUMNAS_SALIDA
+    assert 'mapear_campos' in modulos and 'pandas' not in modulos
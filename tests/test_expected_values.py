@@ -1,14 +1,20 @@
 import pandas as pd
 import os
+from src import almacen_sqlite
 
 CSV = os.path.join(os.path.dirname(__file__), '..', 'salida', 'pedimentos_completo.csv')
+SQLITE = os.path.join(os.path.dirname(__file__), '..', 'salida', 'pedimentos.sqlite')
 
 EXPECTED_KEYWORDS = [
     'PARTES', 'ACCESORIOS', 'OXIGENOTERAPIA', 'MEZCLADOR', 'OXIGENO', 'HUMIDIFICADOR', 'NEBULIZADOR', 'MASCARILLA'
 ]
 
 
-def test_fraccion_90192001_descriptions():
+def _filas_fraccion(fraccion):
+    if os.path.exists(SQLITE):
+        # búsqueda por índice en vez de leer el CSV completo
+        with almacen_sqlite.AlmacenSQLite(SQLITE) as almacen:
+            return pd.DataFrame(almacen.filas(fraccion=fraccion), columns=almacen_sqlite.COLUMNAS)
     if not os.path.exists(CSV):
         import pytest
         pytest.skip('CSV de salida no encontrado: ejecutar extracción primero')
@@ -16,7 +22,11 @@ def test_fraccion_90192001_descriptions():
     if 'FRACCION' not in df.columns:
         import pytest
         pytest.skip('CSV no contiene columna FRACCION')
-    sel = df[df['FRACCION'].astype(str).str.contains('90192001', na=False)]
+    return df[df['FRACCION'].astype(str).str.contains(fraccion, na=False)]
+
+
+def test_fraccion_90192001_descriptions():
+    sel = _filas_fraccion('90192001')
     if sel.empty:
         import pytest
         pytest.skip('No hay filas con FRACCION=90192001 en el CSV')
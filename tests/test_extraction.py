@@ -1,5 +1,6 @@
 import os
 import glob
+import pdfplumber
 import pytest
 from src import mapear_campos as mc
 
@@ -52,3 +53,204 @@ def test_is_pedimento_and_has_required_fields(pdf_path):
                 pytest.fail(f"TASA_IGI malformada en {os.path.basename(pdf_path)}: {tasa}")
     else:
         pytest.skip(f"No se obtuvieron partidas por posicion para {os.path.basename(pdf_path)}; revisar extracción")
+
+
+def test_shared_document_matches_path_calls():
+    # un PedimentoDocument abierto una vez debe dar los mismos resultados que pasar la ruta
+    pdf_path = sample_pdfs(1)[0]
+    with mc.PedimentoDocument(pdf_path) as doc:
+        assert mc.extraer_texto_pdf(doc) == mc.extraer_texto_pdf(pdf_path)
+        assert mc.extraer_datos_proveedor_por_posicion(doc) == mc.extraer_datos_proveedor_por_posicion(pdf_path)
+        assert mc.extraer_partidas_por_posicion(doc) == mc.extraer_partidas_por_posicion(pdf_path)
+
+
+def test_batched_recovery_matches_single_calls():
+    # la recuperación por lotes debe coincidir con una llamada por fracción
+    pdf_path = sample_pdfs(1)[0]
+    with mc.PedimentoDocument(pdf_path) as doc:
+        fracciones = sorted({p['FRACCION'] for p in mc.extraer_partidas_por_posicion(doc) if p.get('FRACCION')})
+        pares = [('1', fr) for fr in fracciones] + [('1', '00000000')]
+        lote = mc.recover_descriptions_from_pdf(doc, pares)
+        for par in pares:
+            assert lote.get(par) == mc.recover_description_from_pdf(pdf_path, *par)
+
+
+def test_classifier_routes_by_first_page():
+    from src import clasificador
+    otros = os.path.join(BASE, 'PEDIMENTOS 2025', 'ARCHIVOS_NO_PEDIMENTOS')
+    esperados = {
+        os.path.join(PDF_DIR, '2. PEDIMENTO CA5000810.pdf'): clasificador.PEDIMENTO,
+        # pedimento con un nombre de archivo que no lo dice
+        os.path.join(PDF_DIR, 'P 1526132576.pdf'): clasificador.PEDIMENTO,
+        os.path.join(otros, 'COVE257N2VZ95 para pedimento 3542-5002734.pdf'): clasificador.COVE,
+        os.path.join(otros, 'AICM3.PDF'): clasificador.OTRO,
+    }
+    for path, tipo in esperados.items():
+        with mc.PedimentoDocument(path) as doc:
+            resultado = clasificador.clasificar(doc)
+        assert resultado.tipo == tipo, os.path.basename(path)
+        assert 0 < resultado.confianza <= 1
+
+
+def test_proformas_are_filtered_before_the_pedimento_markers():
+    from src import clasificador
+    # mismo formato que un pedimento: se reconocen por el nombre o por el número "Pro forma"
+    for nombre in ['PROFORMA MEDUFW833562.pdf', '1781_240_5000039_proforma.pdf']:
+        path = os.path.join(PDF_DIR, nombre)
+        with mc.PedimentoDocument(path) as doc:
+            assert clasificador.clasificar(doc).tipo == clasificador.PROFORMA, nombre
+        filas, error, clasificacion, _ = mc._procesar_archivo(path)
+        assert (filas, error, clasificacion.tipo) == ([], None, clasificador.PROFORMA)
+    for nombre, tipo in [('9762518323_PR_3 (1).pdf', clasificador.PROFORMA),
+                         # "BORRADOR SIN VALIDEZ" es parte de la plantilla, no marca una proforma
+                         ('OLS25-01015 PEDIMENTO VALIDADO.pdf', clasificador.PEDIMENTO)]:
+        with mc.PedimentoDocument(os.path.join(PDF_DIR, nombre)) as doc:
+            assert clasificador.clasificar_texto(doc.texto_pagina(0)).tipo == tipo, nombre
+
+
+def test_known_supplier_layout_skips_header_detection(tmp_path, monkeypatch):
+    # el layout aprendido se guarda junto a la caché y otro proceso lo usa sin detectar la cabecera
+    from src import cache_paginas, registro_layouts
+    pdf_path = sample_pdfs(1)[0]
+    monkeypatch.setattr(registro_layouts, '_REGISTROS', {})
+    with mc.PedimentoDocument(pdf_path, cache=cache_paginas.CachePaginas(str(tmp_path))) as doc:
+        esperado = mc.extraer_datos_proveedor_por_posicion(doc)
+    assert esperado[0] and (tmp_path / registro_layouts.ARCHIVO).exists()
+
+    def detectar(indice):
+        raise AssertionError('cabecera de un layout conocido detectada de nuevo')
+
+    monkeypatch.setattr(registro_layouts, '_REGISTROS', {})
+    monkeypatch.setattr(mc, '_detectar_cabecera_proveedor', detectar)
+    with mc.PedimentoDocument(pdf_path, cache=cache_paginas.CachePaginas(str(tmp_path))) as doc:
+        assert doc.layouts.conocidos('proveedor')
+        assert mc.extraer_datos_proveedor_por_posicion(doc) == esperado
+
+
+def test_supplier_recovery_runs_once_per_document(monkeypatch):
+    # el proveedor truncado se resuelve una vez por documento y se copia a todas sus filas
+    llamadas = []
+    original = mc._resolver_proveedor_truncado
+
+    def contar(*args):
+        llamadas.append(args[:2])
+        return original(*args)
+
+    monkeypatch.setattr(mc, '_resolver_proveedor_truncado', contar)
+    pdf_path = sample_pdfs(1)[0]
+    filas = [{'ID_FISCAL': 'GB', 'NOMBRE_DENOMINACION_O_RAZON_SOCIAL': 'LIMITED', 'SEC': str(i)} for i in range(4)]
+    with mc.PedimentoDocument(pdf_path) as doc:
+        mc._recuperar_ids_truncados(filas, doc)
+        esperado = original('GB', 'LIMITED', doc.texto)
+    assert llamadas == [('GB', 'LIMITED')]
+    assert [f['ID_FISCAL'] for f in filas] == [esperado[0]] * 4
+    assert [f['NOMBRE_DENOMINACION_O_RAZON_SOCIAL'] for f in filas] == [esperado[1]] * 4
+
+
+def test_truncated_supplier_takes_the_id_under_the_supplier_header():
+    # el ID más cercano a la cabecera del proveedor gana al del importador, que aparece antes
+    texto = ("DATOS DEL IMPORTADOR\nMX 900 100 200 OTRA LIMITED, MONTERREY\n"
+             "DATOS DEL PROVEEDOR O COMPRADOR\nGB 310 726 243 PENLON LIMITED, ABINGDON SCIENCE PARK\n")
+    assert mc._resolver_proveedor_truncado('GB', 'LIMITED', texto) == ('GB310726243', 'PENLON LIMITED')
+
+
+def test_embedded_igi_and_iva_are_split_from_descriptions():
+    filas = [
+        {'SEC': '1', 'FRACCION': '84818099', 'DESCRIPCION': 'VALVULA IGI 5.00000  DE  BRONCE', 'TASA_IGI': ''},
+        {'SEC': '2', 'FRACCION': '84818099', 'DESCRIPCION': 'EMPAQUE, IVA 16.00000', 'TASA_IGI': '7.00000'},
+        {'SEC': '3', 'FRACCION': '84818099', 'DESCRIPCION': 'TORNILLO', 'TASA_IGI': 'EX.'},
+    ]
+    with mc.PedimentoDocument(sample_pdfs(1)[0]) as doc:
+        mc._normalizar_descripciones(filas, doc)
+    assert [f['DESCRIPCION'] for f in filas] == ['VALVULA DE BRONCE', 'EMPAQUE', 'TORNILLO']
+    assert [f['TASA_IGI'] for f in filas] == ['5.00000', '7.00000', 'EX.']
+
+
+def test_partida_tokenizer_matches_reference_regex():
+    # la máquina de estados debe dar las mismas tuplas que el patrón DOTALL, también página a página
+    for pdf_path in sample_pdfs():
+        with mc.PedimentoDocument(pdf_path) as doc:
+            texto = doc.texto
+            paginas = (doc.texto_pagina(i) + "\n" for i in range(doc.num_paginas))
+            esperado = [m.groups() for m in mc.PARTIDAS_TEXTO_RE.finditer(texto)]
+            assert list(mc.iterar_partidas_texto(texto)) == esperado
+            assert list(mc.iterar_partidas_texto(paginas)) == esperado
+    texto = "1 84818099 X\nVALVULA\n DE BRONCE 2 10 5.5\nIVA 16.00000\nIGI 7.00000 2\n  85371099\nCABLE 1 1 3\nIGI 0.1"
+    esperado = [m.groups() for m in mc.PARTIDAS_TEXTO_RE.finditer(texto)]
+    assert len(esperado) == 2
+    assert list(mc.iterar_partidas_texto(texto)) == esperado
+
+
+def test_word_index_matches_linear_scans():
+    # búsquedas del índice espacial frente al recorrido lineal de las palabras de pdfplumber
+    with pdfplumber.open(sample_pdfs(1)[0]) as pdf:
+        words = pdf.pages[0].extract_words()
+    with mc.PedimentoDocument(sample_pdfs(1)[0]) as doc:
+        tabla = doc.palabras_pagina(0)
+        assert tabla.texto == [w['text'] for w in words]
+        assert tabla.x0.tolist() == [w['x0'] for w in words] and tabla.top.tolist() == [w['top'] for w in words]
+        # líneas sueltas o las que siguen a una, agrupadas sin pasar por `filas`
+        parcial = mc._IndicePalabras(tabla)
+        y0 = round(words[len(words) // 2]['top'])
+        siguientes = [(f.top, f.textos, f.x0s) for f in parcial.filas_desde(y0)]
+        lineas = [(f.top, f.textos, f.x0s) for f in map(parcial.fila, parcial.lineas_con(str.isdigit))]
+        assert siguientes and lineas and parcial._filas is None
+        indice = doc.indice_pagina(0)
+        assert indice is doc.indice_pagina(0)
+        assert siguientes == [(f.top, f.textos, f.x0s) for f in indice.filas if f.top > y0]
+        assert lineas == [(f.top, f.textos, f.x0s) for f in indice.filas if any(map(str.isdigit, f.textos))]
+        assert [f.top for f in indice.filas] == sorted({round(w['top']) for w in words})
+        y = indice.filas[len(indice.filas) // 2].top
+        esperado = []
+        for i, w in enumerate(words):
+            if w['top'] <= y:
+                continue
+            if mc.FIN_PROVEEDOR_RE.search(w['text']):
+                break
+            esperado.append(i)
+        assert indice.debajo_de(y, hasta=mc.FIN_PROVEEDOR_RE).tolist() == esperado
+        limits = {'A': (50, 120), 'B': (120, 120), 'C': (120, 300), 'D': (300, float('inf'))}
+        columnas = indice.columnas(indice.x0, limits).tolist()
+        for w, c in zip(words, columnas):
+            dentro = [k for k, (s, e) in limits.items() if s - 1 <= w['x0'] < e - 1]
+            assert (list(limits)[c] if c >= 0 else None) == (dentro[0] if dentro else None)
+
+
+def test_header_reads_only_the_first_pages():
+    pdf_path = os.path.join(PDF_DIR, '2. PEDIMENTO CIE03667-25MZ.pdf')
+    with mc.PedimentoDocument(pdf_path) as doc:
+        cabecera = mc.extraer_cabecera_pedimento(doc.iterar_textos())
+        assert cabecera[0]
+        assert len(doc._textos) < doc.num_paginas
+        assert cabecera == mc.extraer_cabecera_pedimento(doc.texto)
+
+
+_PICO_RSS = r'''
+import resource, sys
+sys.path.insert(0, sys.argv[1])
+from src import mapear_campos as mc
+filas, error, _, _ = mc._procesar_archivo(sys.argv[2])
+assert error is None, error
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+'''
+
+
+def test_peak_memory_is_bounded_by_page_count(tmp_path):
+    pdfium = pytest.importorskip('pypdfium2')
+    resource = pytest.importorskip('resource')
+    import subprocess
+    import sys
+    origen = pdfium.PdfDocument(os.path.join(PDF_DIR, '2. PEDIMENTO CIE03667-25MZ.pdf'))
+    picos = {}
+    for paginas in (6, 24):
+        # pedimento "consolidado": el original repetido página a página
+        largo = pdfium.PdfDocument.new()
+        for i in range(paginas):
+            largo.import_pages(origen, [i % len(origen)])
+        ruta = tmp_path / f'largo{paginas}.pdf'
+        largo.save(str(ruta))
+        salida = subprocess.run([sys.executable, '-c', _PICO_RSS, BASE, str(ruta)],
+                                capture_output=True, text=True, check=True)
+        picos[paginas] = int(salida.stdout.split()[-1]) / 1024  # MiB en Linux
+    # sin liberar cada página el pico crece ~8 MiB por página; liberándolas, <1
+    assert picos[24] - picos[6] < 18, picos
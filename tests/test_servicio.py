@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+
+import pytest
+from src import almacen_sqlite
+from src import mapear_campos as mc
+from src import servicio
+
+BASE = os.path.join(os.path.dirname(__file__), '..')
+PDF = os.path.join(BASE, 'PEDIMENTOS 2025', 'PEDIMENTOS_VALIDOS', '2. PEDIMENTO CA5000810.pdf')
+
+
+def _esperar(condicion, limite=20.0):
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        if condicion():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def _en_hilo(carpeta, base, sondeo, detener):
+    resultado = {}
+
+    def correr():
+        srv = servicio.ServicioExtraccion(str(carpeta), str(base), workers=1, cache_dir=None,
+                                          espera_estable=0.5, intervalo=0.1, sondeo=sondeo)
+        resultado['servicio'] = srv
+        srv.ejecutar(detener.is_set)
+
+    hilo = threading.Thread(target=correr, daemon=True)
+    hilo.start()
+    return hilo, resultado
+
+
+@pytest.mark.parametrize('sondeo', [False, True], ids=['inotify', 'sondeo'])
+def test_service_waits_for_complete_file_and_stores_rows(tmp_path, monkeypatch, sondeo):
+    carpeta = tmp_path / 'entrada'
+    carpeta.mkdir()
+    base = tmp_path / 'pedimentos.sqlite'
+    llamadas = []
+    original = mc._procesar_archivo
+
+    def espia(path, cache_dir=None):
+        llamadas.append(os.path.basename(path))
+        return original(path, cache_dir)
+
+    monkeypatch.setattr(mc, '_procesar_archivo', espia)
+    detener = threading.Event()
+    hilo, resultado = _en_hilo(carpeta, base, sondeo, detener)
+    assert _esperar(lambda: 'servicio' in resultado)
+
+    # una copia en dos tandas no debe procesarse a medias
+    datos = open(PDF, 'rb').read()
+    destino = carpeta / 'nuevo.pdf'
+    with open(destino, 'wb') as fh:
+        fh.write(datos[:len(datos) // 2])
+        fh.flush()
+        time.sleep(0.2)
+        fh.write(datos[len(datos) // 2:])
+
+    def guardado():
+        with almacen_sqlite.AlmacenSQLite(str(base)) as almacen:
+            return almacen.contar(archivo='nuevo.pdf') > 0
+
+    try:
+        assert _esperar(guardado)
+    finally:
+        detener.set()
+        hilo.join(10)
+    assert llamadas == ['nuevo.pdf']
+    assert resultado['servicio'].errores == []
+
+    filas, error, _, _ = original(str(destino))
+    assert error is None
+    with almacen_sqlite.AlmacenSQLite(str(base)) as almacen:
+        guardadas = almacen.filas(archivo='nuevo.pdf')
+    assert [(f['SEC'], f['FRACCION']) for f in guardadas] == [(str(f['SEC']), str(f['FRACCION'])) for f in filas]
+
+    # al reiniciar, el manifiesto evita procesar otra vez el archivo sin cambios
+    detener = threading.Event()
+    hilo, resultado = _en_hilo(carpeta, base, sondeo, detener)
+    time.sleep(1.0)
+    detener.set()
+    hilo.join(10)
+    assert llamadas == ['nuevo.pdf']
+
+
+def _hasta_listo(vigilante, limite=5.0):
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        listos = vigilante.esperar(0.05)
+        if listos:
+            return listos
+    return []
+
+
+def test_inotify_overflow_rescans_the_folder(tmp_path):
+    vigilante = servicio.VigilanteCarpeta(str(tmp_path), espera_estable=0.2, intervalo=0.05)
+    if not vigilante.usa_inotify:
+        pytest.skip('inotify no disponible')
+    # el kernel descartó los eventos de la copia y solo avisa del desbordamiento
+    desbordamiento = servicio.EVENTO_INOTIFY.pack(-1, servicio.IN_Q_OVERFLOW, 0, 0)
+    vigilante._fuente._leer = lambda: desbordamiento
+    try:
+        (tmp_path / 'lote.pdf').write_bytes(b'%PDF-1.4')
+        assert _hasta_listo(vigilante) == [str(tmp_path / 'lote.pdf')]
+    finally:
+        vigilante.close()
+
+
+def test_inotify_watch_is_restored_when_the_folder_is_recreated(tmp_path):
+    carpeta = tmp_path / 'entrada'
+    carpeta.mkdir()
+    vigilante = servicio.VigilanteCarpeta(str(carpeta), espera_estable=0.2, intervalo=0.05)
+    if not vigilante.usa_inotify:
+        pytest.skip('inotify no disponible')
+    try:
+        carpeta.rmdir()  # el kernel retira la vigilancia (IN_IGNORED)
+        assert vigilante.esperar(0.2) == []
+        carpeta.mkdir()
+        (carpeta / 'nuevo.pdf').write_bytes(b'%PDF-1.4')
+        assert _hasta_listo(vigilante) == [str(carpeta / 'nuevo.pdf')]
+    finally:
+        vigilante.close()
+
+
+def test_polling_survives_an_unreadable_folder(tmp_path, capsys):
+    carpeta = tmp_path / 'entrada'
+    carpeta.mkdir()
+    vigilante = servicio.VigilanteCarpeta(str(carpeta), espera_estable=0.2, intervalo=0.05, sondeo=True)
+    try:
+        carpeta.rmdir()
+        assert vigilante.esperar(0.2) == []
+        assert vigilante.esperar(0.2) == []
+        assert capsys.readouterr().out.count('se reintenta') == 1
+        carpeta.mkdir()
+        (carpeta / 'nuevo.pdf').write_bytes(b'%PDF-1.4')
+        assert _hasta_listo(vigilante) == [str(carpeta / 'nuevo.pdf')]
+    finally:
+        vigilante.close()
@@ -0,0 +1,69 @@
+import os
+from src import pedimentos_xml
+from src import mapear_campos as mc
+
+BASE = os.path.join(os.path.dirname(__file__), '..')
+XML_DIR = os.path.join(BASE, 'PEDIMENTOS 2025', 'pedimentos_xml')
+COVE = os.path.join(XML_DIR, 'XML COVEs para pedimento 3542-5002734.xml')
+
+
+def test_cove_rows_use_pdf_schema():
+    filas = pedimentos_xml.filas_desde_cove(COVE)
+    assert filas
+    for fila in filas:
+        assert list(fila) == mc.COLUMNAS_SALIDA
+        assert fila['NUM_PEDIMENTO'] == '3542 5002734'
+        assert fila['ID_FISCAL'] == '3012039263'
+        assert fila['NOMBRE_DENOMINACION_O_RAZON_SOCIAL'] == 'SHANDONG ANDE HEALTHCARE APPARATUS, CO., LTD'
+        assert fila['DESCRIPCION'] == 'EQUIPO DE INFUSION DESECHABLES'
+
+
+def test_resolver_prefers_xml_for_matching_pedimento():
+    indice = pedimentos_xml.cargar_indice(XML_DIR)
+    # el PDF no tiene por qué tener tantas partidas como mercancías el COVE
+    filas_pdf = [dict.fromkeys(mc.COLUMNAS_SALIDA, '') for _ in range(len(indice['3542-5002734']) + 1)]
+    for i, fila in enumerate(filas_pdf):
+        fila.update(NUM_PEDIMENTO='25 16 3542 5002734', ID_FISCAL='CMS', SEC=str(i + 1), FRACCION='90183101')
+    resueltas, clave = pedimentos_xml.resolver_filas(filas_pdf, indice)
+    assert clave == '3542-5002734'
+    # un solo emisor en el COVE y un solo proveedor en el PDF; todas sus mercancías dicen lo mismo
+    assert all(f['ID_FISCAL'] == '3012039263' for f in resueltas)
+    assert all(f['DESCRIPCION'] == 'EQUIPO DE INFUSION DESECHABLES' for f in resueltas)
+    # los campos que el COVE no trae se conservan del PDF
+    assert [f['SEC'] for f in resueltas] == [f['SEC'] for f in filas_pdf]
+    # un pedimento sin COVE queda igual
+    otra = [dict(filas_pdf[0], NUM_PEDIMENTO='25 24 1781 5000049')]
+    assert pedimentos_xml.resolver_filas(otra, indice) == (otra, '')
+
+
+def _fila(**campos):
+    return dict(dict.fromkeys(mc.COLUMNAS_SALIDA, ''), NUM_PEDIMENTO='25 16 3542 5000001', **campos)
+
+
+def test_resolver_matches_each_row_to_its_own_supplier():
+    indice = {'3542-5000001': [
+        _fila(ID_FISCAL='GB310726243', NOMBRE_DENOMINACION_O_RAZON_SOCIAL='PENLON LIMITED', DESCRIPCION='VAPORIZADOR'),
+        _fila(ID_FISCAL='91440300597777436C', NOMBRE_DENOMINACION_O_RAZON_SOCIAL='SHENZHEN TPX CO., LTD.',
+              DESCRIPCION='PARTES PARA CARRO MEDICO'),
+    ]}
+    filas_pdf = [
+        _fila(SEC='1', ID_FISCAL='GB 310', NOMBRE_DENOMINACION_O_RAZON_SOCIAL='PENLON'),
+        _fila(SEC='2', ID_FISCAL='', NOMBRE_DENOMINACION_O_RAZON_SOCIAL='Shenzhen TPX Co.,  Ltd.'),
+        _fila(SEC='3', ID_FISCAL='US123', NOMBRE_DENOMINACION_O_RAZON_SOCIAL='OTRO PROVEEDOR', DESCRIPCION='BOMBA'),
+    ]
+    resueltas, _ = pedimentos_xml.resolver_filas(filas_pdf, indice)
+    assert [(f['ID_FISCAL'], f['DESCRIPCION']) for f in resueltas] == [
+        ('GB310726243', 'VAPORIZADOR'), ('91440300597777436C', 'PARTES PARA CARRO MEDICO'), ('US123', 'BOMBA')]
+    # un proveedor que no está en el COVE conserva los datos del PDF
+    assert resueltas[2] == filas_pdf[2]
+
+
+def test_resolver_does_not_align_descriptions_by_position():
+    proveedor = dict(ID_FISCAL='3012039263', NOMBRE_DENOMINACION_O_RAZON_SOCIAL='SHANDONG ANDE')
+    indice = {'3542-5000001': [_fila(DESCRIPCION='GUANTES DE LATEX', **proveedor),
+                               _fila(DESCRIPCION='JERINGAS ESTERILES DESECHABLES 5ML', **proveedor)]}
+    # mismo número de filas que mercancías, pero en otro orden
+    filas_pdf = [_fila(SEC='1', DESCRIPCION='JERINGAS ESTERILES', **proveedor),
+                 _fila(SEC='2', DESCRIPCION='BATAS QUIRURGICAS', **proveedor)]
+    resueltas, _ = pedimentos_xml.resolver_filas(filas_pdf, indice)
+    assert [f['DESCRIPCION'] for f in resueltas] == ['JERINGAS ESTERILES DESECHABLES 5ML', 'BATAS QUIRURGICAS']